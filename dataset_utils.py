@@ -0,0 +1,225 @@
+"""
+Utils for writing example files and their parallel id files
+without holding the whole dataset in memory.
+
+Next step and next ingredient examples can also be stored in a
+prefix-sharing format, where each recipe is stored once and each example
+is an index record pointing at a recipe:
+    <base>_recipes.jl  {"header": ..., "steps": [...]} per recipe
+    <base>_index.jl    [recipe_offset, prefix_length, target] per example
+    <base>_ids.tsv     ids, same as the text format
+    <base>_meta.json   how to turn a record back into text
+An example is header + ' <inst> '.join(steps[:prefix_length]) + target.
+"""
+import os
+import json
+import shutil
+import tempfile
+from collections import OrderedDict
+
+
+class DatasetWriter(object):
+    """Write examples and ids to parallel files, one per line,
+    with no newline after the last line."""
+    def __init__(self, outfile_path, id_path):
+        self.outfile = open(outfile_path, 'w', encoding='utf8')
+        self.idfile = open(id_path, 'w', encoding='utf8')
+        self.count = 0
+
+    def write(self, example, id_text):
+        if self.count:
+            self.outfile.write('\n')
+            self.idfile.write('\n')
+        self.outfile.write(example)
+        self.idfile.write(id_text)
+        self.count += 1
+
+    def close(self):
+        self.outfile.close()
+        self.idfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_examples(pairs, outfile_path, id_path):
+    """Write (example, id) pairs in order. Returns the number written."""
+    with DatasetWriter(outfile_path, id_path) as writer:
+        for example, id_text in pairs:
+            writer.write(example, id_text)
+    return writer.count
+
+
+def _spill_shard(shard, shard_dir, shard_num, rng):
+    """Shuffle a shard in memory and write it to disk."""
+    rng.shuffle(shard)
+    example_path = os.path.join(shard_dir, 'shard' + str(shard_num) + '.txt')
+    id_path = os.path.join(shard_dir, 'shard' + str(shard_num) + '_ids.tsv')
+    with open(example_path, 'w', encoding='utf8') as outfile, \
+         open(id_path, 'w', encoding='utf8') as idfile:
+        for example, id_text in shard:
+            outfile.write(example + '\n')
+            idfile.write(id_text + '\n')
+    return example_path, id_path, len(shard)
+
+
+def external_shuffle(pairs, outfile_path, id_path, rng, shard_size=1000000, tmp_dir=None):
+    """Write (example, id) pairs in a random order using bounded memory.
+
+    Pairs are collected into shards of shard_size, and each shard is
+    shuffled and spilled to disk. The shards are then merged with a
+    k-way random interleave that takes the next line from a shard with
+    probability proportional to the lines it has left, which gives a
+    uniformly random order overall. Returns the number of pairs written."""
+    shard_dir = tempfile.mkdtemp(prefix='shuffle_', dir=tmp_dir)
+    try:
+        shards = []
+        shard = []
+        for pair in pairs:
+            shard.append(pair)
+            if len(shard) >= shard_size:
+                shards.append(_spill_shard(shard, shard_dir, len(shards), rng))
+                shard = []
+        if shard:
+            shards.append(_spill_shard(shard, shard_dir, len(shards), rng))
+        del shard
+
+        files = [(open(example_path, 'r', encoding='utf8'),
+                  open(shard_id_path, 'r', encoding='utf8'))
+                 for example_path, shard_id_path, _ in shards]
+        remaining = [size for _, _, size in shards]
+        total = sum(remaining)
+        with DatasetWriter(outfile_path, id_path) as writer:
+            while total:
+                pick = rng.random() * total
+                for shard_num, size in enumerate(remaining):
+                    if pick < size:
+                        break
+                    pick -= size
+                # guard against float rounding landing on an empty shard
+                while not remaining[shard_num]:
+                    shard_num -= 1
+                example_file, id_file = files[shard_num]
+                writer.write(example_file.readline().rstrip('\n'),
+                             id_file.readline().rstrip('\n'))
+                remaining[shard_num] -= 1
+                total -= 1
+        for example_file, id_file in files:
+            example_file.close()
+            id_file.close()
+        return writer.count
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+def prefix_dataset_paths(base_path):
+    return {'recipes': base_path + '_recipes.jl',
+            'index': base_path + '_index.jl',
+            'ids': base_path + '_ids.tsv',
+            'meta': base_path + '_meta.json'}
+
+
+class PrefixRecipeWriter(object):
+    """Write each recipe once for a prefix-sharing dataset
+    and hand out the offsets that index records point to."""
+    def __init__(self, base_path, normalize=False):
+        self.paths = prefix_dataset_paths(base_path)
+        with open(self.paths['meta'], 'w') as f:
+            json.dump({'normalize': normalize, 'separator': ' <inst> '}, f)
+        self.recipe_file = open(self.paths['recipes'], 'wb')
+
+    def write(self, header, steps):
+        offset = self.recipe_file.tell()
+        line = json.dumps({'header': header, 'steps': steps}, ensure_ascii=False)
+        self.recipe_file.write((line + '\n').encode('utf8'))
+        return offset
+
+    def close(self):
+        self.recipe_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def make_index_record(recipe_offset, prefix_length, target):
+    return json.dumps([recipe_offset, prefix_length, target], ensure_ascii=False)
+
+
+class PrefixDataset(object):
+    """Read a prefix-sharing dataset, materializing text examples lazily.
+    Recently used recipes are kept in a small LRU cache, so reading
+    an unshuffled index only reads each recipe once."""
+    def __init__(self, base_path, cache_size=1024):
+        self.paths = prefix_dataset_paths(base_path)
+        with open(self.paths['meta']) as f:
+            meta = json.load(f)
+        self.normalize = meta['normalize']
+        self.separator = meta['separator']
+        self.cache_size = cache_size
+        self.recipes = OrderedDict()
+        self.recipe_file = open(self.paths['recipes'], 'rb')
+
+    def get_recipe(self, offset):
+        if offset in self.recipes:
+            self.recipes.move_to_end(offset)
+            return self.recipes[offset]
+        self.recipe_file.seek(offset)
+        recipe = json.loads(self.recipe_file.readline().decode('utf8'))
+        self.recipes[offset] = recipe
+        if len(self.recipes) > self.cache_size:
+            self.recipes.popitem(last=False)
+        return recipe
+
+    def materialize(self, record):
+        """Turn a [recipe_offset, prefix_length, target] record into text."""
+        recipe_offset, prefix_length, target = record
+        recipe = self.get_recipe(recipe_offset)
+        example = recipe['header'] + \
+            self.separator.join(recipe['steps'][:prefix_length]) + target
+        if self.normalize:
+            example = ' '.join(example.split())
+        return example
+
+    def __iter__(self):
+        """Yield (example, id) pairs in index order."""
+        with open(self.paths['index'], 'r', encoding='utf8') as index_file, \
+             open(self.paths['ids'], 'r', encoding='utf8') as id_file:
+            for record, id_text in zip(index_file, id_file):
+                yield self.materialize(json.loads(record)), id_text.rstrip('\n')
+
+    def export_text(self, outfile_path, id_path=None):
+        """Write the examples in the legacy text format. The id file is
+        already in that format, so it is only copied if id_path is given."""
+        count = 0
+        with open(outfile_path, 'w', encoding='utf8') as outfile:
+            for example, _ in self:
+                if count:
+                    outfile.write('\n')
+                outfile.write(example)
+                count += 1
+        if id_path and os.path.abspath(id_path) != os.path.abspath(self.paths['ids']):
+            shutil.copyfile(self.paths['ids'], id_path)
+        return count
+
+    def close(self):
+        self.recipe_file.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export a prefix-sharing dataset to the text format')
+    parser.add_argument("base_path", type=str, help="Dataset path without the _index.jl/_recipes.jl suffix")
+    parser.add_argument("--outfile", default=None, type=str, help="Defaults to <base_path>.txt")
+    args = parser.parse_args()
+
+    outfile_path = args.outfile or args.base_path + '.txt'
+    dataset = PrefixDataset(args.base_path)
+    print('Total examples:', dataset.export_text(outfile_path))
+    dataset.close()
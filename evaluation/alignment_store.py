@@ -0,0 +1,199 @@
+"""
+Columnar store for the HMM alignment pickles.
+
+Each HMM2_all_words_no_influence_3_iterations_<set>/text-text-alignments
+folder has one pickle per dish. Loading them all on every run is slow, so
+they're converted once into numpy arrays next to the folder
+(text-text-alignments.store/) and memory-mapped after that:
+    files.npy, dish_names.npy, recipe_ids.npy   file names and lookup tables
+    dish.npy, recipe_id1.npy, recipe_id2.npy    codes, one per aligned step
+    step_idx1.npy, step_idx2.npy, probability.npy
+    step1.*.npy, step2.*.npy                    utf-8 text with offsets
+    alignments.npy                              one row per recipe pair:
+                                                file, recipe_id1, recipe_id2, first step, end step
+    recipe_id1_index.*.npy, recipe_id2_index.*.npy   steps for each recipe id
+The store is rebuilt when the pickles change.
+
+To build a store ahead of time:
+    python alignment_store.py /sample_data/HMM2_all_words_no_influence_3_iterations_train/text-text-alignments
+"""
+import os
+import sys
+import json
+import pickle
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = ['dish_name', 'recipe_id1', 'recipe_id2', 'step_idx1', 'step_idx2', 'step1', 'step2', 'probability']
+
+
+def store_path(aligned_data_path):
+    return aligned_data_path.rstrip('/') + '.store'
+
+
+def source_signature(aligned_data_path):
+    files = sorted(os.listdir(aligned_data_path))
+    stats = [os.stat(os.path.join(aligned_data_path, f)) for f in files]
+    return {'files': files,
+            'size': sum(stat.st_size for stat in stats),
+            'mtime': max([stat.st_mtime for stat in stats], default=0)}
+
+
+def save_strings(path, name, strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    np.save(os.path.join(path, name + '.offsets.npy'), offsets)
+    np.save(os.path.join(path, name + '.data.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+
+def save_index(path, name, codes, num_codes):
+    """Row numbers grouped by code, in row order within each code."""
+    order = np.argsort(codes, kind='stable')
+    offsets = np.zeros(num_codes + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(codes, minlength=num_codes))
+    np.save(os.path.join(path, name + '_index.order.npy'), order)
+    np.save(os.path.join(path, name + '_index.offsets.npy'), offsets)
+
+
+def build_alignment_store(aligned_data_path):
+    """Convert every alignment pickle in a folder into the columnar store."""
+    path = store_path(aligned_data_path)
+    os.makedirs(path, exist_ok=True)
+    signature = source_signature(aligned_data_path)
+    recipe_codes = {}
+    columns = {name: [] for name in ['dish', 'recipe_id1', 'recipe_id2', 'step_idx1', 'step_idx2',
+                                     'step1', 'step2', 'probability']}
+    alignments = []
+    for file_code, f in enumerate(signature['files']):
+        data = pickle.load(open(os.path.join(aligned_data_path, f), 'rb'))
+        for recipe in data:
+            code1 = recipe_codes.setdefault(recipe['recipe_url'], len(recipe_codes))
+            code2 = recipe_codes.setdefault(recipe['video_id'], len(recipe_codes))
+            first_step = len(columns['dish'])
+            for i in range(len(recipe['annotation_indices'])):
+                columns['dish'].append(file_code)
+                columns['recipe_id1'].append(code1)
+                columns['recipe_id2'].append(code2)
+                columns['step_idx1'].append(recipe['annotation_indices'][i])
+                columns['step_idx2'].append(recipe['transcript_indices'][i])
+                columns['step1'].append(recipe['annotation_segments'][i])
+                columns['step2'].append(recipe['transcript_segments'][i])
+                columns['probability'].append(recipe['alignment_sent_probabilities'][i])
+            alignments.append([file_code, code1, code2, first_step, len(columns['dish'])])
+
+    recipe_ids = sorted(recipe_codes, key=recipe_codes.get)
+    np.save(os.path.join(path, 'files.npy'), np.array(signature['files'], dtype=str))
+    np.save(os.path.join(path, 'dish_names.npy'),
+            np.array([f.replace('.pkl', '') for f in signature['files']], dtype=str))
+    np.save(os.path.join(path, 'recipe_ids.npy'), np.array(recipe_ids, dtype=str))
+    for name in ['dish', 'recipe_id1', 'recipe_id2']:
+        np.save(os.path.join(path, name + '.npy'), np.array(columns[name], dtype=np.int32))
+    for name in ['step_idx1', 'step_idx2']:
+        np.save(os.path.join(path, name + '.npy'), np.array(columns[name], dtype=np.int64))
+    np.save(os.path.join(path, 'probability.npy'), np.array(columns['probability'], dtype=np.float64))
+    for name in ['step1', 'step2']:
+        save_strings(path, name, columns[name])
+    np.save(os.path.join(path, 'alignments.npy'), np.array(alignments, dtype=np.int64).reshape(-1, 5))
+    for name in ['recipe_id1', 'recipe_id2']:
+        save_index(path, name, np.array(columns[name], dtype=np.int64), len(recipe_ids))
+
+    # written last, so a store without it is incomplete
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(signature, f)
+    return path
+
+
+class AlignmentStore(object):
+    """Memory-mapped alignment data, one row per aligned step."""
+    def __init__(self, path):
+        def load(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+        self.files = np.load(os.path.join(path, 'files.npy'))
+        self.dish_names = np.load(os.path.join(path, 'dish_names.npy'))
+        self.recipe_ids = np.load(os.path.join(path, 'recipe_ids.npy'))
+        self.recipe_codes = {recipe_id: code for code, recipe_id in enumerate(self.recipe_ids)}
+        self.columns = {name: load(name) for name in ['dish', 'recipe_id1', 'recipe_id2',
+                                                      'step_idx1', 'step_idx2', 'probability']}
+        self.strings = {name: (load(name + '.data'), load(name + '.offsets')) for name in ['step1', 'step2']}
+        self.alignments = load('alignments')
+        self.indexes = {name: (load(name + '_index.order'), load(name + '_index.offsets'))
+                        for name in ['recipe_id1', 'recipe_id2']}
+
+    def __len__(self):
+        return len(self.columns['dish'])
+
+    def codes(self, recipe_ids):
+        return sorted(set(self.recipe_codes[i] for i in recipe_ids if i in self.recipe_codes))
+
+    def rows_for(self, column, recipe_ids):
+        """Rows where column ('recipe_id1' or 'recipe_id2') is one of recipe_ids, from the index."""
+        order, offsets = self.indexes[column]
+        rows = [order[offsets[code]:offsets[code + 1]] for code in self.codes(recipe_ids)]
+        return np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+
+    def select(self, recipe_ids=None, files=None):
+        """Row numbers, in the order of the pickles, of steps where either
+        recipe is in recipe_ids and the dish's file is in files."""
+        if recipe_ids is None:
+            rows = np.arange(len(self))
+        else:
+            rows = np.union1d(self.rows_for('recipe_id1', recipe_ids),
+                              self.rows_for('recipe_id2', recipe_ids))
+        if files is not None:
+            file_codes = np.flatnonzero(np.isin(self.files, list(files)))
+            rows = rows[np.isin(self.columns['dish'][rows], file_codes)]
+        return rows
+
+    def text(self, name, rows):
+        data, offsets = self.strings[name]
+        return [bytes(data[offsets[row]:offsets[row + 1]]).decode('utf-8') for row in rows]
+
+    def pairs(self, rows=None):
+        """DataFrame of aligned steps, with the columns make_style_transfer_data.py uses."""
+        if rows is None:
+            rows = np.arange(len(self))
+        # lists of python strings, so pandas gives the same dtypes as for the pickles
+        return pd.DataFrame({
+            'dish_name': self.dish_names[self.columns['dish'][rows]].tolist(),
+            'recipe_id1': self.recipe_ids[self.columns['recipe_id1'][rows]].tolist(),
+            'recipe_id2': self.recipe_ids[self.columns['recipe_id2'][rows]].tolist(),
+            'step_idx1': np.asarray(self.columns['step_idx1'][rows]),
+            'step_idx2': np.asarray(self.columns['step_idx2'][rows]),
+            'step1': self.text('step1', rows),
+            'step2': self.text('step2', rows),
+            'probability': np.asarray(self.columns['probability'][rows])},
+            columns=COLUMNS)
+
+    def recipe_pairs(self, recipe_ids1=None):
+        """DataFrame of dish, recipe_id1 and recipe_id2 for each aligned recipe
+        pair, including pairs without aligned steps."""
+        alignments = np.asarray(self.alignments)
+        if recipe_ids1 is not None:
+            alignments = alignments[np.isin(alignments[:, 1], self.codes(recipe_ids1))]
+        return pd.DataFrame({'dish': self.dish_names[alignments[:, 0]].tolist(),
+                             'recipe_id1': self.recipe_ids[alignments[:, 1]].tolist(),
+                             'recipe_id2': self.recipe_ids[alignments[:, 2]].tolist()},
+                            columns=['dish', 'recipe_id1', 'recipe_id2'])
+
+
+def load_alignment_store(aligned_data_path):
+    """Open the store for an alignment folder, building it first
+    if it's missing or the pickles have changed."""
+    path = store_path(aligned_data_path)
+    meta_path = os.path.join(path, 'meta.json')
+    signature = source_signature(aligned_data_path)
+    meta = None
+    if os.path.isfile(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if meta != signature:
+        print('Building alignment store for', aligned_data_path)
+        build_alignment_store(aligned_data_path)
+    return AlignmentStore(path)
+
+
+if __name__ == '__main__':
+    for aligned_data_path in sys.argv[1:]:
+        print('Wrote', build_alignment_store(aligned_data_path))
@@ -0,0 +1,192 @@
+"""
+Incremental decoding sessions for step-by-step generation.
+
+The iterative generation classes build each new prompt from the last one
+plus another step, so most of a prompt has already been run through the
+model on the previous round. A DecodingSession keeps the past key/values
+for each recipe between calls. On the next call, the longest common token
+prefix is reused and only the new tokens are run through the model.
+
+Sessions are keyed by whatever the caller passes as session_keys to
+run_generation_batch (usually the recipe id). Call release_sessions
+when a recipe is finished to free its cached key/values.
+"""
+import weakref
+from collections import OrderedDict
+
+import torch
+import torch.nn.functional as F
+from transformers.modeling_utils import top_k_top_p_filtering
+
+
+# recipes kept per model when the caller doesn't say how many are in flight
+MAX_SESSIONS = 16
+
+class DecodingSession(object):
+    """Past key/values for prompts that will be extended on later calls,
+    for one GPT-2 model. Keeps at most max_sessions recipes, dropping
+    the least recently used."""
+    def __init__(self, model, max_sessions=MAX_SESSIONS):
+        self.model = model
+        self.max_sessions = max_sessions
+        # key -> (token ids, past with batch size 1)
+        self.states = OrderedDict()
+
+    def release(self, key):
+        self.states.pop(key, None)
+
+    def cached_prefix(self, key, encoded_prompt):
+        """Return the cached past for the longest prefix of the prompt
+        seen before under this key, and the length of that prefix.
+        At least one token is always left to run through the model."""
+        if key not in self.states:
+            return None, 0
+        cached_ids, past = self.states[key]
+        limit = min(len(cached_ids), len(encoded_prompt) - 1)
+        prefix_length = 0
+        while prefix_length < limit and cached_ids[prefix_length] == encoded_prompt[prefix_length]:
+            prefix_length += 1
+        if prefix_length == 0:
+            return None, 0
+        return tuple(layer[:, :, :, :prefix_length] for layer in past), prefix_length
+
+    def store(self, key, token_ids, past, batch_index, columns):
+        """Keep one row of a batched past, without padding columns."""
+        columns = columns[:len(token_ids)]
+        self.states[key] = (token_ids,
+                            tuple(layer[:, batch_index:batch_index + 1].index_select(3, columns)
+                                  for layer in past))
+        self.states.move_to_end(key)
+        while len(self.states) > self.max_sessions:
+            self.states.popitem(last=False)
+
+    def prefill(self, keys, encoded_prompts, pad_token_id):
+        """Run the uncached part of each prompt through the model.
+
+        Cached pasts are left-padded to the longest one, and the new tokens
+        are left-padded after them, so padding can be in the middle of a row.
+        The attention mask covers it and position ids skip over it."""
+        device = next(self.model.parameters()).device
+        n_positions = self.model.config.n_ctx
+        cached = [self.cached_prefix(key, ids) for key, ids in zip(keys, encoded_prompts)]
+        past_length = max(prefix_length for _, prefix_length in cached)
+        new_length = max(len(ids) - prefix_length for ids, (_, prefix_length) in zip(encoded_prompts, cached))
+        if past_length + new_length >= n_positions:
+            # too much padding to fit, so run the full prompts instead
+            cached = [(None, 0) for _ in keys]
+            past_length = 0
+            new_length = max(len(ids) for ids in encoded_prompts)
+
+        batch_size = len(keys)
+        input_ids = torch.full((batch_size, new_length), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((batch_size, past_length + new_length), dtype=torch.long)
+        past = None
+        if past_length:
+            template = next(layer_past for layer_past, _ in cached if layer_past is not None)
+            shape = list(template[0].shape)
+            shape[1] = batch_size
+            shape[3] = past_length
+            past = [layer.new_zeros(shape) for layer in template]
+        for i, (ids, (layer_past, prefix_length)) in enumerate(zip(encoded_prompts, cached)):
+            new_ids = ids[prefix_length:]
+            input_ids[i, new_length - len(new_ids):] = torch.tensor(new_ids)
+            attention_mask[i, past_length + new_length - len(new_ids):] = 1
+            if prefix_length:
+                attention_mask[i, past_length - prefix_length:past_length] = 1
+                for layer, cached_layer in zip(past, layer_past):
+                    layer[:, i, :, past_length - prefix_length:past_length] = cached_layer[:, 0]
+
+        attention_mask = attention_mask.to(device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, past_length:]
+        outputs = self.model(input_ids=input_ids.to(device), past=past,
+                             attention_mask=attention_mask, position_ids=position_ids)
+        return outputs[0][:, -1, :], outputs[1], attention_mask
+
+    def generate(self, keys, encoded_prompts, max_new_tokens, temperature=1.0, top_k=0, top_p=1.0,
+                 repetition_penalty=1.0, num_return_sequences=1, pad_token_id=None, eos_token_id=None):
+        """Sample continuations the same way model.generate does with do_sample=True.
+
+        Returns a tensor laid out like model.generate output: prompts
+        left-padded to the same length followed by the generated tokens,
+        with num_return_sequences rows per prompt. The prompt and the
+        tokens sampled for the first return sequence are kept for the
+        next call with the same key."""
+        with torch.no_grad():
+            next_logits, past, attention_mask = self.prefill(keys, encoded_prompts, pad_token_id)
+            n_positions = self.model.config.n_ctx
+            max_new_tokens = max(min(max_new_tokens, n_positions - attention_mask.shape[1]), 0)
+
+            if num_return_sequences > 1:
+                next_logits = next_logits.repeat_interleave(num_return_sequences, dim=0)
+                attention_mask = attention_mask.repeat_interleave(num_return_sequences, dim=0)
+                past = [layer.repeat_interleave(num_return_sequences, dim=1) for layer in past]
+            previous_tokens = [list(ids) for ids in encoded_prompts for _ in range(num_return_sequences)]
+            next_position = attention_mask.sum(-1)
+
+            device = next_logits.device
+            unfinished = torch.ones(len(previous_tokens), dtype=torch.long, device=device)
+            generated = []
+            num_fed = 0
+            for step in range(max_new_tokens):
+                scores = next_logits
+                if repetition_penalty != 1.0:
+                    for i, tokens in enumerate(previous_tokens):
+                        for previous_token in set(tokens):
+                            if scores[i, previous_token] < 0:
+                                scores[i, previous_token] *= repetition_penalty
+                            else:
+                                scores[i, previous_token] /= repetition_penalty
+                if temperature != 1.0:
+                    scores = scores / temperature
+                scores = top_k_top_p_filtering(scores, top_k=top_k, top_p=top_p)
+                next_token = torch.multinomial(F.softmax(scores, dim=-1), num_samples=1).squeeze(1)
+                next_token = next_token * unfinished + pad_token_id * (1 - unfinished)
+                generated.append(next_token)
+                for i, token in enumerate(next_token.tolist()):
+                    previous_tokens[i].append(token)
+                unfinished = unfinished.mul((next_token != eos_token_id).long())
+                if unfinished.max() == 0 or step == max_new_tokens - 1:
+                    break
+
+                attention_mask = torch.cat([attention_mask, attention_mask.new_ones((attention_mask.shape[0], 1))], dim=-1)
+                outputs = self.model(input_ids=next_token.unsqueeze(1), past=past,
+                                     attention_mask=attention_mask,
+                                     position_ids=next_position.unsqueeze(1))
+                next_position = next_position + 1
+                next_logits, past = outputs[0][:, -1, :], outputs[1]
+                num_fed += 1
+
+        # keep the prompt and the fed tokens of the first sample, up to its eos
+        for i, (key, ids) in enumerate(zip(keys, encoded_prompts)):
+            row = i * num_return_sequences
+            fed_tokens = [int(token[row]) for token in generated[:num_fed]]
+            if eos_token_id in fed_tokens:
+                fed_tokens = fed_tokens[:fed_tokens.index(eos_token_id) + 1]
+            columns = attention_mask[row].nonzero().squeeze(1)
+            self.store(key, list(ids) + fed_tokens, past, row, columns)
+
+        batch_length = max(len(ids) for ids in encoded_prompts)
+        output_sequences = torch.full((len(previous_tokens), batch_length), pad_token_id, dtype=torch.long)
+        for i, ids in enumerate(encoded_prompts):
+            for j in range(num_return_sequences):
+                output_sequences[i * num_return_sequences + j, batch_length - len(ids):] = torch.tensor(ids)
+        if generated:
+            output_sequences = torch.cat([output_sequences, torch.stack(generated, dim=1).cpu()], dim=1)
+        return output_sequences
+
+
+_SESSIONS = weakref.WeakKeyDictionary()
+
+
+def get_session(model, max_sessions=MAX_SESSIONS):
+    """One session per loaded model, see model_registry.py."""
+    if model not in _SESSIONS:
+        _SESSIONS[model] = DecodingSession(model, max_sessions=max_sessions)
+    return _SESSIONS[model]
+
+
+def release_sessions(keys):
+    """Free cached key/values for finished recipes, for every model."""
+    for session in list(_SESSIONS.values()):
+        for key in keys:
+            session.release(key)
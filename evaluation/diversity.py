@@ -0,0 +1,83 @@
+"""
+N-gram diversity of generated text, in process.
+
+Gives the same numbers as calculate_diversity.sh, which counts the n-grams
+from all_ngrams.pl with sort | uniq -c | wc -l. Each line is split on
+whitespace and padded with <s> and </s> the way all_ngrams.pl pads it,
+blank lines are skipped, and ratios are truncated to 4 decimals like bc.
+
+To run on a file:
+    python diversity.py tmp_diversity.txt
+"""
+import re
+import argparse
+
+
+WHITESPACE = re.compile(r'[ \t\n\r\f\v]+')
+BLANK_LINE = re.compile(r'^[ \t\n\r\f\v]*$')
+LABELS = {1: 'Unigram', 2: 'Bigram', 3: 'Trigram'}
+
+
+def split_lines(texts):
+    """Lines as all_ngrams.pl reads them, from texts that would be
+    written to a file one per line."""
+    for text in texts:
+        for line in text.split('\n'):
+            if not BLANK_LINE.match(line):
+                yield [w for w in WHITESPACE.split(line) if w]
+
+
+def padded_ngrams(words, n):
+    """All n-grams of a line, starting n - 1 words before it with <s>
+    and running off the end with </s>, like all_ngrams.pl <n>."""
+    padded = ['<s>'] * (n - 1) + words + ['</s>'] * (n - 1)
+    return [tuple(padded[i:i + n]) for i in range(len(words) + n - 1)]
+
+
+def count_ngrams(texts, ns=(1, 2, 3)):
+    """Return {n: (number of unique n-grams, number of n-grams)} in one pass."""
+    seen = {n: set() for n in ns}
+    totals = {n: 0 for n in ns}
+    for words in split_lines(texts):
+        for n in ns:
+            ngrams = padded_ngrams(words, n)
+            seen[n].update(hash(ngram) for ngram in ngrams)
+            totals[n] += len(ngrams)
+    return {n: (len(seen[n]), totals[n]) for n in ns}
+
+
+def truncated_ratio(unique, total, scale=4):
+    """unique / total truncated to scale decimals like bc, as a string.
+    None if there are no n-grams (bc gives a divide by zero error)."""
+    if total == 0:
+        return None
+    whole, frac = divmod(unique * 10 ** scale // total, 10 ** scale)
+    return '{}.{:0{}d}'.format(whole, frac, scale)
+
+
+def diversity(texts, ns=(1, 2, 3)):
+    """Return {n: proportion of unique n-grams}, truncated to 4 decimals."""
+    ratios = {}
+    for n, (unique, total) in count_ngrams(texts, ns).items():
+        ratio = truncated_ratio(unique, total)
+        ratios[n] = float(ratio) if ratio is not None else None
+    return ratios
+
+
+def print_diversity(texts):
+    """Print the same report as calculate_diversity.sh."""
+    counts = count_ngrams(texts, ns=(3, 2, 1))
+    for n in (3, 2, 1):
+        print(LABELS[n] + ' diversity')
+        ratio = truncated_ratio(*counts[n])
+        if ratio is not None:
+            print(ratio)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', type=str)
+    args = parser.parse_args()
+
+    with open(args.path, encoding='utf-8', errors='surrogateescape', newline='') as f:
+        print_diversity([f.read()])
@@ -6,15 +6,25 @@ To run, first download food.csv from https://www.foodb.ca/downloads.
 """
 import os
 import re
-import csv
+import pickle
+import hashlib
+from functools import lru_cache
+from collections import OrderedDict
 import pandas as pd
 
-from apply_tag import apply_tag
+from apply_tag import apply_tags
+from tag_matcher import TermMatcher
+from results_io import (list_results_files, read_results_file, with_context,
+                        id_column, context_column, gen_column)
 
 
-def get_ing_list():
+FOODB_PATH = '/sample_data/food.csv'  # from FooDB
+_ING_ARTIFACTS = {}
+
+
+def read_ing_list(path=FOODB_PATH):
     """Get ingredient list from FooDB."""
-    ing_list = pd.read_csv('/sample_data/food.csv')  # from FooDB
+    ing_list = pd.read_csv(path)
     ing_list['name'] = ing_list['name'].str.replace(r'\(.*\)', '')
     ing_list = ing_list['name'].tolist()
     ing_list = [i.split(',')[0].strip().lower() for i in ing_list]
@@ -23,125 +33,175 @@ def get_ing_list():
         ing_list.remove(word)
     return ing_list
 
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_ing_artifact(path=FOODB_PATH):
+    """Load the cleaned ingredient names and the IngredientIndex built from them.
+
+    They're kept in <path>.ings.pkl and rebuilt when the CSV changes
+    (checked by mtime, then by hash), and loaded once per process."""
+    if path in _ING_ARTIFACTS:
+        return _ING_ARTIFACTS[path]
+    artifact_path = path + '.ings.pkl'
+    stat = os.stat(path)
+    artifact = None
+    if os.path.isfile(artifact_path):
+        with open(artifact_path, 'rb') as f:
+            artifact = pickle.load(f)
+        if (artifact['size'], artifact['mtime']) != (stat.st_size, stat.st_mtime):
+            if artifact['sha1'] != file_sha1(path):
+                artifact = None
+            else:
+                artifact['size'], artifact['mtime'] = stat.st_size, stat.st_mtime
+                save_ing_artifact(artifact, artifact_path)
+    if artifact is None:
+        ing_list = read_ing_list(path)
+        index = IngredientIndex(ing_list)
+        artifact = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': file_sha1(path),
+                    'ing_list': ing_list, 'containers': index.containers}
+        save_ing_artifact(artifact, artifact_path)
+    else:
+        index = IngredientIndex(artifact['ing_list'], containers=artifact['containers'])
+    _ING_ARTIFACTS[path] = (artifact['ing_list'], index)
+    return _ING_ARTIFACTS[path]
+
+def save_ing_artifact(artifact, artifact_path):
+    try:
+        with open(artifact_path, 'wb') as f:
+            pickle.dump(artifact, f)
+    except OSError as e:
+        print('Could not save ingredient list cache:', e)
+
+def get_ing_list(path=FOODB_PATH):
+    return load_ing_artifact(path)[0]
+
+def get_ing_index(path=FOODB_PATH):
+    """Same names as get_ing_list, ready to pass to get_ings as ing_list."""
+    return load_ing_artifact(path)[1]
+
+class IngredientIndex(object):
+    """Find FooDB ingredient names in text, compiled once for the whole list.
+
+    A name matches where re.search(r'\b' + name) would. Names that are
+    part of another name found in the same text (e.g. "olive" in "olive oil")
+    are dropped, same as before."""
+    def __init__(self, ing_list, containers=None):
+        self.names = frozenset(ing_list)
+        self.matcher = TermMatcher(self.names, word_start=True)
+        if containers is not None:
+            self.containers = containers
+            return
+        # every other name each name is a substring of
+        substrings = TermMatcher(self.names)
+        self.containers = {name: set() for name in self.names}
+        for name in self.names:
+            for other in substrings.find(name):
+                if other != name:
+                    self.containers[other].add(name)
+        if '' in self.names:
+            self.containers[''] = self.names - {''}
+
+    def positions(self, curr):
+        """Map each name in the text to the position of its first match."""
+        curr = curr.lower()
+        ings = self.matcher.positions(curr)
+        if '' in self.names:
+            match = re.search(r'\b', curr)
+            if match:
+                ings[''] = match.start()
+        return ings
+
+    def get_ings(self, curr):
+        ings = self.positions(curr)
+        clean_ings = {k: v for k, v in ings.items() if not self.containers[k] & ings.keys()}
+        return [k for k, v in sorted(clean_ings.items(), key=lambda x: x[1])]
+
+    def count(self, curr):
+        return len(self.get_ings(curr))
+
+
+@lru_cache(maxsize=4)
+def _ingredient_index(ing_list):
+    return IngredientIndex(ing_list)
+
+def ingredient_index(ing_list):
+    if isinstance(ing_list, IngredientIndex):
+        return ing_list
+    return _ingredient_index(frozenset(ing_list))
+
 def get_ings(curr, ing_list):
-    ings = {}
-    for ing in ing_list:
-        match_text = re.compile(r'\b{}'.format(re.escape(ing)))
-        match = match_text.search(curr.lower())
-        if match:
-            ings[ing] = match.start()
-    clean_ings = {}
-    for k, v in ings.items():
-        ing_names = list(ings)
-        ing_names.remove(k)
-        if not any(k in other_ings for other_ings in ing_names):
-            clean_ings[k] = v
-
-    ordered_ings = [k for k, v in sorted(clean_ings.items(), key=lambda x: x[1])]
-    return ordered_ings
+    return ingredient_index(ing_list).get_ings(curr)
 
 def get_total_ings(curr, ing_list):
-    ings = []
-    for ing in ing_list:
-        if re.search(r'\b{}'.format(re.escape(ing)), curr.lower()):
-            ings.append(ing)
-    clean_ings = []
-    for n in range(len(ings)):
-        if not any(ings[n] in x for x in ings[:n]+ings[n+1:]):
-            clean_ings.append(ings[n])
-    return len(clean_ings)
+    return ingredient_index(ing_list).count(curr)
+
+def compliance(df, results_file, ing_list):
+    """Share of the ingredients in generated steps that fit the target tag,
+    averaged over recipes. Returns {'recipe': overall, tag: per tag}."""
+    df = with_context(df, results_file)
+    id_col = id_column(df)
+    context_col = context_column(df, results_file)
+    gen_col = gen_column(df, results_file)
+    df = df[[id_col, context_col, gen_col]].copy()
+
+    # remove ids ending with letter1 (ing models have 0 and 1 versions)
+    df = df[df[id_col].apply(lambda x: not bool(re.search(r'[A-Za-z]1$', x)))]
+    df[id_col] = df[id_col].apply(lambda x: x[:-1] if bool(re.search(r'[A-Za-z]0$', x)) else x)
+
+    # look in prompt column for target tag and source/target steps
+    if any(x in results_file for x in ['next_step', 'ctrl', 'style-transfer-ing-multi-md']):
+        df['target_tag'] = df[id_col].apply(
+            lambda x: '-'.join(x.split('-')[2:]))
+        if 'forward' in results_file:
+            df['correct_val'] = 1
+        elif 'backward' in results_file:
+            df['correct_val'] = 0
+    else:
+        df['target_tag'] = df[context_col].apply(
+            lambda x: re.search(r'.*<target:(.*?)>', x).group(1))
+        df['correct_val'] = df['target_tag'].apply(lambda x: int('non-' not in x))
+    df['target_tag'] = df['target_tag'].apply(
+        lambda x: x.replace('non-', '').capitalize())
+
+    df['violating_ingredients'] = [apply_tags(text, [tag])[tag][1]
+                                   for text, tag in zip(df[gen_col], df['target_tag'])]
+
+    df['total_ingredients'] = df[gen_col].apply(get_total_ings, ing_list=ing_list)
+
+    df['total_ingredients'] = df.apply(
+        lambda x: x['violating_ingredients'] if x['violating_ingredients'] > x['total_ingredients'] else x['total_ingredients'], axis=1)
+    df = df[df['total_ingredients'] > 0]
+
+    df['violating_ingredients'] = df.apply(
+        lambda x: x['total_ingredients'] if x['violating_ingredients'] > x['total_ingredients'] else x['violating_ingredients'], axis=1)
+
+    df['percent'] = (df['total_ingredients'] - df['violating_ingredients'])/df['total_ingredients']
+
+    metrics = OrderedDict()
+    recipe_df = df.groupby(id_col)[['violating_ingredients', 'total_ingredients']].sum()
+    recipe_df['percent'] = (recipe_df['total_ingredients'] - recipe_df['violating_ingredients'])/recipe_df['total_ingredients']
+    metrics['recipe'] = recipe_df['percent'].mean()
+
+    for tag in df['target_tag'].unique():
+        tag_df = df[df['target_tag'] == tag]
+        recipe_df = tag_df.groupby(id_col)[['violating_ingredients', 'total_ingredients']].sum()
+        recipe_df['percent'] = (recipe_df['total_ingredients'] - recipe_df['violating_ingredients'])/recipe_df['total_ingredients']
+        metrics[tag] = recipe_df['percent'].mean()
+    return metrics
 
 if __name__ == '__main__':
     results_path = '/results/tune1k/'
-    results_files = sorted(os.listdir(results_path))
+    results_files = list_results_files(results_path)
+    ing_list = get_ing_index()
 
     for results_file in results_files:
         print(results_file)
-        ids = []
-        context = []
-        generated = []
-        with open(results_path + results_file) as f:
-            if results_file.endswith('.csv'):
-                reader = csv.DictReader(f, quotechar='\t')
-            else:
-                reader = csv.DictReader(f, delimiter='\t', quotechar='\t')
-            for row in reader:
-                if 'recipe_id' in row:
-                    id_column = 'recipe_id'
-                else:
-                    id_column = 'source_recipe_id'
-
-                if 'human_rewrite' in results_file:
-                    context_column = 'context'
-                    row['context'] = '<target:vegetarian>'
-                else:
-                    if 'step_context' in row:
-                        context_column = 'step_context'
-                    else:
-                        context_column = 'context'
-
-                if 'human_rewrite' in results_file:
-                    gen_column = 'rewritten_step'
-                else:
-                    if 'generated0' in row:
-                        gen_column = 'generated0'
-                    else:
-                        gen_column = 'generated'
-
-                ids.append(row[id_column])
-                context.append(row[context_column])
-                generated.append(row[gen_column])
-        df = pd.DataFrame({id_column: ids,
-                           context_column: context,
-                           gen_column: generated})
-
-        # remove ids ending with letter1 (ing models have 0 and 1 versions)
-        df = df[df[id_column].apply(lambda x: not bool(re.search(r'[A-Za-z]1$', x)))]
-        df[id_column] = df[id_column].apply(lambda x: x[:-1] if bool(re.search(r'[A-Za-z]0$', x)) else x)
-
-        # look in prompt column for target tag and source/target steps
-        if any(x in results_file for x in ['next_step', 'ctrl', 'style-transfer-ing-multi-md']):
-            df['target_tag'] = df[id_column].apply(
-                lambda x: '-'.join(x.split('-')[2:]))
-            if 'forward' in results_file:
-                df['correct_val'] = 1
-            elif 'backward' in results_file:
-                df['correct_val'] = 0
-        else:
-            df['target_tag'] = df[context_column].apply(
-                lambda x: re.search(r'.*<target:(.*?)>', x).group(1))
-            df['correct_val'] = df['target_tag'].apply(lambda x: int('non-' not in x))
-        df['target_tag'] = df['target_tag'].apply(
-            lambda x: x.replace('non-', '').capitalize())
-
-        counts = []
-        for idx, row in df.iterrows():
-            row[row['target_tag'] + '1'] = 0
-            row['ingredients1'] = [row[gen_column]]
-            count = apply_tag(row, num='1', tag=row['target_tag'], return_count=True)
-            counts.append(count)
-        df['violating_ingredients'] = counts
-
-        ing_list = get_ing_list()
-        df['total_ingredients'] = df[gen_column].apply(get_total_ings, ing_list=ing_list)
-
-        df['total_ingredients'] = df.apply(
-            lambda x: x['violating_ingredients'] if x['violating_ingredients'] > x['total_ingredients'] else x['total_ingredients'], axis=1)
-        df = df[df['total_ingredients'] > 0]
-
-        df['violating_ingredients'] = df.apply(
-            lambda x: x['total_ingredients'] if x['violating_ingredients'] > x['total_ingredients'] else x['violating_ingredients'], axis=1)
-
-        df['percent'] = (df['total_ingredients'] - df['violating_ingredients'])/df['total_ingredients']
-
-        recipe_df = df.groupby(id_column)[['violating_ingredients', 'total_ingredients']].sum()
-        recipe_df['percent'] = (recipe_df['total_ingredients'] - recipe_df['violating_ingredients'])/recipe_df['total_ingredients']
-        print('recipe', recipe_df['percent'].mean())
-
-        for tag in df['target_tag'].unique():
-            tag_df = df[df['target_tag'] == tag]
-            recipe_df = tag_df.groupby(id_column)[['violating_ingredients', 'total_ingredients']].sum()
-            recipe_df['percent'] = (recipe_df['total_ingredients'] - recipe_df['violating_ingredients'])/recipe_df['total_ingredients']
-            print(tag, recipe_df['percent'].mean())
-
+        df = read_results_file(results_path + results_file)
+        for name, value in compliance(df, results_file, ing_list).items():
+            print(name, value)
         print()
@@ -2,119 +2,210 @@
 Script to get perplexity of generated recipe steps.
 """
 import time
-import os
+import argparse
 import re
-import csv
-import json
 import math
-import pandas as pd
+from collections import OrderedDict
 import torch
-from transformers import GPT2Config, GPT2Tokenizer, GPT2LMHeadModel
-
-
-start = time.time()
-
-results_path = '/results/test1k/'
-results_files = sorted(os.listdir(results_path))
-
-for results_file in results_files:
-    print(results_file)
+import torch.nn.functional as F
+from transformers import GPT2Tokenizer, GPT2LMHeadModel
+
+from model_registry import get_model
+from loss_cache import LossCache, checkpoint_scope
+from results_io import list_results_files, read_results_file, id_column, gen_column
+
+
+MODEL_PATH = '/models/next-step-v2-md-128-16/checkpoint-1016470'
+
+
+def load_model(model_path=MODEL_PATH, device='cuda'):
+    """Loaded once per process, see model_registry.py."""
+    return get_model(GPT2LMHeadModel, GPT2Tokenizer, model_path, device=device)
+
+
+def window_and_stride(model, window=None, stride=None):
+    """Longest span run through the model at once (the model's context size
+    by default), and how far the window moves along longer texts
+    (half a window by default)."""
+    window = min(window or model.config.n_ctx, model.config.n_ctx)
+    if window < 2:
+        # a window has to hold a scored token and the one before it
+        raise ValueError('window must be at least 2 tokens, got {}'.format(window))
+    stride = min(stride or window // 2, window - 1)
+    if stride < 1:
+        raise ValueError('stride must be at least 1 token, got {}'.format(stride))
+    return window, stride
+
+
+def text_windows(ids, window, stride):
+    """Split token ids into (window ids, index of the first token to score).
+
+    Texts that fit are one window. Longer texts get a window every stride
+    tokens; each one scores only the tokens after the previous window, with
+    the rest of the window as context. Every token after the first is
+    scored exactly once."""
+    if len(ids) <= window:
+        return [(ids, 1)]
+    windows = []
+    scored_until = 0
+    while scored_until < len(ids):
+        end = min(scored_until + stride, len(ids)) if scored_until else window
+        begin = max(end - window, 0)
+        windows.append((ids[begin:end], max(scored_until - begin, 1)))
+        scored_until = end
+    return windows
+
+
+def score_texts(texts, model, tokenizer, batch_size=16, device='cuda', cache=None,
+                window=None, stride=None):
+    """Return (loss, number of predicted tokens) for each text, where loss
+    is the mean token loss model(input_ids, labels=input_ids) would give.
+
+    Texts longer than the window are scored with a sliding window (see
+    text_windows), and the loss is averaged over all of their tokens.
+    Windows are sorted by length and run in right-padded batches, so each
+    batch has windows of about the same length and padding is small.
+    With a LossCache, only texts that aren't in it are run through the model."""
+    if cache is not None:
+        scores = cache.get_many(texts)
+        missing = [text for text in OrderedDict.fromkeys(texts) if text not in scores]
+        new_scores = dict(zip(missing, score_texts(missing, model, tokenizer, batch_size=batch_size,
+                                                   device=device, window=window, stride=stride)))
+        cache.put_many(new_scores)
+        scores.update(new_scores)
+        return [scores[text] for text in texts]
+
+    window, stride = window_and_stride(model, window, stride)
+    segments = []
+    for i, text in enumerate(texts):
+        for ids, score_from in text_windows(tokenizer.encode(text), window, stride):
+            segments.append((i, ids, score_from))
+    order = sorted(range(len(segments)), key=lambda s: len(segments[s][1]))
+
+    total_losses = [0.0] * len(texts)
+    total_tokens = [0] * len(texts)
+    with torch.no_grad():
+        for start in range(0, len(order), batch_size):
+            batch = [segments[s] for s in order[start:start + batch_size]]
+            max_length = max(len(ids) for _, ids, _ in batch)
+            input_ids = torch.zeros((len(batch), max_length), dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), max_length), dtype=torch.long)
+            scored = torch.zeros((len(batch), max_length), dtype=torch.long)
+            for row, (_, ids, score_from) in enumerate(batch):
+                input_ids[row, :len(ids)] = torch.tensor(ids)
+                attention_mask[row, :len(ids)] = 1
+                scored[row, score_from:len(ids)] = 1
+            input_ids = input_ids.to(device)
+            attention_mask = attention_mask.to(device)
+            scored = scored.to(device)
+            logits = model(input_ids, attention_mask=attention_mask)[0]
+
+            # each token predicts the next one, padding and context aren't predicted
+            labels = input_ids[:, 1:].masked_fill(scored[:, 1:] == 0, -100)
+            token_losses = F.cross_entropy(logits[:, :-1].reshape(-1, logits.shape[-1]).float(),
+                                           labels.reshape(-1), ignore_index=-100, reduction='none')
+            token_losses = token_losses.view(len(batch), -1).sum(dim=1)
+            num_tokens = scored[:, 1:].sum(dim=1)
+            for row, (i, _, _) in enumerate(batch):
+                total_losses[i] += float(token_losses[row])
+                total_tokens[i] += int(num_tokens[row])
+
+    return [(loss / count if count else float('nan'), count)
+            for loss, count in zip(total_losses, total_tokens)]
+
+
+def skip_results_file(results_path, results_file):
+    """Only forward transfer results of current models are scored on tune1k/test1k."""
     if any(x in results_path for x in ['tune1k', 'test1k']):
         if 'forward' not in results_file or 'old' in results_file or 'next_step_gpt2' in results_file:
-            print('skipped')
-            continue
-    ids = []
-    context = []
-    generated = []
-    with open(results_path + results_file, encoding='utf-8') as f:
-        if results_file.endswith('.csv'):
-            reader = csv.DictReader(f, quotechar='\t')
-        else:
-            reader = csv.DictReader(f, delimiter='\t', quotechar='\t')
-        for row in reader:
-            if 'recipe_id' in row:
-                id_column = 'recipe_id'
-            else:
-                id_column = 'source_recipe_id'
-
-            if 'human_rewrite' in results_file:
-                gen_column = 'rewritten_step'
-            else:
-                if 'generated0' in row:
-                    gen_column = 'generated0'
-                else:
-                    gen_column = 'generated'
-
-            ids.append(row[id_column])
-            generated.append(row[gen_column])
-    df = pd.DataFrame({id_column: ids,
-                       gen_column: generated})
+            return True
+    return False
+
+
+def token_perplexity(df):
+    """Perplexity over all tokens of all texts, so long texts count for more."""
+    df = df[df['num_tokens'] > 0]
+    if len(df) == 0:
+        return float('nan')
+    return math.exp((df['loss'] * df['num_tokens']).sum() / df['num_tokens'].sum())
+
+
+def perplexity_metrics(df, results_file, model, tokenizer, batch_size=16, device='cuda', cache=None,
+                       window=None, stride=None):
+    """Mean loss and perplexity of the generated steps, and of whole
+    generated recipes (steps joined with <inst>). Recipes longer than
+    the model's context are scored with a sliding window."""
+    def add_scores(df):
+        scores = score_texts(df[gen_col].tolist(), model, tokenizer, batch_size=batch_size,
+                             device=device, cache=cache, window=window, stride=stride)
+        df['loss'] = [loss for loss, _ in scores]
+        df['num_tokens'] = [num_tokens for _, num_tokens in scores]
+        df['perplexity'] = df['loss'].apply(math.exp)
+        return df
+
+    id_col = id_column(df)
+    gen_col = gen_column(df, results_file)
+    df = df[[id_col, gen_col]].copy()
 
     # remove ids ending with letter1 (ing models have 0 and 1 versions)
-    df = df[df[id_column].apply(lambda x: not bool(re.match(r'[A-Za-z]1$', x)))]
-
-    model_path = '/models/next-step-v2-md-128-16/checkpoint-1016470'
-    tokenizer = GPT2Tokenizer.from_pretrained(model_path)
-    with open(model_path + '/special_tokens_map.json') as f:
-        special_tokens_dict = json.load(f)
-    tokenizer.add_special_tokens(special_tokens_dict)
-
-    config = GPT2Config.from_pretrained('gpt2')
-    with open(model_path + '/config.json') as f:
-        config_dict = json.load(f)
-    for key, value in config_dict.items():
-        setattr(config, key, value)
-    config.bos_token_id = tokenizer.bos_token_id
-    config.eos_token_ids = [tokenizer.eos_token_id]
-    other_required_tokens = ['pad_token_id']
-    for tok in other_required_tokens:
-        if not getattr(config, tok):
-            setattr(config, tok, len(tokenizer))
-
-    model = GPT2LMHeadModel.from_pretrained(model_path, config=config)
-    model.resize_token_embeddings(len(tokenizer))
-    model.to('cuda')
-    model.eval()
-
-    def loss(sentence):
-        input_ids = torch.tensor(tokenizer.encode(sentence)).unsqueeze(0)
-        input_ids = input_ids.to('cuda')
-        loss = model(input_ids, labels=input_ids)[0]
-        loss = float(loss)
-        return loss
-
-    def perplexity(sentence):
-        input_ids = torch.tensor(tokenizer.encode(sentence)).unsqueeze(0)
-        input_ids = input_ids.to('cuda')
-        loss = model(input_ids, labels=input_ids)[0]
-        loss = float(loss)
-        return math.exp(loss)
-
-    df = df[df[gen_column].str.len() > 5]
-    df = df[df[gen_column].str.contains(' ')]
-    df[gen_column] = df[gen_column].apply(lambda x: re.sub(r' <source:.*?>', '', x))
-    df[gen_column] = df[gen_column].apply(lambda x: re.sub(r' <target:.*?>', '', x))
-    df[gen_column] = df[gen_column].apply(lambda x: re.sub(r' <endofinst>', '', x))
-    df[gen_column] = df[gen_column].apply(lambda x: re.sub(r' <endofprompt>', '', x))
-    df[gen_column] = df[gen_column].apply(lambda x: re.sub(r' <endofrecipe>', '', x))
-    df[gen_column] = df[gen_column].apply(lambda x: re.sub(r' <noings>', '', x))
-    df['loss'] = df[gen_column].apply(loss)
-    df['perplexity'] = df[gen_column].apply(perplexity)
+    df = df[df[id_col].apply(lambda x: not bool(re.match(r'[A-Za-z]1$', x)))]
+
+    df = df[df[gen_col].str.len() > 5]
+    df = df[df[gen_col].str.contains(' ')]
+    df[gen_col] = df[gen_col].apply(lambda x: re.sub(r' <source:.*?>', '', x))
+    df[gen_col] = df[gen_col].apply(lambda x: re.sub(r' <target:.*?>', '', x))
+    df[gen_col] = df[gen_col].apply(lambda x: re.sub(r' <endofinst>', '', x))
+    df[gen_col] = df[gen_col].apply(lambda x: re.sub(r' <endofprompt>', '', x))
+    df[gen_col] = df[gen_col].apply(lambda x: re.sub(r' <endofrecipe>', '', x))
+    df[gen_col] = df[gen_col].apply(lambda x: re.sub(r' <noings>', '', x))
+    df = add_scores(df)
 
     # average perplexity
+    metrics = OrderedDict()
     if not any(x in results_file for x in ['full_recipe', 'retrieval_baseline']):
-        print('step loss ', df['loss'].mean())
-        print('step perplexity ', df['perplexity'].mean())
+        metrics['step loss'] = df['loss'].mean()
+        metrics['step perplexity'] = df['perplexity'].mean()
     else:
-        print('recipe loss ', df['loss'].mean())
-        print('recipe perplexity ', df['perplexity'].mean())
+        metrics['recipe loss'] = df['loss'].mean()
+        metrics['recipe perplexity'] = df['perplexity'].mean()
+        metrics['recipe token perplexity'] = token_perplexity(df)
 
     if not any(x in results_file for x in ['full_recipe', 'retrieval_baseline']) and len(df) > 0:
-        df = df.groupby(id_column)[gen_column].apply(lambda x: ' <inst> '.join([i for i in x if i])).reset_index()
-        df['loss'] = df[gen_column].apply(loss)
-        df['perplexity'] = df[gen_column].apply(perplexity)
-        print('recipe loss ', df['loss'].mean())
-        print('recipe perplexity ', df['perplexity'].mean())
-    print()
-
-print(time.time() - start)
+        df = df.groupby(id_col)[gen_col].apply(lambda x: ' <inst> '.join([i for i in x if i])).reset_index()
+        df = add_scores(df)
+        metrics['recipe loss'] = df['loss'].mean()
+        metrics['recipe perplexity'] = df['perplexity'].mean()
+        metrics['recipe token perplexity'] = token_perplexity(df)
+    return metrics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loss_cache", default=None, type=str, help="SQLite file to keep scores in between runs")
+    parser.add_argument("--window", default=None, type=int, help="Tokens per forward pass, defaults to the model's context size")
+    parser.add_argument("--stride", default=None, type=int, help="Tokens the window moves for texts longer than the window")
+    args = parser.parse_args()
+
+    start = time.time()
+
+    results_path = '/results/test1k/'
+    results_files = list_results_files(results_path)
+    model, tokenizer = load_model()
+    window, stride = window_and_stride(model, args.window, args.stride)
+    cache = None
+    if args.loss_cache:
+        cache = LossCache(args.loss_cache, checkpoint_scope(MODEL_PATH, window, stride))
+
+    for results_file in results_files:
+        print(results_file)
+        if skip_results_file(results_path, results_file):
+            print('skipped')
+            continue
+        df = read_results_file(results_path + results_file)
+        metrics = perplexity_metrics(df, results_file, model, tokenizer, cache=cache,
+                                     window=window, stride=stride)
+        for name, value in metrics.items():
+            print(name, value)
+        print()
+
+    print(time.time() - start)
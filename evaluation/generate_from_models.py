@@ -9,16 +9,18 @@ import re
 import sys
 import time
 import random
-import pickle
 from ast import literal_eval
 import numpy as np
 import pandas as pd
 from nltk import word_tokenize
 import enchant
 
-from eval_ings import get_ing_list, get_ings
+from eval_ings import get_ing_index, get_ings
 from run_generation_batch import run_generation_batch
-from apply_tag import apply_tag
+from decoding_session import release_sessions
+from step_scheduler import StepScheduler
+from apply_tag import apply_tags
+from alignment_store import load_alignment_store
 
 
 random.seed(0)
@@ -354,12 +356,16 @@ class NextStepGeneration:
         meta = list(zip(self.params['recipe_ids'], self.params['step_ids'],
                         self.params['prompts'], self.params['references']))
 
-        gen_count = 0
+        # keep num_slots recipes generating at once, see step_scheduler.py
+        scheduler = StepScheduler(meta, self.params['prompts'], self.params.get('num_slots'),
+                                  key=lambda m: str(m[0]) + '-' + str(m[1]))
+        meta, self.params['prompts'] = scheduler.items, scheduler.prompts
         while self.params['prompts']:
-            gen_count += 1
             next_prompts = []
             next_meta = []
 
+            # keep each recipe's past between rounds, see decoding_session.py
+            self.params['session_keys'] = [str(m[0]) + '-' + str(m[1]) for m in meta]
             generated_steps = run_generation_batch(**self.params)
 
             generated_steps = [g[0] for g in generated_steps]
@@ -370,11 +376,12 @@ class NextStepGeneration:
                 only_step = generated_step.replace(self.params['prompts'][i], '')
                 only_step = only_step.split('<inst>')[0]
                 done = bool('<endofinst>' in only_step)
-                if gen_count > 20:
+                if scheduler.rounds(meta[i]) > 20:
                     done = True
 
                 if done or generated_step.count(' ') >= self.params['length']:
                     finished.append((meta[i], generated_step))
+                    release_sessions([self.params['session_keys'][i]])
                 else:
                     if only_step:
                         next_prompt = generated_step.split(only_step)[0] + \
@@ -386,9 +393,9 @@ class NextStepGeneration:
                         next_prompts.append(self.params['prompts'][i])
                         next_meta.append(meta[i])
 
-            self.params['prompts'] = next_prompts
-            meta = next_meta
+            meta, self.params['prompts'] = scheduler.update(next_meta, next_prompts)
 
+        self.params['session_keys'] = None
         self.params['generated_steps'] = [item[1] for item in finished]
         finished_meta = [item[0] for item in finished]
         self.params['recipe_ids'], self.params['step_ids'], \
@@ -706,6 +713,10 @@ class StyleTransferGeneration:
 
         original_prompt_map = dict(zip(self.params['recipe_ids'], self.params['prompts']))
 
+        # keep num_slots recipes generating at once, see step_scheduler.py
+        scheduler = StepScheduler(meta, self.params['prompts'], self.params.get('num_slots'),
+                                  key=lambda m: m[0])
+        meta, self.params['prompts'] = scheduler.items, scheduler.prompts
         while self.params['prompts']:
             next_prompts = []
             for i, prompt in enumerate(self.params['prompts']):
@@ -751,6 +762,8 @@ class StyleTransferGeneration:
 
             # generate target steps
             self.params['prompts'] = next_prompts
+            # keep each recipe's past between rounds, see decoding_session.py
+            self.params['session_keys'] = [m[0] for m in meta]
             generated_steps = run_generation_batch(**self.params)
 
             next_prompts = []
@@ -789,18 +802,18 @@ class StyleTransferGeneration:
                                      ref_step_id_for_curr_id,
                                      seen_unseen_for_curr_id,
                                      aligned_uniform_for_curr_id))
+                    release_sessions([meta[i][0]])
                     continue
 
                 # prepare prompt and meta for next ingredient generation
                 next_prompts.append(self.params['prompts'][i])
                 next_meta.append(meta[i])
 
-            if next_prompts:
-                self.params['prompts'] = next_prompts
-                meta = next_meta
-            else:
+            meta, self.params['prompts'] = scheduler.update(next_meta, next_prompts)
+            if not self.params['prompts']:
                 break
 
+        self.params['session_keys'] = None
         self.params['generated_steps'] = [item[1] for item in finished]
         self.params['step_prompts'] = [item[2] for item in finished]
         self.params['source_steps'] = [item[3] for item in finished]
@@ -889,7 +902,7 @@ class StyleTransferGeneration:
 
     def write_tsv(self):
         enchant_dict = enchant.DictWithPWL('en_US', 'enchant_word_list.txt')
-        ing_list = get_ing_list()
+        ing_list = get_ing_index()
 
         with open(self.params['result_filename'], 'w') as outfile:
             first_item_flag = True
@@ -945,10 +958,7 @@ class StyleTransferGeneration:
                     points -= not_a_word_count
                     # if it has violating ingredients
                     tag = re.search(r'<target:(.*?)>', self.params['step_prompts'][i]).group(1)
-                    tag_col = tag.capitalize() + '1'
-                    tmp_df = pd.DataFrame({'ingredients1': [[generated_step]], tag_col: [0]})
-                    bad_ings_count = tmp_df.apply(apply_tag, axis=1, num='1', tag=tag_col[:-1], return_count=True)
-                    bad_ings_count = bad_ings_count.tolist()[0]
+                    bad_ings_count = apply_tags(generated_step, [tag.capitalize()])[tag.capitalize()][1]
                     print('bad_ings_count', bad_ings_count, tag)
                     points -= 100 * bad_ings_count
                     # ingredients used should be similar to source
@@ -1688,9 +1698,14 @@ class StyleTransferIngGeneration:
 
         original_prompt_map = dict(zip(self.params['recipe_ids'], self.params['prompts']))
 
+        # keep num_slots recipes generating at once, see step_scheduler.py
+        scheduler = StepScheduler(meta, self.params['prompts'], self.params.get('num_slots'),
+                                  key=lambda m: m[0])
+        meta, self.params['prompts'] = scheduler.items, scheduler.prompts
+        if '_rule' in self.params['gen_type']:
+            ing_list = get_ing_index()
         while self.params['prompts']:
             if '_rule' in self.params['gen_type']:
-                ing_list = get_ing_list()
                 next_prompts = []
                 for i, curr_meta in enumerate(meta):
                     # create prompts for rule-based ingredient generation (source step n)
@@ -1800,6 +1815,8 @@ class StyleTransferIngGeneration:
                 else:
                     self.params['length'] = 512
                 self.params['prompts'] = ing_prompts
+                # keep each recipe's past between rounds, see decoding_session.py
+                self.params['session_keys'] = [m[0] for m in meta]
                 generated_ings = run_generation_batch(**self.params)
                 generated_ings = [g[0] for g in generated_ings]
 
@@ -1880,6 +1897,7 @@ class StyleTransferIngGeneration:
             elif '1024' in step_model_name:
                 self.params['length'] = 1024
             self.params['prompts'] = next_prompts
+            self.params['session_keys'] = [m[0] for m in meta]
             generated_steps = run_generation_batch(**self.params)
 
             next_prompts = []
@@ -1918,18 +1936,18 @@ class StyleTransferIngGeneration:
                                      ref_step_id_for_curr_id,
                                      seen_unseen_for_curr_id,
                                      aligned_uniform_for_curr_id))
+                    release_sessions([meta[i][0]])
                     continue
 
                 # prepare prompt and meta for next ingredient generation
                 next_prompts.append(self.params['prompts'][i])
                 next_meta.append(meta[i])
 
-            if next_prompts:
-                self.params['prompts'] = next_prompts
-                meta = next_meta
-            else:
+            meta, self.params['prompts'] = scheduler.update(next_meta, next_prompts)
+            if not self.params['prompts']:
                 break
 
+        self.params['session_keys'] = None
         self.params['generated_steps'] = [item[1] for item in finished]
         self.params['generated_ings'] = [item[2] for item in finished]
         self.params['reference_ings'] = [item[3] for item in finished]
@@ -2038,7 +2056,7 @@ class StyleTransferIngGeneration:
 
     def write_tsv(self):
         enchant_dict = enchant.DictWithPWL('en_US', 'enchant_word_list.txt')
-        ing_list = get_ing_list()
+        ing_list = get_ing_index()
 
         with open(self.params['result_filename'], 'w') as outfile:
             first_item_flag = True
@@ -2094,10 +2112,7 @@ class StyleTransferIngGeneration:
                     points -= not_a_word_count
                     # if it has violating ingredients
                     tag = re.search(r'<target:(.*?)>', self.params['step_prompts'][i]).group(1)
-                    tag_col = tag.capitalize() + '1'
-                    tmp_df = pd.DataFrame({'ingredients1': [[generated_step]], tag_col: [0]})
-                    bad_ings_count = tmp_df.apply(apply_tag, axis=1, num='1', tag=tag_col[:-1], return_count=True)
-                    bad_ings_count = bad_ings_count.tolist()[0]
+                    bad_ings_count = apply_tags(generated_step, [tag.capitalize()])[tag.capitalize()][1]
                     print('bad_ings_count', bad_ings_count, tag)
                     points -= 100 * bad_ings_count
                     # ingredients used should be similar to source
@@ -2727,9 +2742,11 @@ class NextStepStyleTransferGeneration:
                         self.params['prompts'], self.params['references'],
                         self.params['meta']))
 
-        gen_count = 0
+        # keep num_slots recipes generating at once, see step_scheduler.py
+        scheduler = StepScheduler(meta, self.params['prompts'], self.params.get('num_slots'),
+                                  key=lambda m: str(m[0]) + '-' + str(m[1]))
+        meta, self.params['prompts'] = scheduler.items, scheduler.prompts
         while self.params['prompts']:
-            gen_count += 1
             next_prompts = []
             next_meta = []
 
@@ -2754,7 +2771,7 @@ class NextStepStyleTransferGeneration:
                 done = bool(only_step and '<endofinst>' in only_step)
                 # TODO: why does it sometimes generate just the prompt, nothing new?
 
-                if gen_count > 20:
+                if scheduler.rounds(meta[i]) > 20:
                     done = True
 
                 if done or generated_step.count(' ') >= self.params['length']:
@@ -2815,8 +2832,7 @@ class NextStepStyleTransferGeneration:
                     next_prompts.append(next_prompt)
                     next_meta.append(meta[i])
 
-            self.params['prompts'] = next_prompts
-            meta = next_meta
+            meta, self.params['prompts'] = scheduler.update(next_meta, next_prompts)
 
         self.params['generated_steps'] = [item[1] for item in finished]
         finished_meta = [item[0] for item in finished]
@@ -3044,6 +3060,9 @@ if __name__ == "__main__":
     parser.add_argument("--rep", type=float, default=1)
     parser.add_argument("--temp", type=float, default=1)
     parser.add_argument("--num_return_sequences", type=int, default=1)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--num_slots", type=int, default=32,
+                        help="Recipes to generate steps for at once in step-by-step generation")
     parser.add_argument("--randomize", action="store_true")
     parser.add_argument("--set", default='tune', type=str)
     args = parser.parse_args()
@@ -3079,6 +3098,8 @@ if __name__ == "__main__":
     params['result_filename'] = 'results_' + filename_ending
     params['stop_token'] = '<|endoftext|>'
     params['num_return_sequences'] = args.num_return_sequences
+    params['batch_size'] = args.batch_size
+    params['num_slots'] = args.num_slots
 
     params['prompts'] = []
     params['references'] = []
@@ -3170,6 +3191,9 @@ if __name__ == "__main__":
             eval_filepath = 'full_recipe_' + args.set + '.txt'
             id_filepath = 'full_recipe_' + args.set + '_ids.tsv'
 
+    # prompts come from these files, so use their token caches if built
+    params['token_cache'] = [eval_filepath]
+
     if args.gen_type != 'manual':
         with open(eval_filepath, 'r', encoding='utf-8', errors='ignore') as eval_file, \
             open(id_filepath, 'r', encoding='utf-8', errors='ignore') as id_file:
@@ -3235,24 +3259,11 @@ if __name__ == "__main__":
             hmm_folder = args.set
         aligned_data_path = '/sample_data/HMM2_all_words_no_influence_3_iterations_'
         aligned_data_path += hmm_folder + '/text-text-alignments'
-        aligned_data = []
-        dish_names = []
-        for f in sorted(os.listdir(aligned_data_path)):
-            data = pickle.load(open(os.path.join(aligned_data_path, f), 'rb'))
-            aligned_data.append(data)
-            dish_names.append(f.replace('.pkl', ''))
-
-        curr_set_pairs = []
-        for d, dish in enumerate(aligned_data):
-            for recipe in dish:
-                dish_name = dish_names[d]
-                recipe_id1 = recipe['recipe_url']
-                recipe_id2 = recipe['video_id']
-                curr_set_pairs.append([dish_name, recipe_id1, recipe_id2])
-        curr_set_pairs = pd.DataFrame(curr_set_pairs, columns=['dish', 'recipe_id1', 'recipe_id2'])
+        df = pd.DataFrame({'recipe_id1': [x.split('-')[0] for x in params['recipe_ids']]})
+        store = load_alignment_store(aligned_data_path)
+        curr_set_pairs = store.recipe_pairs(recipe_ids1=set(df['recipe_id1']))
         curr_set_pairs = curr_set_pairs.drop_duplicates(subset='recipe_id1')
 
-        df = pd.DataFrame({'recipe_id1': [x.split('-')[0] for x in params['recipe_ids']]})
         df = pd.merge(df, curr_set_pairs, how='left', on='recipe_id1')
 
         aligned_data_path = '/sample_data/HMM2_all_words_no_influence_3_iterations_'
@@ -3296,6 +3307,7 @@ if __name__ == "__main__":
                 unique_recipe_ids.append(uid)
 
             params['full_prompts'] = dict(zip(unique_recipe_ids, recipes))
+            params['token_cache'].append(eval_filepath)
     else:
         with open(eval_filepath, 'r', encoding='utf-8', errors='ignore') as eval_file:
             if args.num_to_eval == 0:
@@ -0,0 +1,70 @@
+"""
+Persistent cache of perplexity scores.
+
+Many results files share generated strings, and recipe-level scores are
+recomputed every time the evaluation is run again. Scores are stored in a
+SQLite file keyed by (scope, sha1 of the text). The scope names the
+checkpoint (its path and the size and mtime of its weights) plus anything
+else that changes the score, so a retrained checkpoint never reuses old
+scores.
+"""
+import os
+import math
+import sqlite3
+import hashlib
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def checkpoint_scope(model_name_or_path, *options):
+    """Name a checkpoint by its path and weights file, plus any scoring options."""
+    scope = [os.path.abspath(model_name_or_path)]
+    weights_path = os.path.join(model_name_or_path, 'pytorch_model.bin')
+    if os.path.isfile(weights_path):
+        stat = os.stat(weights_path)
+        scope.append('{}-{}'.format(stat.st_size, stat.st_mtime))
+    scope.extend(str(option) for option in options)
+    return ':'.join(scope)
+
+
+class LossCache(object):
+    """Map text -> (loss, number of predicted tokens) for one scope."""
+    def __init__(self, path, scope):
+        self.scope = scope
+        # workers in run_evaluation.py can share the file
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS scores ('
+                                'scope TEXT, text_hash TEXT, loss REAL, num_tokens INTEGER, '
+                                'PRIMARY KEY (scope, text_hash))')
+        self.connection.commit()
+
+    def get_many(self, texts, chunk_size=500):
+        """Return {text: (loss, num_tokens)} for the texts that are cached."""
+        hashes = {}
+        for text in texts:
+            hashes.setdefault(text_hash(text), []).append(text)
+        keys = list(hashes)
+        found = {}
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            rows = self.connection.execute(
+                'SELECT text_hash, loss, num_tokens FROM scores WHERE scope = ? AND text_hash IN ({})'
+                .format(','.join('?' * len(chunk))), [self.scope] + chunk)
+            for key, loss, num_tokens in rows:
+                # sqlite stores nan as NULL
+                score = (float('nan') if loss is None else loss, num_tokens)
+                for text in hashes[key]:
+                    found[text] = score
+        return found
+
+    def put_many(self, scores):
+        """Store {text: (loss, num_tokens)}."""
+        rows = [(self.scope, text_hash(text), None if math.isnan(loss) else loss, num_tokens)
+                for text, (loss, num_tokens) in scores.items()]
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)', rows)
+
+    def close(self):
+        self.connection.close()
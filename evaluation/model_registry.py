@@ -0,0 +1,119 @@
+"""
+Process-wide cache of loaded models and tokenizers.
+
+Generation classes call run_generation_batch once per step, so without
+this every call would read the checkpoint from disk again. Models are
+keyed by (model_name_or_path, device, dtype) and stay loaded until they
+are evicted with evict_model or clear_models.
+
+GPT-2 models get prepare_padded_inputs_for_generation when they're
+loaded, so model.generate honours the attention mask of left-padded
+prompts. Without a mask it behaves like GPT-2's own.
+"""
+import gc
+import json
+import logging
+from collections import OrderedDict
+
+import torch
+from transformers import GPT2Config
+
+
+logger = logging.getLogger(__name__)
+
+_MODELS = OrderedDict()
+
+
+def model_key(model_name_or_path, device, dtype=None):
+    return (model_name_or_path, str(device), str(dtype) if dtype else None)
+
+
+def prepare_padded_inputs_for_generation(input_ids, past=None, attention_mask=None, **kwargs):
+    """GPT-2's prepare_inputs_for_generation drops the attention mask, so
+    left-padded prompts would attend to padding and start at the wrong
+    position. Pass the mask through and count positions from the first
+    real token instead."""
+    position_ids = None
+    if attention_mask is not None:
+        position_ids = (attention_mask.long().cumsum(-1) - 1).clamp(min=0)
+    if past:
+        input_ids = input_ids[:, -1:]
+        if position_ids is not None:
+            position_ids = position_ids[:, -1:]
+    return {'input_ids': input_ids, 'past': past,
+            'attention_mask': attention_mask, 'position_ids': position_ids}
+
+
+def load_tokenizer(tokenizer_class, model_name_or_path):
+    """Load a fine-tuned tokenizer with the special tokens it was trained with."""
+    tokenizer = tokenizer_class.from_pretrained(model_name_or_path)
+    with open(model_name_or_path + '/special_tokens_map.json') as f:
+        special_tokens_dict = json.load(f)
+    tokenizer.add_special_tokens(special_tokens_dict)
+    return tokenizer
+
+
+def load_checkpoint(model_class, tokenizer_class, model_name_or_path,
+                    device='cuda', dtype=None, config_name='gpt2'):
+    """Load a fine-tuned checkpoint along with its special tokens and config."""
+    tokenizer = load_tokenizer(tokenizer_class, model_name_or_path)
+
+    config = GPT2Config.from_pretrained(config_name)
+    with open(model_name_or_path + '/config.json') as f:
+        config_dict = json.load(f)
+    for key, value in config_dict.items():
+        setattr(config, key, value)
+    config.bos_token_id = tokenizer.bos_token_id
+    config.eos_token_ids = [tokenizer.eos_token_id]
+    other_required_tokens = ['pad_token_id']
+    for tok in other_required_tokens:
+        if not getattr(config, tok):
+            setattr(config, tok, len(tokenizer))
+
+    model = model_class.from_pretrained(model_name_or_path, config=config)
+    model.resize_token_embeddings(len(tokenizer))
+    if config_name == 'gpt2':
+        model.prepare_inputs_for_generation = prepare_padded_inputs_for_generation
+    if dtype:
+        model.to(getattr(torch, dtype))
+    model.to(device)
+    model.eval()
+    return model, tokenizer
+
+
+def get_model(model_class, tokenizer_class, model_name_or_path,
+              device='cuda', dtype=None, config_name='gpt2'):
+    """Return (model, tokenizer), loading the checkpoint the first time it's asked for."""
+    key = model_key(model_name_or_path, device, dtype)
+    if key not in _MODELS:
+        logger.info('Loading ' + model_name_or_path + ' on ' + str(device))
+        _MODELS[key] = load_checkpoint(model_class, tokenizer_class, model_name_or_path,
+                                       device=device, dtype=dtype, config_name=config_name)
+    _MODELS.move_to_end(key)
+    return _MODELS[key]
+
+
+def loaded_models():
+    return list(_MODELS.keys())
+
+
+def _release(keys):
+    for key in keys:
+        del _MODELS[key]
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def evict_model(model_name_or_path, device=None, dtype=None):
+    """Drop a model from the cache. Without a device or dtype,
+    every loaded copy of the checkpoint is dropped."""
+    keys = [key for key in _MODELS if key[0] == model_name_or_path and
+            (device is None or key[1] == str(device)) and
+            (dtype is None or key[2] == str(dtype))]
+    _release(keys)
+    return len(keys)
+
+
+def clear_models():
+    _release(list(_MODELS.keys()))
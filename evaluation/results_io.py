@@ -0,0 +1,58 @@
+"""
+Reading generation results files for evaluation.
+
+Results files are tab-separated (or comma-separated for .csv files) with
+tab as the quote character, as written by generate_from_models.py.
+Column names changed between versions of the generation script, so the
+id, context and generated step columns are picked by what's in the file.
+"""
+import os
+import csv
+import pandas as pd
+
+
+def list_results_files(results_path):
+    return sorted(os.listdir(results_path))
+
+
+def read_results_file(path):
+    """Read one results file into a DataFrame of strings."""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            reader = csv.DictReader(f, quotechar='\t')
+        else:
+            reader = csv.DictReader(f, delimiter='\t', quotechar='\t')
+        rows = list(reader)
+        columns = reader.fieldnames or []
+    return pd.DataFrame(rows, columns=columns)
+
+
+def id_column(df):
+    if 'recipe_id' in df:
+        return 'recipe_id'
+    return 'source_recipe_id'
+
+
+def context_column(df, results_file):
+    if 'human_rewrite' in results_file:
+        # human rewrites don't have a prompt, see with_context
+        return 'context'
+    if 'step_context' in df:
+        return 'step_context'
+    return 'context'
+
+
+def gen_column(df, results_file):
+    if 'human_rewrite' in results_file:
+        return 'rewritten_step'
+    if 'generated0' in df:
+        return 'generated0'
+    return 'generated'
+
+
+def with_context(df, results_file):
+    """Human rewrites were all written for the vegetarian target."""
+    if 'human_rewrite' in results_file:
+        df = df.copy()
+        df['context'] = '<target:vegetarian>'
+    return df
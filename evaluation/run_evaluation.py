@@ -0,0 +1,125 @@
+"""
+Run the evaluation metrics over every results file in a directory.
+
+Each results file is read once into a shared frame. Dietary compliance
+(eval_ings.py), diversity (run_calculate_diversity.py) and perplexity
+(eval_perplexity.py) are then computed per file by a pool of worker
+processes. The metrics go into one table, one row per results file.
+
+    python run_evaluation.py --results_path /results/test1k/ --output test1k_metrics.tsv
+"""
+import argparse
+import multiprocessing
+from collections import OrderedDict
+import pandas as pd
+
+from results_io import list_results_files, read_results_file
+from eval_ings import get_ing_index, compliance
+from run_calculate_diversity import diversity_metrics
+from eval_perplexity import (MODEL_PATH, load_model, window_and_stride, skip_results_file,
+                             perplexity_metrics)
+from loss_cache import LossCache, checkpoint_scope
+
+
+METRICS = ['compliance', 'diversity', 'perplexity']
+
+# set in the parent before the pools fork, so workers share them
+_RESULTS = {}
+_MODEL = {}
+
+
+def load_results(results_path, results_files):
+    """Read every results file into one frame indexed by (results_file, row).
+    Also returns the columns of each file, since they differ between files."""
+    frames = [read_results_file(results_path + results_file) for results_file in results_files]
+    if not frames:
+        return pd.DataFrame(), {}
+    columns = {results_file: list(df.columns) for results_file, df in zip(results_files, frames)}
+    results = pd.concat(frames, keys=results_files, names=['results_file', 'row'], sort=False)
+    return results, columns
+
+
+def results_frame(results_file):
+    results, columns = _RESULTS['results'], _RESULTS['columns']
+    return results.loc[results_file, columns[results_file]]
+
+
+def run_metric(task):
+    metric, results_file = task
+    df = results_frame(results_file)
+    if metric == 'compliance':
+        values = compliance(df, results_file, _RESULTS['ing_list'])
+    elif metric == 'diversity':
+        values = diversity_metrics(df, results_file, _RESULTS['ing_list'])
+    else:
+        # each perplexity worker loads the model once
+        if 'model' not in _MODEL:
+            _MODEL['model'], _MODEL['tokenizer'] = load_model(_RESULTS['model_path'], _RESULTS['device'])
+            _MODEL['window'], _MODEL['stride'] = window_and_stride(_MODEL['model'], _RESULTS['window'],
+                                                                   _RESULTS['stride'])
+            _MODEL['cache'] = None
+            if _RESULTS['loss_cache']:
+                scope = checkpoint_scope(_RESULTS['model_path'], _MODEL['window'], _MODEL['stride'])
+                _MODEL['cache'] = LossCache(_RESULTS['loss_cache'], scope)
+        values = perplexity_metrics(df, results_file, _MODEL['model'], _MODEL['tokenizer'],
+                                    batch_size=_RESULTS['batch_size'], device=_RESULTS['device'],
+                                    cache=_MODEL['cache'], window=_MODEL['window'], stride=_MODEL['stride'])
+    return results_file, OrderedDict((metric + ' ' + str(name), value) for name, value in values.items())
+
+
+def run_evaluation(results_path, metrics=METRICS, num_workers=4, num_perplexity_workers=1,
+                   model_path=MODEL_PATH, device='cuda', batch_size=16, loss_cache=None,
+                   window=None, stride=None):
+    """Return a DataFrame of metrics with one row per results file."""
+    results_files = list_results_files(results_path)
+    _RESULTS['results'], _RESULTS['columns'] = load_results(results_path, results_files)
+    _RESULTS['model_path'] = model_path
+    _RESULTS['device'] = device
+    _RESULTS['batch_size'] = batch_size
+    _RESULTS['loss_cache'] = loss_cache
+    _RESULTS['window'] = window
+    _RESULTS['stride'] = stride
+    if 'compliance' in metrics or 'diversity' in metrics:
+        _RESULTS['ing_list'] = get_ing_index()
+
+    tasks = [(metric, results_file) for metric in metrics if metric != 'perplexity'
+             for results_file in results_files]
+    perplexity_tasks = [('perplexity', results_file) for results_file in results_files
+                        if 'perplexity' in metrics and not skip_results_file(results_path, results_file)]
+
+    context = multiprocessing.get_context('fork')
+    table = OrderedDict((results_file, OrderedDict()) for results_file in results_files)
+    with context.Pool(num_workers) as pool, context.Pool(num_perplexity_workers) as perplexity_pool:
+        # the model is only needed for perplexity, so those tasks get their own
+        # (usually smaller) pool and run alongside the others
+        perplexity_results = perplexity_pool.imap_unordered(run_metric, perplexity_tasks)
+        for results_file, values in pool.imap_unordered(run_metric, tasks):
+            table[results_file].update(values)
+        for results_file, values in perplexity_results:
+            table[results_file].update(values)
+    return pd.DataFrame.from_dict(table, orient='index')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results_path", default='/results/test1k/', type=str)
+    parser.add_argument("--output", default='metrics.tsv', type=str)
+    parser.add_argument("--metrics", nargs='+', default=METRICS, choices=METRICS)
+    parser.add_argument("--num_workers", default=4, type=int)
+    parser.add_argument("--num_perplexity_workers", default=1, type=int)
+    parser.add_argument("--model_name_or_path", default=MODEL_PATH, type=str)
+    parser.add_argument("--device", default='cuda', type=str)
+    parser.add_argument("--batch_size", default=16, type=int, help="Batch size for perplexity")
+    parser.add_argument("--loss_cache", default=None, type=str, help="SQLite file to keep perplexity scores in between runs")
+    parser.add_argument("--window", default=None, type=int, help="Tokens per forward pass for perplexity, defaults to the model's context size")
+    parser.add_argument("--stride", default=None, type=int, help="Tokens the perplexity window moves for texts longer than the window")
+    args = parser.parse_args()
+
+    metrics_table = run_evaluation(args.results_path, metrics=args.metrics,
+                                   num_workers=args.num_workers,
+                                   num_perplexity_workers=args.num_perplexity_workers,
+                                   model_path=args.model_name_or_path, device=args.device,
+                                   batch_size=args.batch_size, loss_cache=args.loss_cache,
+                                   window=args.window, stride=args.stride)
+    metrics_table.to_csv(args.output, sep='\t', index_label='results_file')
+    print(metrics_table)
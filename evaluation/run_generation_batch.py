@@ -21,7 +21,6 @@
 import argparse
 import logging
 import time
-import json
 import re
 
 import numpy as np
@@ -30,7 +29,6 @@ import torch
 from transformers import (
     CTRLLMHeadModel,
     CTRLTokenizer,
-    GPT2Config,
     GPT2LMHeadModel,
     GPT2Tokenizer,
     OpenAIGPTLMHeadModel,
@@ -43,6 +41,10 @@ from transformers import (
     XLNetTokenizer,
 )
 
+from decoding_session import MAX_SESSIONS, get_session
+from model_registry import get_model, load_tokenizer as registry_load_tokenizer
+from token_cache import load_token_cache
+
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(name)s -   %(message)s", datefmt="%m/%d/%Y %H:%M:%S", level=logging.INFO,
@@ -144,14 +146,23 @@ def adjust_length_to_model(length, max_sequence_length):
     return length
 
 
+def token_id(tokenizer, token):
+    """Id of the first token of a string, kept on the tokenizer so it's
+    freed along with it."""
+    if not hasattr(tokenizer, 'first_token_ids'):
+        tokenizer.first_token_ids = {}
+    if token not in tokenizer.first_token_ids:
+        tokenizer.first_token_ids[token] = tokenizer.convert_tokens_to_ids(tokenizer.tokenize(token))[0]
+    return tokenizer.first_token_ids[token]
+
+
 def shorten_prompt(encoded_prompt, cutoff_token, tokenizer, max_length):
     """If prompt is too long, shorten it."""
     short_enough = False
-    encoded_prompt = encoded_prompt.tolist()
-    cutoff_tok = tokenizer.convert_tokens_to_ids(
-        tokenizer.tokenize(cutoff_token))[0]
-    special_token_cutoff = tokenizer.convert_tokens_to_ids(
-        tokenizer.tokenize(tokenizer.eos_token))[0]
+    if torch.is_tensor(encoded_prompt):
+        encoded_prompt = encoded_prompt.tolist()
+    cutoff_tok = token_id(tokenizer, cutoff_token)
+    special_token_cutoff = token_id(tokenizer, tokenizer.eos_token)
     for _ in range(encoded_prompt.count(cutoff_tok)):
         # find text between any special token and the first cutoff token
         for i, tok in enumerate(encoded_prompt):
@@ -173,6 +184,53 @@ def shorten_prompt(encoded_prompt, cutoff_token, tokenizer, max_length):
     return encoded_prompt, short_enough
 
 
+def model_classes(model_type):
+    """(model class, tokenizer class) for a model type."""
+    try:
+        return MODEL_CLASSES[model_type.lower()]
+    except KeyError:
+        raise KeyError("the model {} you specified is not supported. You are welcome to add it and open a PR :)"
+                       .format(model_type))
+
+
+def load_tokenizer(model_type, model_name_or_path):
+    """Load the fine-tuned tokenizer for a model type, see model_registry.py."""
+    _, tokenizer_class = model_classes(model_type)
+    return registry_load_tokenizer(tokenizer_class, model_name_or_path)
+
+
+def encode_prompt(prompt_text, tokenizer, token_caches=[]):
+    """Get token ids for a prompt from a token cache if it's there."""
+    for token_cache in token_caches:
+        encoded_prompt = token_cache.get(prompt_text)
+        if encoded_prompt is not None:
+            return torch.tensor(encoded_prompt)
+    encoded_prompt = tokenizer.encode(prompt_text, add_special_tokens=False, return_tensors="pt")
+    return encoded_prompt.squeeze(0)
+
+
+def pad_prompts(encoded_prompts, pad_token_id):
+    """Left-pad token id lists to the same length. Returns ids and attention mask."""
+    batch_length = max(len(encoded_prompt) for encoded_prompt in encoded_prompts)
+    input_ids = []
+    attention_mask = []
+    for encoded_prompt in encoded_prompts:
+        num_padding = batch_length - len(encoded_prompt)
+        input_ids.append([pad_token_id] * num_padding + list(encoded_prompt))
+        attention_mask.append([0] * num_padding + [1] * len(encoded_prompt))
+    return torch.tensor(input_ids), torch.tensor(attention_mask)
+
+
+def trim_generated_sequence(generated_sequence, prompt_length, max_sequence_length, eos_token_id):
+    """Cut a row of batched output back to what batch-1 generation would return:
+    no more than max_sequence_length tokens, ending at the first eos token.
+    Rows that finish early are filled with padding after the eos token."""
+    generated_sequence = generated_sequence[:max(prompt_length, max_sequence_length)]
+    if eos_token_id in generated_sequence[prompt_length:]:
+        generated_sequence = generated_sequence[:generated_sequence.index(eos_token_id, prompt_length) + 1]
+    return generated_sequence
+
+
 def run_generation_batch(model_type='gpt2',
                          model_name_or_path=None,
                          gen_type='manual',
@@ -199,45 +257,39 @@ def run_generation_batch(model_type='gpt2',
                          no_cuda=True,
                          num_return_sequences=1,
                          result_filename='',
+                         token_cache=[],
+                         batch_size=8,
+                         session_keys=None,
+                         num_slots=None,
                          device='cuda',
+                         dtype=None,
                          n_gpu=1,
                          log_level=logging.INFO):
     # Initialize the model and tokenizer
 
     logging.getLogger('transformers').setLevel(log_level)
 
-    try:
-        model_type = model_type.lower()
-        model_class, tokenizer_class = MODEL_CLASSES[model_type]
-    except KeyError:
-        raise KeyError("the model {} you specified is not supported. You are welcome to add it and open a PR :)")
-
-    tokenizer = tokenizer_class.from_pretrained(model_name_or_path)
-    with open(model_name_or_path + '/special_tokens_map.json') as f:
-        special_tokens_dict = json.load(f)
-    tokenizer.add_special_tokens(special_tokens_dict)
-
-    config = GPT2Config.from_pretrained(model_type)
-    with open(model_name_or_path + '/config.json') as f:
-        config_dict = json.load(f)
-    for key, value in config_dict.items():
-        setattr(config, key, value)
-    config.bos_token_id = tokenizer.bos_token_id
-    config.eos_token_ids = [tokenizer.eos_token_id]
-    other_required_tokens = ['pad_token_id']
-    for tok in other_required_tokens:
-        if not getattr(config, tok):
-            setattr(config, tok, len(tokenizer))
-
-    model = model_class.from_pretrained(model_name_or_path, config=config)
-    model.resize_token_embeddings(len(tokenizer))
-    model.to(device)
+    model_type = model_type.lower()
+    model_class, tokenizer_class = model_classes(model_type)
+
+    # checkpoints stay loaded between calls, see model_registry.py
+    model, tokenizer = get_model(model_class, tokenizer_class, model_name_or_path,
+                                 device=device, dtype=dtype, config_name=model_type)
+
+    # dataset files the prompts were taken from, see token_cache.py
+    token_caches = [load_token_cache(path, tokenizer) for path in token_cache]
+    token_caches = [cache for cache in token_caches if cache is not None]
 
     length = adjust_length_to_model(length, max_sequence_length=model.config.max_position_embeddings)
 
-    generated_results = []
+    # prompts are left-padded to the longest prompt in their batch
+    # (GPT-2 models honour the padding mask, see model_registry.py)
+    pad_token_id = tokenizer.pad_token_id
+    if pad_token_id is None:
+        pad_token_id = tokenizer.eos_token_id
+
+    encoded_prompts = []
     for i in range(len(prompts)):
-        now = time.time()
         prompt_text = prompts[i]
 
         # Different models need different input formatting and/or extra arguments
@@ -245,8 +297,7 @@ def run_generation_batch(model_type='gpt2',
         if requires_preprocessing:
             prepare_input = PREPROCESSING_FUNCTIONS.get(model_type)
             prompt_text = prepare_input(args, model, tokenizer, prompt_text)
-        encoded_prompt = tokenizer.encode(prompt_text, add_special_tokens=False, return_tensors="pt")
-        encoded_prompt = encoded_prompt.squeeze()
+        encoded_prompt = encode_prompt(prompt_text, tokenizer, token_caches)
 
         # add padding to prompt if this is a masked LM
         if 'mlm' in model_name_or_path:
@@ -298,58 +349,106 @@ def run_generation_batch(model_type='gpt2',
                 if not short_enough:
                     encoded_prompt, short_enough = shorten_prompt(encoded_prompt, '.', tokenizer, max_length)
 
-        encoded_prompt = torch.unsqueeze(torch.tensor(encoded_prompt), 0)
-        gpu_encoded_prompt = encoded_prompt.to(device)
-
-        output_sequences = []
-        for _ in range(num_return_sequences):
-            output_sequence = model.generate(
-                input_ids=gpu_encoded_prompt,
-                max_length=length + len(encoded_prompt),
+        encoded_prompts.append([int(tok) for tok in encoded_prompt])
+
+    # batch-1 generation used max_length=length + len(encoded_prompt) on a
+    # (1, n) tensor, so each sequence was capped at length + 1 tokens
+    max_sequence_length = length + 1
+
+    # session_keys name the recipe each prompt belongs to, so the next
+    # prompt for the same recipe can start from the cached past
+    use_sessions = bool(session_keys) and model_type == 'gpt2' and 'mlm' not in model_name_or_path
+    if use_sessions:
+        # every recipe in this call will be extended on the next one, but
+        # keep no more than num_slots of them so the cached past stays bounded
+        session = get_session(model)
+        session.max_sessions = min(len(set(session_keys)), num_slots or MAX_SESSIONS)
+    elif repetition_penalty != 1.0:
+        # model.generate applies the penalty to every token in input_ids,
+        # padding included, so a padded prompt would sample differently
+        # than it does alone
+        batch_size = 1
+
+    # sort by length so prompts in a batch need little padding
+    generated_results = [None] * len(prompts)
+    order = sorted(range(len(prompts)), key=lambda i: len(encoded_prompts[i]))
+    for batch_start in range(0, len(order), batch_size):
+        now = time.time()
+        batch = order[batch_start:batch_start + batch_size]
+        batch_length = max(len(encoded_prompts[i]) for i in batch)
+        max_new_tokens = max(max(len(encoded_prompts[i]), max_sequence_length) -
+                             len(encoded_prompts[i]) for i in batch)
+
+        if use_sessions:
+            # reuse past key/values from earlier calls, see decoding_session.py
+            output_sequences = session.generate(
+                [session_keys[i] for i in batch],
+                [encoded_prompts[i] for i in batch],
+                max_new_tokens,
+                temperature=temperature,
+                top_k=k,
+                top_p=p,
+                repetition_penalty=repetition_penalty,
+                num_return_sequences=num_return_sequences,
+                pad_token_id=pad_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+            )
+        else:
+            input_ids, attention_mask = pad_prompts([encoded_prompts[i] for i in batch], pad_token_id)
+            max_length = min(batch_length + max_new_tokens, model.config.max_position_embeddings)
+            output_sequences = model.generate(
+                input_ids=input_ids.to(device),
+                attention_mask=attention_mask.to(device),
+                max_length=max(batch_length, max_length),
                 temperature=temperature,
                 top_k=k,
                 top_p=p,
                 repetition_penalty=repetition_penalty,
                 do_sample=True,
-                num_return_sequences=1,
+                pad_token_id=pad_token_id,
+                num_return_sequences=num_return_sequences,
             )
-            output_sequences.append(output_sequence[0])
 
-        n_generated_text = []
-        for output_sequence in output_sequences:
-            generated_sequence = output_sequence.tolist()
+        # return sequences come back grouped by prompt
+        for j, i in enumerate(batch):
+            encoded_prompt = encoded_prompts[i]
+            num_padding = batch_length - len(encoded_prompt)
+            n_generated_text = []
+            for output_sequence in output_sequences[j * num_return_sequences:(j + 1) * num_return_sequences]:
+                generated_sequence = trim_generated_sequence(
+                    output_sequence.tolist()[num_padding:], len(encoded_prompt),
+                    max_sequence_length, tokenizer.eos_token_id)
 
-            if 'mlm' in model_name_or_path:
-                generated_sequence = generated_sequence[divider:]
+                if 'mlm' in model_name_or_path:
+                    generated_sequence = generated_sequence[divider:]
 
-                pad_token = tokenizer.convert_tokens_to_ids(
-                    tokenizer.tokenize('<|pad|>'))[0]
-                stop_tok = tokenizer.convert_tokens_to_ids(
-                    tokenizer.tokenize(stop_token))[0]
-                while generated_sequence and any(generated_sequence[-1] == tok for tok in(pad_token, stop_tok)):
-                    generated_sequence = generated_sequence[:-1]
+                    pad_token = token_id(tokenizer, '<|pad|>')
+                    stop_tok = token_id(tokenizer, stop_token)
+                    while generated_sequence and any(generated_sequence[-1] == tok for tok in(pad_token, stop_tok)):
+                        generated_sequence = generated_sequence[:-1]
 
-            generated_text = tokenizer.decode(generated_sequence,
-                                              clean_up_tokenization_spaces=False)
-            generated_text = ''.join(generated_text)
+                generated_text = tokenizer.decode(generated_sequence,
+                                                  clean_up_tokenization_spaces=False)
+                generated_text = ''.join(generated_text)
 
-            decoded_prompt = tokenizer.decode(encoded_prompt.squeeze(),
-                                              clean_up_tokenization_spaces=False)
-            decoded_prompt = ''.join(decoded_prompt)
-            generated_text = generated_text.replace(decoded_prompt, '').strip()
+                decoded_prompt = tokenizer.decode(encoded_prompt,
+                                                  clean_up_tokenization_spaces=False)
+                decoded_prompt = ''.join(decoded_prompt)
+                generated_text = generated_text.replace(decoded_prompt, '').strip()
 
-            generated_text = re.sub(r'([^\s])((?<! )<)', r'\1 \2', generated_text)
-            generated_text = re.sub(r'((?<! )>)([^\s])', r'\1 \2', generated_text)
+                generated_text = re.sub(r'([^\s])((?<! )<)', r'\1 \2', generated_text)
+                generated_text = re.sub(r'((?<! )>)([^\s])', r'\1 \2', generated_text)
 
-            if stop_token in generated_text:
-                generated_text = generated_text[: generated_text.find(stop_token)]
-            generated_text = generated_text.replace('\n', ' ').strip()
+                if stop_token in generated_text:
+                    generated_text = generated_text[: generated_text.find(stop_token)]
+                generated_text = generated_text.replace('\n', ' ').strip()
 
-            n_generated_text.append(generated_text)
+                n_generated_text.append(generated_text)
 
-        generated_results.append(n_generated_text)
+            generated_results[i] = n_generated_text
 
-        logger.info('PROMPT ' + str(i) + ': ' + str(time.time() - now))
+        logger.info('BATCH ' + str(batch_start // batch_size) + ' (' + str(len(batch)) + ' prompts): ' +
+                    str(time.time() - now))
     return generated_results
 
 
@@ -392,6 +491,7 @@ if __name__ == "__main__":
     parser.add_argument("--seed", type=int, default=42, help="random seed for initialization")
     parser.add_argument("--no_cuda", action="store_true", help="Avoid using CUDA when available")
     parser.add_argument("--num_return_sequences", type=int, default=1, help="The number of samples to generate.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Number of prompts to generate from at once.")
     parser.add_argument("--result_filename", type=str, required=True)
     args = parser.parse_args()
 
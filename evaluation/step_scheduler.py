@@ -0,0 +1,46 @@
+"""
+Scheduler for step-by-step generation over many recipes.
+
+The iterative generation classes generate one step for every unfinished
+recipe per round. Recipes have anywhere from 2 to 30+ steps, so without a
+scheduler the late rounds run with only a few prompts left. StepScheduler
+keeps a fixed number of recipes active. As soon as a recipe finishes, its
+slot is given to the next recipe that hasn't started yet.
+"""
+from collections import deque
+
+
+class StepScheduler(object):
+    """Hand out recipes to a fixed number of decoding slots.
+
+    items and prompts are parallel lists, like meta and prompts in the
+    generation classes. key(item) has to be unique per recipe."""
+    def __init__(self, items, prompts, num_slots=None, key=None):
+        self.key = key or (lambda item: item[0])
+        self.pending = deque(zip(items, prompts))
+        self.num_slots = num_slots or len(self.pending)
+        self.num_rounds = {}
+        self.items = []
+        self.prompts = []
+        self.update([], [])
+
+    def __len__(self):
+        return len(self.items)
+
+    def update(self, items, prompts):
+        """Keep the recipes that aren't finished and fill free slots with
+        recipes that haven't started. Returns items and prompts for the next round."""
+        self.items = list(items)
+        self.prompts = list(prompts)
+        while len(self.items) < self.num_slots and self.pending:
+            item, prompt = self.pending.popleft()
+            self.items.append(item)
+            self.prompts.append(prompt)
+        for item in self.items:
+            key = self.key(item)
+            self.num_rounds[key] = self.num_rounds.get(key, 0) + 1
+        return self.items, self.prompts
+
+    def rounds(self, item):
+        """Number of rounds this recipe has been active for, including the current one."""
+        return self.num_rounds[self.key(item)]
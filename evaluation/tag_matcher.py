@@ -0,0 +1,158 @@
+"""
+Precompiled matching of dietary restriction word lists.
+
+The tag rules check every word in a tag's word list with a substring test,
+and every exception phrase for the words that are found. TagMatcher compiles
+all of the words and exception phrases into one regex, built once, and finds
+all of them in a single pass over the text. Verdicts and violation counts
+are the same as checking each word with `in`.
+"""
+import re
+from collections import Counter
+
+
+def trie_pattern(terms):
+    """Regex matching any of the terms, as a character trie.
+    Longer terms are tried first, so it matches the longest term
+    that starts at a position."""
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def pattern(node):
+        branches = [re.escape(char) + pattern(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1:
+            group = branches[0]
+        else:
+            group = '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            return '(?:' + group + ')?'
+        return group
+
+    return pattern(trie)
+
+
+class TermMatcher(object):
+    """Find which of a set of terms appear in a text as substrings,
+    including terms that overlap or contain each other.
+    With word_start, terms only match where r'\b' + term would."""
+    def __init__(self, terms, word_start=False):
+        self.terms = frozenset(term for term in terms if term)
+        boundary = r'\b' if word_start else ''
+        self.regex = re.compile(boundary + '(?=(' + trie_pattern(self.terms) + '))')
+        # any term found at a position also means its prefixes in the set were found
+        self.prefixes = {term: [term[:i] for i in range(1, len(term) + 1) if term[:i] in self.terms]
+                         for term in self.terms}
+
+    def positions(self, text):
+        """Map each term found to the position of its first match."""
+        found = {}
+        for match in self.regex.finditer(text):
+            if match.group(1):
+                for term in self.prefixes[match.group(1)]:
+                    found.setdefault(term, match.start())
+        return found
+
+    def find(self, text):
+        found = set()
+        for match in self.regex.finditer(text):
+            if match.group(1):
+                found.update(self.prefixes[match.group(1)])
+        return found
+
+
+class TagMatcher(object):
+    """Check texts against the word lists for each tag.
+
+    rule_map maps a tag to its word list. A word that appears in the text
+    is a violation unless one of its phrases in exception_map also
+    appears. Words that appear more than once in a list count once per
+    appearance, like looping over the list."""
+    def __init__(self, rule_map, exception_map):
+        self.rule_map = rule_map
+        self.exception_map = exception_map
+        self.word_counts = {tag: Counter(words) for tag, words in rule_map.items()}
+        self.words = frozenset(word for words in rule_map.values() for word in words)
+        phrases = set(phrase for word in self.words if word in exception_map
+                      for phrase in exception_map[word])
+        self.matcher = TermMatcher(self.words | phrases | {'kosher salt'})
+
+    def scan(self, text):
+        """All words and exception phrases in the text, for use with count_violations."""
+        return self.matcher.find(text)
+
+    def is_exception(self, word, found):
+        return any(phrase in found for phrase in self.exception_map[word])
+
+    def violating_words(self, found):
+        """Words from any list that are in the text and not covered by an exception.
+        Also returns the ones that 'kosher salt' excuses for Kosher."""
+        violating = set()
+        kosher_excused = set()
+        for word in self.words & found:
+            if word in self.exception_map:
+                if self.is_exception(word, found):
+                    continue
+                if 'kosher salt' in found:
+                    kosher_excused.add(word)
+            violating.add(word)
+        return violating, kosher_excused
+
+    def count_all_violations(self, tags, found):
+        """Violation counts for several tags, given scan(text). Words shared
+        between lists (e.g. fish words in the meat and vegan lists) are only
+        checked against their exceptions once."""
+        violating, kosher_excused = self.violating_words(found)
+        counts = {}
+        for tag in tags:
+            words = violating - kosher_excused if tag == 'Kosher' else violating
+            counts[tag] = sum(self.word_counts[tag][word] for word in words
+                              if word in self.word_counts[tag])
+        return counts
+
+    def count_violations(self, tag, found):
+        """Number of words in the tag's list that rule it out, given scan(text)."""
+        return self.count_all_violations([tag], found)[tag]
+
+    def violations(self, text, tag):
+        return self.count_violations(tag, self.scan(text))
+
+
+def tag_in_title(tag, title, ingredients):
+    """Whether the title or ingredients say outright that the recipe fits the tag."""
+    title = title.lower()
+    if tag.lower() in title:
+        return True
+    if '-' in tag:
+        if tag.lower().replace('-', ' ') in title:
+            return True
+    # cover alternative ways of saying x-free
+    if tag == 'Alcohol-free':
+        alcohol_free_terms = ['non-alcoholic', 'non alcoholic']
+        if any(word in title for word in alcohol_free_terms):
+            return True
+    if tag == 'Gluten-free':
+        gluten_free_terms = ['(gf)', 'gluten- free', 'gluten -free']
+        if any(word in title for word in gluten_free_terms):
+            return True
+    if tag == 'Vegetarian':
+        meat_free_terms = ['meatless', 'meat-free', 'meat free',
+                           'no meat', 'no-meat']
+        if any(word in title for word in meat_free_terms):
+            return True
+    if tag.lower() in ingredients:
+        if tag != 'Kosher' or 'kosher salt' not in ingredients:
+            return True
+
+    # overwrite if x...free appears (e.g. "Gluten & Soy Free" = gluten-free)
+    if tag.endswith('-free'):
+        prefix = tag.split('-')[0].lower()
+        if re.search(prefix + '.*?free', title):
+            return True
+    return False
@@ -0,0 +1,185 @@
+"""
+Cache of pre-tokenized dataset lines for generation prompts.
+
+Token ids for every line of a dataset file are stored in a memory-mapped
+int32 array with an offsets index, next to the dataset file and keyed by
+a hash of the tokenizer vocab:
+    <dataset>.<vocab_hash>.ids.npy
+    <dataset>.<vocab_hash>.offsets.npy
+    <dataset>.<vocab_hash>.meta.json
+
+Prompts are usually a dataset line cut off after a special token
+(e.g. everything up to <endofings> or <target:vegan>). Special tokens are
+split off before BPE, so those prompts are a prefix of the line's token ids
+and can be served from the cache too.
+
+To build a cache:
+    python token_cache.py --model_name_or_path <model> next_step_test1k.txt ...
+"""
+import argparse
+import os
+import re
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+def vocab_hash(tokenizer):
+    """Hash everything that decides how text is split into token ids."""
+    vocab = dict(getattr(tokenizer, 'encoder', {}))
+    vocab.update(tokenizer.added_tokens_encoder)
+    merges = sorted(getattr(tokenizer, 'bpe_ranks', {}).items(), key=lambda x: x[1])
+    digest = hashlib.sha1(type(tokenizer).__name__.encode('utf8'))
+    digest.update(json.dumps(sorted(vocab.items()), ensure_ascii=False).encode('utf8'))
+    digest.update(json.dumps([' '.join(pair) for pair, _ in merges], ensure_ascii=False).encode('utf8'))
+    return digest.hexdigest()[:16]
+
+
+def cache_paths(dataset_path, tokenizer_hash):
+    prefix = dataset_path + '.' + tokenizer_hash
+    return {'ids': prefix + '.ids.npy',
+            'offsets': prefix + '.offsets.npy',
+            'meta': prefix + '.meta.json'}
+
+
+def read_dataset_lines(dataset_path):
+    """Read lines the same way generate_from_models does."""
+    with open(dataset_path, 'r', encoding='utf-8', errors='ignore') as f:
+        return [x.strip() for x in f.readlines()]
+
+
+def dataset_signature(dataset_path):
+    stat = os.stat(dataset_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def build_token_cache(dataset_path, tokenizer):
+    """Tokenize every line of a dataset file and write the cache."""
+    lines = read_dataset_lines(dataset_path)
+    encoded = [tokenizer.encode(line, add_special_tokens=False) for line in lines]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(ids) for ids in encoded])
+
+    paths = cache_paths(dataset_path, vocab_hash(tokenizer))
+    ids = np.lib.format.open_memmap(paths['ids'], mode='w+', dtype=np.int32,
+                                    shape=(int(offsets[-1]),))
+    for i, line_ids in enumerate(encoded):
+        ids[offsets[i]:offsets[i+1]] = line_ids
+    ids.flush()
+    del ids
+    np.save(paths['offsets'], offsets)
+
+    meta = dataset_signature(dataset_path)
+    meta['num_lines'] = len(lines)
+    with open(paths['meta'], 'w') as f:
+        json.dump(meta, f)
+    return paths
+
+
+class TokenCache(object):
+    """Look up token ids for dataset lines, or prefixes of dataset lines
+    that end with a special token, from a memory-mapped cache."""
+    def __init__(self, dataset_path, tokenizer):
+        paths = cache_paths(dataset_path, vocab_hash(tokenizer))
+        self.ids = np.load(paths['ids'], mmap_mode='r')
+        self.offsets = np.load(paths['offsets'])
+        self.lines = read_dataset_lines(dataset_path)
+
+        # special tokens have the highest ids (see shorten_prompt)
+        self.special_token_cutoff = tokenizer.convert_tokens_to_ids(
+            tokenizer.tokenize(tokenizer.eos_token))[0]
+        special_tokens = set(tokenizer.all_special_tokens) | set(tokenizer.added_tokens_encoder)
+        special_tokens = sorted(special_tokens, key=len, reverse=True)
+        self.special_token_re = re.compile('|'.join(re.escape(t) for t in special_tokens))
+
+        # map each prompt this line can produce to (line, number of tokens)
+        self.prompts = {}
+        for i, line in enumerate(self.lines):
+            self.prompts[line] = (i, int(self.offsets[i+1] - self.offsets[i]))
+            line_ids = self.ids[self.offsets[i]:self.offsets[i+1]]
+            special_positions = np.flatnonzero(line_ids >= self.special_token_cutoff)
+            special_ends = [m.end() for m in self.special_token_re.finditer(line)]
+            if len(special_positions) != len(special_ends):
+                continue
+            for end, position in zip(special_ends, special_positions):
+                self.prompts.setdefault(line[:end], (i, int(position) + 1))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def get(self, prompt):
+        """Return the token ids for a prompt, or None if it isn't cached."""
+        # the tokenizer rstrips text around special tokens,
+        # so trailing whitespace never adds tokens
+        key = prompt.rstrip()
+        if key not in self.prompts:
+            return None
+        line_num, num_tokens = self.prompts[key]
+        start = self.offsets[line_num]
+        return self.ids[start:start + num_tokens].tolist()
+
+
+# loaded caches kept per tokenizer
+MAX_TOKEN_CACHES = 8
+
+
+def loaded_vocab_hash(tokenizer):
+    """vocab_hash, kept on the tokenizer and only computed again if tokens were added."""
+    vocab_size, tokenizer_hash = getattr(tokenizer, 'loaded_vocab_hash', (None, None))
+    if vocab_size != len(tokenizer):
+        tokenizer_hash = vocab_hash(tokenizer)
+        tokenizer.loaded_vocab_hash = (len(tokenizer), tokenizer_hash)
+    return tokenizer_hash
+
+
+def load_token_cache(dataset_path, tokenizer):
+    """Load the cache for a dataset file if it was built for this tokenizer
+    and the file hasn't changed since. Returns None otherwise.
+
+    Tokenizers are reused between calls (see model_registry.py), so the
+    last MAX_TOKEN_CACHES caches loaded are kept on the tokenizer and
+    freed along with it."""
+    tokenizer_hash = loaded_vocab_hash(tokenizer)
+    if not hasattr(tokenizer, 'token_caches'):
+        tokenizer.token_caches = OrderedDict()
+    token_caches = tokenizer.token_caches
+    key = (os.path.abspath(dataset_path), tokenizer_hash)
+    if key in token_caches:
+        token_caches.move_to_end(key)
+        return token_caches[key]
+
+    token_cache = None
+    paths = cache_paths(dataset_path, tokenizer_hash)
+    if os.path.isfile(paths['meta']) and os.path.isfile(dataset_path):
+        with open(paths['meta']) as f:
+            meta = json.load(f)
+        signature = dataset_signature(dataset_path)
+        if meta['size'] == signature['size'] and meta['mtime'] == signature['mtime']:
+            token_cache = TokenCache(dataset_path, tokenizer)
+            logger.info('Loaded token cache for ' + dataset_path)
+        else:
+            logger.info('Token cache for ' + dataset_path + ' is out of date')
+    token_caches[key] = token_cache
+    if len(token_caches) > MAX_TOKEN_CACHES:
+        token_caches.popitem(last=False)
+    return token_cache
+
+
+if __name__ == '__main__':
+    from run_generation_batch import load_tokenizer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_type", default='gpt2', type=str)
+    parser.add_argument("--model_name_or_path", default=None, type=str, required=True)
+    parser.add_argument("dataset_paths", nargs='+', type=str)
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer(args.model_type, args.model_name_or_path)
+    for dataset_path in args.dataset_paths:
+        paths = build_token_cache(dataset_path, tokenizer)
+        print('Wrote', paths['ids'])
@@ -11,27 +11,45 @@ Format:
 N-1) stop before last instruction so you always have ingredients to predict
     (so there will never be an <endofinst> tag)
 """
+import argparse
 import time
 import json
 import random
+from itertools import tee
 
-from match_utils import get_matches
+from match_utils import get_matches_many, load_lemma_cache, save_lemma_cache
+from dataset_utils import write_examples, external_shuffle, \
+    PrefixRecipeWriter, make_index_record
 
 
-set_type = 'test'
+parser = argparse.ArgumentParser()
+parser.add_argument("--set", default='test', type=str)
+parser.add_argument("--workers", default=1, type=int, help="Number of processes for ingredient matching")
+parser.add_argument("--chunksize", default=16, type=int, help="Recipes sent to a worker at a time")
+parser.add_argument("--stream", action="store_true", help="Write examples while reading recipes instead of holding them in memory")
+parser.add_argument("--format", default='text', choices=['text', 'prefix'],
+                    help="prefix stores each recipe once with an index of examples (see dataset_utils)")
+parser.add_argument("--shard_size", default=1000000, type=int, help="Examples per on-disk shard when shuffling in --stream mode")
+args = parser.parse_args()
+
+set_type = args.set
 data_path = '/sample_data/'
 clean_path = data_path + 'random_order_clean_' + set_type + '.jl'
-outfile_path = data_path + 'next_ing_title_' + set_type + '.txt'
-id_path = data_path + 'next_ing_title_' + set_type + '_ids.tsv'
+base_path = data_path + 'next_ing_title_' + set_type
+outfile_path = base_path + '.txt'
+id_path = base_path + '_ids.tsv'
+lemma_cache_path = data_path + 'lemma_cache.json'
 
 random.seed(0)
 
 print(set_type)
+load_lemma_cache(lemma_cache_path)
 skipped = 0
-examples = []
-ids = []
-with open(clean_path, 'r') as infile:
-    start = time.time()
+
+
+def read_recipes(infile):
+    """Yield recipes that have ingredients and at least two instructions."""
+    global skipped
     for line in infile:
         line = json.loads(line)
 
@@ -43,51 +61,78 @@ with open(clean_path, 'r') as infile:
             skipped += 1
             continue
 
+        yield line
+
+
+def make_examples(recipes, recipe_writer=None):
+    """Yield (example, id) pairs for each instruction of each recipe.
+    With a recipe_writer, each recipe is stored once and the examples
+    are prefix-sharing index records instead of text."""
+    recipes, recipes_to_match = tee(recipes)
+    # get list of next ingredients for each example
+    all_next_ingredients = get_matches_many(recipes_to_match,
+                                            workers=args.workers,
+                                            chunksize=args.chunksize,
+                                            lemma_cache_path=lemma_cache_path)
+    for line, next_ingredients in zip(recipes, all_next_ingredients):
         name = line['name']
         data = '<|startoftext|> ' + name + ' <endoftitle> '
         data += ' <ing> '.join(line['recipeIngredient']) + ' <endofings> '
-
-        # get list of next ingredients for each example
-        next_ingredients = get_matches(instructions=line['recipeInstructions'],
-                                       ingredients=line['recipeIngredient'],
-                                       title=line['name'])
+        if recipe_writer:
+            recipe_offset = recipe_writer.write(data, line['recipeInstructions'])
 
         # make examples for each instruction except the last
         for i, next_ings in enumerate(next_ingredients):
-            inst_data = data + ' <inst> '.join(line['recipeInstructions'][:i])
-            inst_data += ' <endofinst> '
+            target = ' <endofinst> '
 
             # add ingredients in next step
             if next_ings:
                 next_ings = ' <ing> '.join(next_ings)
-                inst_data += next_ings + ' '
+                target += next_ings + ' '
             else:
-                inst_data += '<noings> '
+                target += '<noings> '
 
-            inst_data += '<|endoftext|>'
-            inst_data = ' '.join(inst_data.split())
-            examples.append(inst_data)
+            target += '<|endoftext|>'
 
             id_text = line['id'] + '\t' + str(i)
-            ids.append(id_text)
+            if recipe_writer:
+                yield make_index_record(recipe_offset, i, target), id_text
+            else:
+                inst_data = data + ' <inst> '.join(line['recipeInstructions'][:i])
+                inst_data += target
+                inst_data = ' '.join(inst_data.split())
+                yield inst_data, id_text
+
+
+if args.format == 'prefix':
+    recipe_writer = PrefixRecipeWriter(base_path, normalize=True)
+    outfile_path = recipe_writer.paths['index']
+else:
+    recipe_writer = None
+
+with open(clean_path, 'r') as infile:
+    start = time.time()
+    pairs = make_examples(read_recipes(infile), recipe_writer)
+    if args.stream:
+        # write examples while reading recipes
+        if set_type == 'train':
+            total = external_shuffle(pairs, outfile_path, id_path, rng=random,
+                                     shard_size=args.shard_size)
+        else:
+            total = write_examples(pairs, outfile_path, id_path)
+    else:
+        pairs = list(pairs)
+        total = len(pairs)
+
+if recipe_writer:
+    recipe_writer.close()
+save_lemma_cache(lemma_cache_path)
 
 print('Skipped:', skipped)
-print('Total examples:', len(examples))
+print('Total examples:', total)
 print(time.time() - start)
 
-if set_type == 'train':
-    combo = list(zip(examples, ids))
-    random.shuffle(combo)
-    examples, ids = zip(*combo)
-
-with open(outfile_path, 'w', encoding='utf8') as outfile, \
-     open(id_path, 'w', encoding='utf8') as idfile:
-    first_item_flag = True
-    for i, example in enumerate(examples):
-        if first_item_flag:
-            first_item_flag = False
-        else:
-            outfile.write('\n')
-            idfile.write('\n')
-        outfile.write(example)
-        idfile.write(ids[i])
+if not args.stream:
+    if set_type == 'train':
+        random.shuffle(pairs)
+    write_examples(pairs, outfile_path, id_path)
@@ -12,11 +12,15 @@ import argparse
 import json
 import random
 
+from dataset_utils import write_examples, PrefixRecipeWriter, make_index_record
+
 
 random.seed(0)
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--set", default='test', type=str)
+parser.add_argument("--format", default='text', choices=['text', 'prefix'],
+                    help="prefix stores each recipe once with an index of examples (see dataset_utils)")
 args = parser.parse_args()
 
 if args.set == 'tune1k':
@@ -28,8 +32,9 @@ else:
 
 data_path = '/sample_data/'
 clean_path = data_path + 'random_order_clean_' + set_file + '.jl'
-outfile_path = data_path + 'next_step_' + args.set + '.txt'
-id_path = data_path + 'next_step_' + args.set + '_ids.tsv'
+base_path = data_path + 'next_step_' + args.set
+outfile_path = base_path + '.txt'
+id_path = base_path + '_ids.tsv'
 
 if args.set == 'tune1k':
     with open('tune1k_recipe_ids.txt') as f:
@@ -41,8 +46,13 @@ if args.set == 'test1k':
     ids_to_keep = [i.strip() for i in ids_to_keep]
 
 print(args.set)
+if args.format == 'prefix':
+    recipe_writer = PrefixRecipeWriter(base_path)
+    outfile_path = recipe_writer.paths['index']
+else:
+    recipe_writer = None
+
 examples = []
-ids = []
 with open(clean_path, 'r') as infile:
     for line in infile:
         line = json.loads(line)
@@ -54,35 +64,31 @@ with open(clean_path, 'r') as infile:
         name = line['name']
         data = '<|startoftext|> ' + name + ' <endoftitle> '
         data += ' <ing> '.join(line['recipeIngredient']) + ' <endofings> '
+        if recipe_writer:
+            recipe_offset = recipe_writer.write(data, line['recipeInstructions'])
 
         # iterate through including 1...n instructions
         for i in range(len(line['recipeInstructions'])):
-            inst_data = data + ' <inst> '.join(line['recipeInstructions'][:i+1])
-
             # only add <endofinst> tag after last instruction
+            target = ''
             if i+1 == len(line['recipeInstructions']):
-                inst_data += ' <endofinst>'
-            inst_data += ' <|endoftext|>'
-            examples.append(inst_data)
+                target += ' <endofinst>'
+            target += ' <|endoftext|>'
 
             id_text = line['id'] + '\t' + str(i)
-            ids.append(id_text)
+            if recipe_writer:
+                examples.append((make_index_record(recipe_offset, i+1, target), id_text))
+            else:
+                inst_data = data + ' <inst> '.join(line['recipeInstructions'][:i+1])
+                inst_data += target
+                examples.append((inst_data, id_text))
+
+if recipe_writer:
+    recipe_writer.close()
 
 print('Total examples:', len(examples))
 
 if args.set == 'train':
-    combo = list(zip(examples, ids))
-    random.shuffle(combo)
-    examples, ids = zip(*combo)
-
-with open(outfile_path, 'w', encoding='utf8') as outfile, \
-     open(id_path, 'w', encoding='utf8') as idfile:
-    first_item_flag = True
-    for i, example in enumerate(examples):
-        if first_item_flag:
-            first_item_flag = False
-        else:
-            outfile.write('\n')
-            idfile.write('\n')
-        outfile.write(example)
-        idfile.write(ids[i])
+    random.shuffle(examples)
+
+write_examples(examples, outfile_path, id_path)
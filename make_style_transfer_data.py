@@ -10,15 +10,13 @@ Instruction1 <inst> Instruction2 <endofinst>
 
 import argparse
 import time
-import os
 from pathlib import Path
 import sys
-import re
 import csv
 import random
-import pickle
 import linecache
 import json
+import hashlib
 import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import CountVectorizer
@@ -26,8 +24,11 @@ from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
 from collections import Counter
 
-from match_utils import get_matches
+from match_utils import get_matches, load_lemma_cache, save_lemma_cache
 from data_cleaning.clean_utils import clean_flat_instructions
+from evaluation.tag_matcher import TagMatcher, tag_in_title
+from evaluation.alignment_store import load_alignment_store
+from recipe_store import STORE_PATH, load_recipe_store, site_of
 
 pd.options.mode.chained_assignment = None
 
@@ -43,6 +44,8 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--split", default=None, type=int, help="Number of sections to split the data in")
 parser.add_argument("--part", default=None, type=int, help="Which section to process on this run")
 parser.add_argument("--set", default='train', type=str)
+parser.add_argument("--num_workers", default=None, type=int, help="Processes for parsing the clean recipe files, defaults to the number of cores")
+parser.add_argument("--tag_cache", action='store_true', help="Cache rule-based tag verdicts per recipe next to the clean recipe data")
 args = parser.parse_args()
 
 if args.set == 'human':
@@ -73,35 +76,20 @@ elif args.set == 'test1k':
 else:
     set_path = args.set
 aligned_data_path += set_path + '/text-text-alignments'
-aligned_data = []
-dish_names = []
-for f in sorted(os.listdir(aligned_data_path)):
-    if args.set == 'human':
-        if f in dish_list:
-            data = pickle.load(open(os.path.join(aligned_data_path, f), 'rb'))
-            aligned_data.append(data)
-            dish_names.append(f.replace('.pkl', ''))
-    else:
-        data = pickle.load(open(os.path.join(aligned_data_path, f), 'rb'))
-        aligned_data.append(data)
-        dish_names.append(f.replace('.pkl', ''))
+# read only the alignments needed for this set from the columnar store
+# (rows for the reverse direction are kept too, they're used for references below)
+store = load_alignment_store(aligned_data_path)
+recipe_ids_to_load = None
+files_to_load = None
+if args.set == 'human':
+    recipe_ids_to_load = set(i for ids in id_list for i in ids)
+    files_to_load = dish_list
+elif args.set in ['tune1k', 'test1k']:
+    with open(args.set + '_recipe_ids.txt') as f:
+        recipe_ids_to_load = set(i.strip() for i in f.readlines())
 
 print('Parsing aligned pair data into dataframe')
-# format: [recipe_id1, recipe_id2, step_idx1, step_idx2, step1, step2, probability]
-pairs = []
-for d, dish in enumerate(aligned_data):
-    for recipe in dish:
-        dish_name = dish_names[d]
-        recipe_id1 = recipe['recipe_url']
-        recipe_id2 = recipe['video_id']
-        for i in range(len(recipe['annotation_indices'])):
-            step_idx1 = recipe['annotation_indices'][i]
-            step_idx2 = recipe['transcript_indices'][i]
-            step1 = recipe['annotation_segments'][i]
-            step2 = recipe['transcript_segments'][i]
-            probability = recipe['alignment_sent_probabilities'][i]
-            pairs.append([dish_name, recipe_id1, recipe_id2, step_idx1, step_idx2, step1, step2, probability])
-pairs = pd.DataFrame(pairs, columns=['dish_name', 'recipe_id1', 'recipe_id2', 'step_idx1', 'step_idx2', 'step1', 'step2', 'probability'])
+pairs = store.pairs(store.select(recipe_ids=recipe_ids_to_load, files=files_to_load))
 original_pairs = pairs.copy()
 print('Dataframe length', len(pairs))
 
@@ -132,85 +120,44 @@ if args.split:
     print('Running part', str(args.part))
     print('Size', len(pairs))
 
-# cache the necessary clean recipe data
-idlist = pairs['recipe_id1'].append(pairs['recipe_id2']).values
-sitelist = [x.split('_')[0] for x in idlist]
+# look up the clean recipe data for the recipes in pairs
+idlist = pd.concat([pairs['recipe_id1'], pairs['recipe_id2']]).values
+sitelist = [site_of(x) for x in idlist]
 sitelist = list(set(sitelist))
-clean_recipe_data_path = Path('/sample_data/clean_recipe_data.json')
-if clean_recipe_data_path.is_file():
-    print('Loading clean recipe data')
-    with open(clean_recipe_data_path, 'r') as infile:
-        clean_recipe_data = json.load(infile)
-else:
-    print('Caching clean recipe data')
-    clean_recipe_data = {}
-    for site in sitelist:
-        site_clean = site.replace('commoncrawl', 'commoncrawl_recipes_dataset')
-        recipe_data_path = '/sample_data/' + site_clean + '_clean_recipe.jl'
-        with open(recipe_data_path, 'r', encoding='utf8') as f:
-            for line in f:
-                line = json.loads(line)
-                required_fields = ['id', 'name', 'recipeIngredient',
-                                   'recipeInstructions', 'tags']
-                if any([k not in line for k in required_fields]):
-                    continue
-                new_line = {}
-                new_line['name'] = line['name']
-                new_line['recipeIngredient'] = line['recipeIngredient']
-                new_line['recipeInstructions'] = line['recipeInstructions']
-                new_line['tags'] = line['tags']
-                clean_recipe_data[line['id']] = new_line
-    with open(clean_recipe_data_path, 'w') as outfile:
-        json.dump(clean_recipe_data, outfile)
+recipe_store_path = Path(STORE_PATH)
+print('Loading clean recipe data')
+recipe_store = load_recipe_store(recipe_store_path, sitelist, num_workers=args.num_workers)
+clean_recipe_data = recipe_store.get_many(idlist)
+print('Found', len(clean_recipe_data), 'recipes')
 
 print('Adding recipe data for each recipe_id')
+def recipe_columns(recipe):
+    """Instructions, ingredients, title and tags of a clean recipe (None if it wasn't found)."""
+    if recipe is None:
+        return [], [], '', []
+    title = recipe.get('name', '')
+    if isinstance(title, list):
+        title = title[0]
+    elif not isinstance(title, str):
+        title = ''
+    return (recipe.get('recipeInstructions', []), recipe.get('recipeIngredient', []),
+            title, recipe.get('tags', []))
+
 def add_recipe_data(recipe_ids, column_suffix):
     colnames = ['instructions' + column_suffix,
                 'ingredients' + column_suffix,
                 'title' + column_suffix,
                 'tags' + column_suffix]
-    new_data = {c: [] for c in colnames}
-
-    # add recipe data from cleaned files
-    for recipe_id in recipe_ids:
-        try:
-            line = clean_recipe_data[recipe_id]
-        except:
-            print('FAILED TO FIND', recipe_id, 'IN CLEAN DATA')
-            new_data['instructions' + column_suffix].append([])
-            new_data['ingredients' + column_suffix].append([])
-            new_data['title' + column_suffix].append('')
-            new_data['tags' + column_suffix].append([])
-            continue
-
-        if 'recipeInstructions' in line:
-            new_data['instructions' + column_suffix].append(
-                line['recipeInstructions'])
-        else:
-            new_data['instructions' + column_suffix].append([])
-
-        if 'recipeIngredient' in line:
-            new_data['ingredients' + column_suffix].append(
-                line['recipeIngredient'])
-        else:
-            new_data['ingredients' + column_suffix].append([])
-
-        if 'name' in line:
-            if isinstance(line['name'], str):
-                new_data['title' + column_suffix].append(
-                    line['name'])
-            elif isinstance(line['name'], list):
-                new_data['title' + column_suffix].append(
-                    line['name'][0])
-        else:
-            new_data['title' + column_suffix].append('')
 
-        if 'tags' in line:
-            new_data['tags' + column_suffix].append(
-                line['tags'])
-        else:
-            new_data['tags' + column_suffix].append([])
-    return new_data
+    # pairs has a row per aligned step, so look up each recipe once
+    # and copy its data to every row with take
+    codes, unique_ids = pd.factorize(recipe_ids)
+    recipes = [clean_recipe_data.get(recipe_id) for recipe_id in unique_ids]
+    missing = [recipe_id for recipe_id, recipe in zip(unique_ids, recipes) if recipe is None]
+    if missing:
+        print('FAILED TO FIND', len(missing), 'of', len(unique_ids), 'recipe_ids IN CLEAN DATA, e.g.', missing[:5])
+    recipe_data = pd.DataFrame([recipe_columns(recipe) for recipe in recipes], columns=colnames, dtype=object)
+    return {c: recipe_data[c].take(codes).tolist() for c in colnames}
 
 pairs = pairs.assign(**add_recipe_data(pairs['recipe_id1'], '1'))
 pairs = pairs.assign(**add_recipe_data(pairs['recipe_id2'], '2'))
@@ -236,18 +183,18 @@ if args.set != 'train':
     all_steps['ref_type'] = np.where(all_steps['probability'].isnull(), 'uniform', 'aligned')
     all_steps['probability'] = all_steps['probability'].fillna(0)
 
-    # assign aligned reference/target step_id from the reverse direction in alignment data
-    # one recipe_id1 at a time
-    # filter original_pairs on that recipe_id as recipe_id2 and target as 1 and get the steps in order
-    # assign those steps to the ids at the location with that recipe_id and step_id
-    def assign_correct_reference(row):
-        # get the step idx of the match in the reverse pair from the original alignment data
-        step_id = original_pairs[(original_pairs['recipe_id2'] == row['recipe_id1']) & \
-            (original_pairs['recipe_id1'] == row['recipe_id2']) & \
-            (original_pairs['step_idx2'] == row['step_idx1'])]['step_idx1'].iloc[0]
-        row['step_idx2'] = step_id
-        return row
-    all_steps = all_steps.apply(assign_correct_reference, axis=1)
+    # assign aligned reference/target step_id from the reverse direction in alignment data:
+    # index the original alignments by (recipe_id2, recipe_id1, step_idx2), keeping the
+    # first match like a filter would, and look up every step with one join
+    reverse_steps = original_pairs[['recipe_id1', 'recipe_id2', 'step_idx1', 'step_idx2']]\
+        .drop_duplicates(subset=['recipe_id1', 'recipe_id2', 'step_idx2'])\
+        .rename(columns={'recipe_id1': 'recipe_id2', 'recipe_id2': 'recipe_id1',
+                         'step_idx2': 'step_idx1', 'step_idx1': 'reverse_step_idx'})
+    all_steps = all_steps.merge(reverse_steps, on=['recipe_id1', 'recipe_id2', 'step_idx1'], how='left')
+    if all_steps['reverse_step_idx'].isnull().any():
+        raise ValueError(str(all_steps['reverse_step_idx'].isnull().sum()) +
+                         ' steps have no alignment in the reverse direction')
+    all_steps['step_idx2'] = all_steps.pop('reverse_step_idx')
 
     pairs = all_steps
 
@@ -311,451 +258,451 @@ for tag in tags:
     pairs[tag + '2'] = 0
 
 # clean up tags with rule-based method
-def clean_tag(row, num, tag):
-    """Given a tag, make sure the recipe is tagged correctly
-    based on a word list for that tag."""
-    # https://en.wikipedia.org/wiki/List_of_types_of_seafood
-    shellfish_words = ['shellfish', 'crab', 'crayfish', 'langostino',
-                       'lobster', 'shrimp', 'prawn', 'cockle',
-                       'cuttlefish', 'clam', 'mussel', 'octopus',
-                       'oyster', 'periwinkle', 'scallop', 'squid', 'calamari',
-                       'conch', 'snail', 'escargot', 'nautilus', 'crawfish',
-                       'crawdad', 'abalone', 'geoduck', 'barnacle', 'krill',
-                       'limpet', 'urchin', 'sea cucumber', 'whelk']
-    # https://en.wikipedia.org/wiki/List_of_types_of_seafood
-    fish_words = shellfish_words + \
-        ['fish', 'seafood', 'anchov', 'barracuda', 'bass',
-         'bream', 'brill', 'cod', 'dorade', 'eel', 'flounder',
-         'grouper', 'haddock', ' hake', 'halibut', 'mahi',
-         'herring', 'ilish', 'john dory', 'lamprey',
-         'mackerel', 'mullet', 'perch', 'pike', 'pilchard',
-         'pollock', 'pomfret', 'pompano', 'roughy', 'salmon', 'lox',
-         'sanddab', 'sardine', 'shad ', 'shark', 'skate wing', 'skatewing',
-         'smelt', 'snakehead', 'snapper', ' sole ', 'sprat', 'sturgeon',
-         'surimi', 'tilapia', 'trout', 'tuna', 'turbot', 'whiting',
-         'whitebait', 'caviar', ' roe', 'ikura', 'kazunoko', 'masago',
-         'tobiko', 'dolphin', 'whale', 'arctic char', 'yellowtail',
-         'poke ', 'unagi', 'maguro', 'katsuo', 'hamachi', 'kurodai',
-         'hata ', 'ohyou', 'saba ', 'tako', ' ika ', ' ebi ', 'kani ',
-         ' uni ', 'mirugai', 'awabi', 'porgy', 'branzino', 'fluke',
-         'albacore', 'escolar', 'worcestershire', 'worscestershire',
-         'caesar', 'bouillabaisse']
-    meat_words = fish_words + \
-        ['meat', 'jerky', 'poultry', 'chicken', 'foie gras',
-         'lamb', 'goat', 'mutton',  'cornish hen',
-         # https://en.wikipedia.org/wiki/List_of_steak_dishes
-         'beef', 'asado', 'bulgogi', 'carne asada', 'filet mignon',
-         'ribs', 'rib-eye', 'rib eye', 'ribeye', 'rib steak',
-         'rib roast', 'sirloin', 'tenderloin', 'flank steak',
-         'tri-tip', 'tri tip', 'prime rib', 'ground round',
-         't-bone', 't bone', 'tbone', 'strip steak', 'ground chuck',
-         'skirt steak', 'hanger steak', 'chateaubriand',
-         'flat iron steak', 'flat-iron steak', 'flatiron steak',
-         'rump steak', 'new york strip', 'ny strip',
-         'beef shank', 'round steak', 'porterhouse steak',
-         'brisket', 'veal', 'burger', 'pastrami',
-         # https://en.wikipedia.org/wiki/Game_(hunting)
-         'alligator', 'bullfrog', 'turtle', 'snake', 'crow',
-         'grouse', 'pheasant', 'fowl', 'quail', 'woodcock', 'mourning dove',
-         'duck', 'puffin', 'goose', 'partridge', 'pigeon', 'turkey',
-         'bison', 'sheep', 'deer', 'venison', 'elk', 'moose', 'pronghorn',
-         'reindeer', 'boar', 'muskrat', 'hare', 'rabbit', 'opossum',
-         'buffalo',
-         # https://en.wikipedia.org/wiki/List_of_hams
-         'pork', 'ham', 'suckling', 'bacon', 'prosciutto',
-         'pig ', "pigs'", "pig's", 'pancetta',
-         # https://en.wikipedia.org/wiki/List_of_sausages
-         'sausage', 'banger', 'hot dog', 'hotdog', 'hot-dog', 'corn dog',
-         'wiener', 'frankfurter', 'chorizo', 'andouille', 'wurst',
-         'black pudding', 'white pudding', 'salami', 'mortadella',
-         'soppressata', 'kielbasa', 'chipolata', 'hogs pudding',
-         "hog's pudding", 'haggis', 'suet', 'boudin', 'chaudin',
-         'goetta', 'hog maw', 'hot link', 'bologna', 'pepperoni',
-         # https://en.wikipedia.org/wiki/Offal
-         'chitterlings', 'liver', 'lung', 'trotters', 'spleen',
-         'pancreas', 'tongue', 'tripe', 'intestines', 'hooves',
-         'sweetbread', 'gizzard', 'placenta']
-    # https://en.wikipedia.org/wiki/List_of_dairy_products
-    # https://en.wikipedia.org/wiki/Dairy_product
-    dairy_words = ['buffalo curd', 'butter', 'casein', 'cheese', 'cream',
-                   'creme', 'crème', 'curd', 'custard', 'dulce de leche',
-                   'doogh', 'eggnog', 'fromage', 'gelato', 'ghee',
-                   'lassi', 'milk', 'sarasson', 'semifreddo', 'whey',
-                   'yogurt', 'raita', 'malai', 'khoa', 'clabber', 'kefir',
-                   'smetana', 'junket',
-                   # https://en.wikipedia.org/wiki/List_of_cheeses
-                   'halloumi', 'havarti', 'cheddar', 'stilton', 'feta ', 'feta,',
-                   'camembert', 'queso', 'crema', 'colby', 'humboldt fog',
-                   'monterey jack', 'muenster', 'pepper jack', 'pepperjack',
-                   'pepper-jack', 'provolone', 'parmesan', 'parmigian',
-                   'reggiano', 'reggianito', 'pecorino', 'manchego', 'bleu',
-                   'roquefort', 'gorgonzola', 'cheshire', 'edam ', 'edam,',
-                   'gouda', 'mozzarella', 'gruyere', 'gruyère', 'feta', 'ricotta',
-                   'paneer', 'chevre', 'chèvre', 'mascarpone', 'burrata',
-                   'brie', 'jarlsberg', 'limburger', 'munster', 'fontina',
-                   'emmental', 'grana padano', 'reddi-wip', 'reddi-whip',
-                   'cool whip', 'cool-whip', 'velveeta', 'kraft singles',
-                   'cheez whiz', 'cheezwhiz', 'cheez-its', 'cheezits',
-                   'gogurt', 'go-gurt', 'babybel']
-    # https://en.wikipedia.org/wiki/List_of_egg_dishes
-    egg_words = ['egg', 'omelette', 'carbonara', 'croque madame',
-                 'french toast', 'frittata', 'huevos', 'loco moco',
-                 'matza brei', 'one eyed jack', 'quiche', 'rafanata',
-                 'shakshouka', 'souffle', 'soufflé', 'stracciatella',
-                 'stratta', 'custard', ' ovos', 'meringue', 'pavlova',
-                 'hamburger', 'mayo']
-    # https://en.wikipedia.org/wiki/List_of_alcoholic_drinks
-    # https://en.wikipedia.org/wiki/List_of_liqueurs
-    alcohol_words = ['alcohol', 'gin', 'whiskey', 'whisky', 'bourbon',
-                     'moonshine', 'vodka', 'beer', 'hard cider', 'wine',
-                     'brandy', 'cognac', 'vermouth', 'tequila', 'mezcal',
-                     'rum', 'mead', 'liquor', 'liqueur',
-                     'ale', 'pale ale', 'lager', 'pilsener', 'pilsner',
-                     'porter', 'stout', 'madeira', 'marsala', 'sherry',
-                     'sangria', 'champagne', 'absinthe', 'schnapps',
-                     'kahlua', 'kahlúa', 'st-germain', 'st germain',
-                     'st. germain', 'cointreau', 'curacao', 'curaçao',
-                     'amaretto', 'frangelico', 'jack daniels', 'prosecco',
-                     'cava', 'chablis', 'lillet', 'dubonnet', 'ouzo',
-                     'aperol', 'pernod', 'pastis', 'martini', 'sambuca',
-                     'chartreuse', 'limoncello', 'akvavit', 'black russian',
-                     'rusty nail', 'bitters ', 'bitters,', 'margarita',
-                     'irish coffee', 'mojito', 'moscow mule', 'gin mule',
-                     'long island iced tea', 'vesper', 'cosmo ', 'cosmo,',
-                     'cosmopolitan', 'sidecar', 'pina colada', 'piña colada',
-                     'gimlet', 'boulevardier', 'bloody mary', 'sazerac',
-                     'manhattan', 'daiquiri', 'negroni', 'bellini',
-                     "jack daniel's", 'jim beam', 'southern comfort',
-                     'yukon jack', 'drambuie', 'campari', 'triple sec',
-                     'baileys irish cream', "bailey's irish cream", 'baileys',
-                     'creme de menthe', 'crème de menthe',
-                     'creme de banane', 'crème de banane', 'de cacao',
-                     'de cassis', 'de cerise', 'de noyaux', 'de violette',
-                     'creme yvette', 'crème yvette', 'smirnoff',
-                     'pimms', "pimm's", 'tanqueray', 'jenever', 'genever',
-                     'johnnie walker', 'johnny walker', 'makers mark',
-                     "maker's mark", 'ketel one', 'grey goose', 'gray goose',
-                     ' titos', "tito's", 'absolut', 'stolichnaya',
-                     'hangar 1', 'hangar one', 'three olives', 'stella rosa',
-                     'korbel', 'brut', 'jose cuervo', 'captain morgan',
-                     'bacardi', 'svedka', 'patrón', 'jagermeister',
-                     'jägermeister', 'grand marnier', 'mirin',
-                     # https://en.wikipedia.org/wiki/Lists_of_wines
-                     'dom perignon', 'dom pérignon', 'rosé', 'cabernet',
-                     'carignan', 'malbec', 'merlot', 'pinot', 'sangiovese',
-                     'syrah', 'zinfandel', 'chardonnay', 'sauvignon',
-                     'semillon', 'moscato', 'muscat', 'riesling',
-                     'gewurztraminer', 'gewürztraminer', 'viognier',
-                     'cortese', 'barefoot', 'cocchi americano', 'chianti',
-                     # https://en.wikipedia.org/wiki/List_of_beer_styles
-                     'hefeweizen', 'pale ale', 'lambic', ' porter',
-                     'angry orchard', 'ballast point', 'blue moon',
-                     'budweiser', 'coors', 'corona', 'dogfish head',
-                     'dos equis', 'firestone walker', 'goose island',
-                     'guinness', 'heineken', 'lagunitas', 'michelob',
-                     'mikes hard', "mike's hard", 'modelo', 'sam adams',
-                     'samuel adams', 'sierra nevada', 'stella artois',
-                     'yuengling', 'pbr', 'pabst', 'ipa', 'miller lite',
-                     'colt 45',
-                     # https://en.wikipedia.org/wiki/List_of_cider_brands
-                     'ace cider', 'arsenal cider', 'aspall cider',
-                     'bantam cider', 'blackthorn cider', 'bold rock hard cider',
-                     'brothers cider', 'bulmers', 'burrow hill cider',
-                     'carling cider', 'ciderboys', 'cidergeist', 'crispin cider',
-                     'downeast cider', 'fox barrel cider', 'frosty jack cider',
-                     'gaymer cider', 'herrljunga cider', 'kingstone press cider',
-                     'magners irish cider', 'somersby cider', 'stowford press',
-                     'strongbow cider', 'taunton cider', 'thatchers cider',
-                     'woodchuck cider', 'woodchuck hard cider',
-                     'woodpecker cider']
-    # https://en.wikipedia.org/wiki/List_of_culinary_nuts
-    nut_words = ['nut', 'acorn', 'almond', 'beech', 'cashew', 'filbert',
-                 'hickory', 'pecan', 'pistachio', 'praline', 'macadamia',
-                 'marzipan', 'nougat', 'amaretto', 'disaronno', 'frangelico',
-                 'nocello', 'nocino', 'orahovac', 'ratafia', 'rivulet',
-                 'pesto', 'baklava', 'turron', 'turrón', 'gianduja',
-                 'arachis', 'satay', 'fenugreek', 'charbay nostalgie',
-                 'kahana royale', 'goober', 'lupin', 'mandelona',
-                 'mortadella', 'bombay sapphire', 'chinquapin', 'gingko']
-    rule_map = {'Vegetarian': meat_words,
-                'Vegan': meat_words + dairy_words + egg_words + \
-                    ['honey', 'gelatin', 'jello', 'jell-o',
-                     'lard', 'marshmallow', 'kimchi', 'royal jelly'],
-                'Gluten-free': [
-                    'wheat', 'rye', 'barley', 'bulgur', 'couscous',
-                    'farina', 'graham', 'matzo', 'semolina', 'spelt', 'triticale',
-                    'malt', 'french fries', 'velveeta', 'mayo', 'ketchup',
-                    'soy sauce', 'teriyaki sauce', 'bacon', 'tabbouleh',
-                    'sausage', 'tempura', 'gravy', 'marinade', 'cereal',
-                    'chocolate milk', 'bread', 'pudding', 'hot dog', 'hotdog',
-                    'hot-dog', 'ice cream', 'energy bar',
-                    'trail mix', 'syrup', 'seitan', 'wheatgrass', 'vodka',
-                    'meatball', 'veggie burger', 'beer', 'oats', 'oat bran',
-                    'pasta', 'ravioli', 'dumpling', 'gnocchi', 'rotini',
-                    'spaghetti', 'manicotti', 'campanelle', 'gemelli',
-                    'fusilli', 'angel hair', 'lasagne', 'riccioli', 'tagliatelle',
-                    'cavatappi', 'rotelle', 'rigatoni', 'tortellini',
-                    'fettuccine', 'ziti', 'orzo', 'linguine', 'farfalle',
-                    'penne', 'orechiette', 'rocchetti', 'pappardelle',
-                    'capellini', 'macaroni', 'egg noodles', 'ramen', 'udon',
-                    'soba', 'chow mein', 'croissant', 'pita', 'naan', 'bagel',
-                    'muffin', 'donut', ' roll', 'pretzel', 'cracker',
-                    'goldfish', 'cake', 'cookie', 'pie', 'brownie',
-                    'corn flake', 'rice puff', 'waffle', 'toast', 'crepe',
-                    'biscuit', 'panko', 'crouton', 'roux', 'flour tortilla'],
-                'Dairy-free': dairy_words,
-                'Paleo': dairy_words + [
-                    'beans', 'peas', 'lentil', 'chickpea',
-                    'soy', 'peanut', 'tofu', 'miso', 'quinoa', ' rice', ' oat',
-                    'sugar', 'vegetable oil', 'agave', 'beer', 'pasta', 'bread',
-                    'wheat', 'corn', 'cracker', 'barley', 'grain', 'potato',
-                    'yucca', 'canola oil', 'palm oil', 'aspartame', 'neotame',
-                    'saccharin', 'sucralose', 'xylitol', 'erythritol',
-                    'hot dog', 'hotdog', 'hot-dog', 'spam', 'juice', 'candy',
-                    'chips', 'soda', 'coke', 'pepsi', 'dr pepper', 'dr. pepper',
-                    'sprite', 'canada dry', 'coca-cola', 'fanta', 'mountain dew',
-                    'fresca'],
-                'Egg-free': egg_words,
-                'Fish-free': fish_words,
-                'Shellfish-free': shellfish_words,
-                'Alcohol-free': alcohol_words,
-                'Nut-free': nut_words,
-                # https://en.wikipedia.org/wiki/Kosher_foods
-                'Kosher': shellfish_words + \
-                    ['pork', 'rabbit', 'hare', 'jello',
-                     'gelatin', 'catfish', 'shark', 'sturgeon',
-                     'caviar', 'escargot', 'snail', 'cauliflower',
-                     'asparagus', 'broccoli', 'blackberr', 'raspberr',
-                     'snake']}
-    ingredients = ' '.join(row['ingredients' + num]).lower()
-    if tag in rule_map:
+# https://en.wikipedia.org/wiki/List_of_types_of_seafood
+SHELLFISH_WORDS = ['shellfish', 'crab', 'crayfish', 'langostino',
+                   'lobster', 'shrimp', 'prawn', 'cockle',
+                   'cuttlefish', 'clam', 'mussel', 'octopus',
+                   'oyster', 'periwinkle', 'scallop', 'squid', 'calamari',
+                   'conch', 'snail', 'escargot', 'nautilus', 'crawfish',
+                   'crawdad', 'abalone', 'geoduck', 'barnacle', 'krill',
+                   'limpet', 'urchin', 'sea cucumber', 'whelk']
+# https://en.wikipedia.org/wiki/List_of_types_of_seafood
+FISH_WORDS = SHELLFISH_WORDS + \
+    ['fish', 'seafood', 'anchov', 'barracuda', 'bass',
+     'bream', 'brill', 'cod', 'dorade', 'eel', 'flounder',
+     'grouper', 'haddock', ' hake', 'halibut', 'mahi',
+     'herring', 'ilish', 'john dory', 'lamprey',
+     'mackerel', 'mullet', 'perch', 'pike', 'pilchard',
+     'pollock', 'pomfret', 'pompano', 'roughy', 'salmon', 'lox',
+     'sanddab', 'sardine', 'shad ', 'shark', 'skate wing', 'skatewing',
+     'smelt', 'snakehead', 'snapper', ' sole ', 'sprat', 'sturgeon',
+     'surimi', 'tilapia', 'trout', 'tuna', 'turbot', 'whiting',
+     'whitebait', 'caviar', ' roe', 'ikura', 'kazunoko', 'masago',
+     'tobiko', 'dolphin', 'whale', 'arctic char', 'yellowtail',
+     'poke ', 'unagi', 'maguro', 'katsuo', 'hamachi', 'kurodai',
+     'hata ', 'ohyou', 'saba ', 'tako', ' ika ', ' ebi ', 'kani ',
+     ' uni ', 'mirugai', 'awabi', 'porgy', 'branzino', 'fluke',
+     'albacore', 'escolar', 'worcestershire', 'worscestershire',
+     'caesar', 'bouillabaisse']
+MEAT_WORDS = FISH_WORDS + \
+    ['meat', 'jerky', 'poultry', 'chicken', 'foie gras',
+     'lamb', 'goat', 'mutton',  'cornish hen',
+     # https://en.wikipedia.org/wiki/List_of_steak_dishes
+     'beef', 'asado', 'bulgogi', 'carne asada', 'filet mignon',
+     'ribs', 'rib-eye', 'rib eye', 'ribeye', 'rib steak',
+     'rib roast', 'sirloin', 'tenderloin', 'flank steak',
+     'tri-tip', 'tri tip', 'prime rib', 'ground round',
+     't-bone', 't bone', 'tbone', 'strip steak', 'ground chuck',
+     'skirt steak', 'hanger steak', 'chateaubriand',
+     'flat iron steak', 'flat-iron steak', 'flatiron steak',
+     'rump steak', 'new york strip', 'ny strip',
+     'beef shank', 'round steak', 'porterhouse steak',
+     'brisket', 'veal', 'burger', 'pastrami',
+     # https://en.wikipedia.org/wiki/Game_(hunting)
+     'alligator', 'bullfrog', 'turtle', 'snake', 'crow',
+     'grouse', 'pheasant', 'fowl', 'quail', 'woodcock', 'mourning dove',
+     'duck', 'puffin', 'goose', 'partridge', 'pigeon', 'turkey',
+     'bison', 'sheep', 'deer', 'venison', 'elk', 'moose', 'pronghorn',
+     'reindeer', 'boar', 'muskrat', 'hare', 'rabbit', 'opossum',
+     'buffalo',
+     # https://en.wikipedia.org/wiki/List_of_hams
+     'pork', 'ham', 'suckling', 'bacon', 'prosciutto',
+     'pig ', "pigs'", "pig's", 'pancetta',
+     # https://en.wikipedia.org/wiki/List_of_sausages
+     'sausage', 'banger', 'hot dog', 'hotdog', 'hot-dog', 'corn dog',
+     'wiener', 'frankfurter', 'chorizo', 'andouille', 'wurst',
+     'black pudding', 'white pudding', 'salami', 'mortadella',
+     'soppressata', 'kielbasa', 'chipolata', 'hogs pudding',
+     "hog's pudding", 'haggis', 'suet', 'boudin', 'chaudin',
+     'goetta', 'hog maw', 'hot link', 'bologna', 'pepperoni',
+     # https://en.wikipedia.org/wiki/Offal
+     'chitterlings', 'liver', 'lung', 'trotters', 'spleen',
+     'pancreas', 'tongue', 'tripe', 'intestines', 'hooves',
+     'sweetbread', 'gizzard', 'placenta']
+# https://en.wikipedia.org/wiki/List_of_dairy_products
+# https://en.wikipedia.org/wiki/Dairy_product
+DAIRY_WORDS = ['buffalo curd', 'butter', 'casein', 'cheese', 'cream',
+               'creme', 'crème', 'curd', 'custard', 'dulce de leche',
+               'doogh', 'eggnog', 'fromage', 'gelato', 'ghee',
+               'lassi', 'milk', 'sarasson', 'semifreddo', 'whey',
+               'yogurt', 'raita', 'malai', 'khoa', 'clabber', 'kefir',
+               'smetana', 'junket',
+               # https://en.wikipedia.org/wiki/List_of_cheeses
+               'halloumi', 'havarti', 'cheddar', 'stilton', 'feta ', 'feta,',
+               'camembert', 'queso', 'crema', 'colby', 'humboldt fog',
+               'monterey jack', 'muenster', 'pepper jack', 'pepperjack',
+               'pepper-jack', 'provolone', 'parmesan', 'parmigian',
+               'reggiano', 'reggianito', 'pecorino', 'manchego', 'bleu',
+               'roquefort', 'gorgonzola', 'cheshire', 'edam ', 'edam,',
+               'gouda', 'mozzarella', 'gruyere', 'gruyère', 'feta', 'ricotta',
+               'paneer', 'chevre', 'chèvre', 'mascarpone', 'burrata',
+               'brie', 'jarlsberg', 'limburger', 'munster', 'fontina',
+               'emmental', 'grana padano', 'reddi-wip', 'reddi-whip',
+               'cool whip', 'cool-whip', 'velveeta', 'kraft singles',
+               'cheez whiz', 'cheezwhiz', 'cheez-its', 'cheezits',
+               'gogurt', 'go-gurt', 'babybel']
+# https://en.wikipedia.org/wiki/List_of_egg_dishes
+EGG_WORDS = ['egg', 'omelette', 'carbonara', 'croque madame',
+             'french toast', 'frittata', 'huevos', 'loco moco',
+             'matza brei', 'one eyed jack', 'quiche', 'rafanata',
+             'shakshouka', 'souffle', 'soufflé', 'stracciatella',
+             'stratta', 'custard', ' ovos', 'meringue', 'pavlova',
+             'hamburger', 'mayo']
+# https://en.wikipedia.org/wiki/List_of_alcoholic_drinks
+# https://en.wikipedia.org/wiki/List_of_liqueurs
+ALCOHOL_WORDS = ['alcohol', 'gin', 'whiskey', 'whisky', 'bourbon',
+                 'moonshine', 'vodka', 'beer', 'hard cider', 'wine',
+                 'brandy', 'cognac', 'vermouth', 'tequila', 'mezcal',
+                 'rum', 'mead', 'liquor', 'liqueur',
+                 'ale', 'pale ale', 'lager', 'pilsener', 'pilsner',
+                 'porter', 'stout', 'madeira', 'marsala', 'sherry',
+                 'sangria', 'champagne', 'absinthe', 'schnapps',
+                 'kahlua', 'kahlúa', 'st-germain', 'st germain',
+                 'st. germain', 'cointreau', 'curacao', 'curaçao',
+                 'amaretto', 'frangelico', 'jack daniels', 'prosecco',
+                 'cava', 'chablis', 'lillet', 'dubonnet', 'ouzo',
+                 'aperol', 'pernod', 'pastis', 'martini', 'sambuca',
+                 'chartreuse', 'limoncello', 'akvavit', 'black russian',
+                 'rusty nail', 'bitters ', 'bitters,', 'margarita',
+                 'irish coffee', 'mojito', 'moscow mule', 'gin mule',
+                 'long island iced tea', 'vesper', 'cosmo ', 'cosmo,',
+                 'cosmopolitan', 'sidecar', 'pina colada', 'piña colada',
+                 'gimlet', 'boulevardier', 'bloody mary', 'sazerac',
+                 'manhattan', 'daiquiri', 'negroni', 'bellini',
+                 "jack daniel's", 'jim beam', 'southern comfort',
+                 'yukon jack', 'drambuie', 'campari', 'triple sec',
+                 'baileys irish cream', "bailey's irish cream", 'baileys',
+                 'creme de menthe', 'crème de menthe',
+                 'creme de banane', 'crème de banane', 'de cacao',
+                 'de cassis', 'de cerise', 'de noyaux', 'de violette',
+                 'creme yvette', 'crème yvette', 'smirnoff',
+                 'pimms', "pimm's", 'tanqueray', 'jenever', 'genever',
+                 'johnnie walker', 'johnny walker', 'makers mark',
+                 "maker's mark", 'ketel one', 'grey goose', 'gray goose',
+                 ' titos', "tito's", 'absolut', 'stolichnaya',
+                 'hangar 1', 'hangar one', 'three olives', 'stella rosa',
+                 'korbel', 'brut', 'jose cuervo', 'captain morgan',
+                 'bacardi', 'svedka', 'patrón', 'jagermeister',
+                 'jägermeister', 'grand marnier', 'mirin',
+                 # https://en.wikipedia.org/wiki/Lists_of_wines
+                 'dom perignon', 'dom pérignon', 'rosé', 'cabernet',
+                 'carignan', 'malbec', 'merlot', 'pinot', 'sangiovese',
+                 'syrah', 'zinfandel', 'chardonnay', 'sauvignon',
+                 'semillon', 'moscato', 'muscat', 'riesling',
+                 'gewurztraminer', 'gewürztraminer', 'viognier',
+                 'cortese', 'barefoot', 'cocchi americano', 'chianti',
+                 # https://en.wikipedia.org/wiki/List_of_beer_styles
+                 'hefeweizen', 'pale ale', 'lambic', ' porter',
+                 'angry orchard', 'ballast point', 'blue moon',
+                 'budweiser', 'coors', 'corona', 'dogfish head',
+                 'dos equis', 'firestone walker', 'goose island',
+                 'guinness', 'heineken', 'lagunitas', 'michelob',
+                 'mikes hard', "mike's hard", 'modelo', 'sam adams',
+                 'samuel adams', 'sierra nevada', 'stella artois',
+                 'yuengling', 'pbr', 'pabst', 'ipa', 'miller lite',
+                 'colt 45',
+                 # https://en.wikipedia.org/wiki/List_of_cider_brands
+                 'ace cider', 'arsenal cider', 'aspall cider',
+                 'bantam cider', 'blackthorn cider', 'bold rock hard cider',
+                 'brothers cider', 'bulmers', 'burrow hill cider',
+                 'carling cider', 'ciderboys', 'cidergeist', 'crispin cider',
+                 'downeast cider', 'fox barrel cider', 'frosty jack cider',
+                 'gaymer cider', 'herrljunga cider', 'kingstone press cider',
+                 'magners irish cider', 'somersby cider', 'stowford press',
+                 'strongbow cider', 'taunton cider', 'thatchers cider',
+                 'woodchuck cider', 'woodchuck hard cider',
+                 'woodpecker cider']
+# https://en.wikipedia.org/wiki/List_of_culinary_nuts
+NUT_WORDS = ['nut', 'acorn', 'almond', 'beech', 'cashew', 'filbert',
+             'hickory', 'pecan', 'pistachio', 'praline', 'macadamia',
+             'marzipan', 'nougat', 'amaretto', 'disaronno', 'frangelico',
+             'nocello', 'nocino', 'orahovac', 'ratafia', 'rivulet',
+             'pesto', 'baklava', 'turron', 'turrón', 'gianduja',
+             'arachis', 'satay', 'fenugreek', 'charbay nostalgie',
+             'kahana royale', 'goober', 'lupin', 'mandelona',
+             'mortadella', 'bombay sapphire', 'chinquapin', 'gingko']
+RULE_MAP = {'Vegetarian': MEAT_WORDS,
+            'Vegan': MEAT_WORDS + DAIRY_WORDS + EGG_WORDS + \
+                ['honey', 'gelatin', 'jello', 'jell-o',
+                 'lard', 'marshmallow', 'kimchi', 'royal jelly'],
+            'Gluten-free': [
+                'wheat', 'rye', 'barley', 'bulgur', 'couscous',
+                'farina', 'graham', 'matzo', 'semolina', 'spelt', 'triticale',
+                'malt', 'french fries', 'velveeta', 'mayo', 'ketchup',
+                'soy sauce', 'teriyaki sauce', 'bacon', 'tabbouleh',
+                'sausage', 'tempura', 'gravy', 'marinade', 'cereal',
+                'chocolate milk', 'bread', 'pudding', 'hot dog', 'hotdog',
+                'hot-dog', 'ice cream', 'energy bar',
+                'trail mix', 'syrup', 'seitan', 'wheatgrass', 'vodka',
+                'meatball', 'veggie burger', 'beer', 'oats', 'oat bran',
+                'pasta', 'ravioli', 'dumpling', 'gnocchi', 'rotini',
+                'spaghetti', 'manicotti', 'campanelle', 'gemelli',
+                'fusilli', 'angel hair', 'lasagne', 'riccioli', 'tagliatelle',
+                'cavatappi', 'rotelle', 'rigatoni', 'tortellini',
+                'fettuccine', 'ziti', 'orzo', 'linguine', 'farfalle',
+                'penne', 'orechiette', 'rocchetti', 'pappardelle',
+                'capellini', 'macaroni', 'egg noodles', 'ramen', 'udon',
+                'soba', 'chow mein', 'croissant', 'pita', 'naan', 'bagel',
+                'muffin', 'donut', ' roll', 'pretzel', 'cracker',
+                'goldfish', 'cake', 'cookie', 'pie', 'brownie',
+                'corn flake', 'rice puff', 'waffle', 'toast', 'crepe',
+                'biscuit', 'panko', 'crouton', 'roux', 'flour tortilla'],
+            'Dairy-free': DAIRY_WORDS,
+            'Paleo': DAIRY_WORDS + [
+                'beans', 'peas', 'lentil', 'chickpea',
+                'soy', 'peanut', 'tofu', 'miso', 'quinoa', ' rice', ' oat',
+                'sugar', 'vegetable oil', 'agave', 'beer', 'pasta', 'bread',
+                'wheat', 'corn', 'cracker', 'barley', 'grain', 'potato',
+                'yucca', 'canola oil', 'palm oil', 'aspartame', 'neotame',
+                'saccharin', 'sucralose', 'xylitol', 'erythritol',
+                'hot dog', 'hotdog', 'hot-dog', 'spam', 'juice', 'candy',
+                'chips', 'soda', 'coke', 'pepsi', 'dr pepper', 'dr. pepper',
+                'sprite', 'canada dry', 'coca-cola', 'fanta', 'mountain dew',
+                'fresca'],
+            'Egg-free': EGG_WORDS,
+            'Fish-free': FISH_WORDS,
+            'Shellfish-free': SHELLFISH_WORDS,
+            'Alcohol-free': ALCOHOL_WORDS,
+            'Nut-free': NUT_WORDS,
+            # https://en.wikipedia.org/wiki/Kosher_foods
+            'Kosher': SHELLFISH_WORDS + \
+                ['pork', 'rabbit', 'hare', 'jello',
+                 'gelatin', 'catfish', 'shark', 'sturgeon',
+                 'caviar', 'escargot', 'snail', 'cauliflower',
+                 'asparagus', 'broccoli', 'blackberr', 'raspberr',
+                 'snake']}
+
+# https://en.wikipedia.org/wiki/List_of_meat_substitutes
+# https://en.wikipedia.org/wiki/List_of_bacon_substitutes
+EXCEPTION_MAP = {'milk': ['milk-free', 'milkfree', 'milk free',
+                          'milkless', 'milk-less', 'almond milk',
+                          'coconut milk', 'goats milk',
+                          'goat milk', "goat's milk", "goats' milk",
+                          'oat milk', 'oatmilk', 'soy milk',
+                          'soymilk', 'pea milk', 'cashew milk',
+                          'peanut milk', 'flax milk', 'hemp milk',
+                          'rice milk', 'walnut milk', 'non-dairy',
+                          'nondairy', 'non dairy', 'tofutti'],
+                 'cream': ['creamy', 'scream', 'plant-based cream',
+                           'plant-based cooking cream', 'tofutti',
+                           'creami', 'cashew cream', 'coconut cream',
+                           'nondairy cream', 'non-dairy cream'],
+                 'crema': ['cashew crema', 'avocado crema',
+                           'almond crema'],
+                 'creme': ['creme de '],
+                 'crème': ['crème de '],
+                 'cheese': ['cheesecloth', 'tofutti', 'nondairy cheese',
+                            'non-dairy cheese', 'nondairy cream cheese',
+                            'non-dairy cream cheese'],
+                 'feta ': ['tofu feta'],
+                 'feta,': ['tofu feta'],
+                 'ricotta': ['tofu ricotta'],
+                 'brie': ['brief', 'brier', 'briet',
+                          'ebrie', 'lbrie', 'mbrie', 'nbrie',
+                          'obrie', 'rbrie', 'tbrie', 'ubrie'],
+                 'curd': ['curdl', 'curdi', 'curdy'],
+                 'lard': ['collard', 'mallard', 'larder'],
+                 'yogurt': ['soy yogurt'],
+                 'fish': ['fishless', 'fish free', 'vegan fish',
+                          'wolfish', 'selfish', 'waifish', 'oafish',
+                          'fishnet', 'fishing', 'imitation fish'],
+                 'tuna': ['mock tuna'],
+                 'bass': ['bassa', 'basse', 'bassi', 'bassl',
+                          'bassn', 'basso', 'bassu', 'bassw',
+                          'babass', 'rabass', 'bbass', 'lbass',
+                          'mbass', 'ubass'],
+                 'eel': ['beel', 'feel', 'heel', 'keel', 'neel',
+                         'peel', 'reel', 'seel', 'teel', 'weel',
+                         'yeel', 'eela', 'eelb', 'eelc', 'eele',
+                         'eelg', 'eelh', 'eeli', 'eell', 'eelm',
+                         'eeln', 'eelo', 'eelp', 'eelsm', 'eelt',
+                         'eelw', 'eely'],
+                 'cod': ['acod', 'bcod', 'ecod', 'icod', 'ncod',
+                         'ocod', 'scod', 'tcod', 'ycod', 'coda',
+                         'codd', 'code', 'codg', 'codi', 'codl',
+                         'codo', 'codp', 'codr', 'codsw', 'cody'],
+                 'meat': ['meatless', 'meat (not!)', 'meat free',
+                          'meat-free', '"meat"', 'beyond meat',
+                          'fake meat', "'meat'", '"meatballs"',
+                          "'meatballs'", '"meatball"', "'meatball'",
+                          'imitation meat'],
+                 'bacon': ['vegetarian bacon', 'baconnaise',
+                           'eggplant bacon', 'bacon salt',
+                           'benevolent bacon', 'veggie bacon',
+                           '"bacon"', "'bacon'", 'imitation bacon'],
+                 'ham': ['meatless ham', 'harmless ham', 'graham',
+                         'gingham', 'sham', 'wham', 'gotham',
+                         'birmingham', 'nottingham', 'durham',
+                         'west ham', 'tottenham', '"ham"',
+                         "'ham'", 'hamp', 'hambe', 'hamm', 'hame',
+                         'hami', 'hamst', 'hambl', 'hamr', 'hamo',
+                         'hamn', 'hama', 'cham', 'haml'],
+                 'beef': ['beef (not!)', 'beyond beef', 'beef-less',
+                          'beefless', 'beefy', '"beef"', "'beef'",
+                          'beef substitute'],
+                 'hot dog': ['vegan hot dog'],
+                 'hotdog': ['vegan hotdog'],
+                 'hot-dog': ['vegan hot-dog'],
+                 'pepperoni': ['vegan pepperoni'],
+                 'ribs': ['cribs', 'celery ribs', '"ribs"', "'ribs'",
+                          'portobello ribs', 'mushroom ribs', 'dribs'],
+                 'pork': ['"pork"', "'pork'", 'spork',
+                          'mushroom pulled pork'],
+                 'chicken': ['chicken (not!)', 'meatless chicken',
+                             'chickenless', '"chicken"', "'chicken'"],
+                 'turkey': ['turkey (not!)', 'meatless turkey'],
+                 'duck': ['mock duck', 'duckweed', 'duckie',
+                          'geoduck'],
+                 'goat': ['goat cheese', 'goats milk', 'goat milk',
+                          "goat's milk", "goats' milk", 'goat cheddar',
+                          'goat curd', 'goat fromage', 'goat gouda',
+                          'goat ricotta', 'scapegoat', 'goatee'],
+                 'goose': ['gray goose', 'grey goose',
+                           'goose island'],
+                 'sheep': ['sheeps milk', "sheep's milk"],
+                 'hare': ['share', 'chare', 'hareb', 'hareh', 'harec',
+                          'harel', 'hared', 'haree', 'harem'],
+                 'boar': ['board', 'boari'],
+                 'crow': ['crowb', 'crowd', 'crowk', 'crowo',
+                          'crowst', 'crowa', 'crown', 'crowf',
+                          'crowe', 'crowi', 'scrow', 'ecrow',
+                          'icrow', 'rcrow', 'kcrow', 'ncrow',
+                          'tcrow'],
+                 'elk': ['elki', 'elke', 'elko', 'helk', 'yelk',
+                         'elkh', 'velk', 'selk', 'welk', 'zelk'],
+                 'buffalo': ['buffalo mozzarella', 'buffalo curd'],
+                 'burger': ['mushroom burger', 'black bean burger',
+                            'veggie burger', 'impossible burger',
+                            'gardenburger', 'plant based burger',
+                            'meatless burger', 'limburger',
+                            'quorn burger'],
+                 'sausage': ['veggie sausage', 'beyond sausage'],
+                 'bologna': ['veggie bologna'],
+                 'jerky': ['smart jerky'],
+                 'liver': ['sliver', 'deliver'],
+                 'poke ': ['beet poke'],
+                 'crab': ['fake crab', 'imitation crab', 'scrabb',
+                          'crabapple', '"crab"', "'crab'"],
+                 'lobster': ['imitation lobster'],
+                 'oyster': ['oyster mushrooms', 'oyster crackers'],
+                 'egg': ['egg free', 'egg- free', 'eggless',
+                         'egg replacer', 'vegg', '"egg"',
+                         'begg', 'legg', 'vegg', 'eggh', 'kegg',
+                         'pegg', 'regg', 'chia egg', 'flax egg',
+                         'egg substitute', 'replacer egg', 'eggplant'],
+                 'mayo': ['avocado mayo', 'mayor'],
+                 'butter': ['butternut', 'butterless',
+                            'unbuttered', 'butterfl',
+                            'buttercup', 'butterwort',
+                            'butterweed', 'vegan butter',
+                            "i can't believe it's not butter",
+                            'nut butter', 'almond butter',
+                            'pistachio butter', 'cashew butter',
+                            'seed butter', 'sunbutter',
+                            'apple butter', 'butter lettuce',
+                            'butter bean', 'nondairy butter',
+                            'non-dairy butter'],
+                 'nut': ['nut free', 'nutfree', 'nutless',
+                         'nut-less', 'nutmeg', 'minute', 'nutr',
+                         'nuti', 'donut', 'doughnut', 'nutso',
+                         'nutsy', 'nuto', 'locknut', 'lock nut',
+                         'wingnut', 'wing nut', 'thumbnut',
+                         'nuthatch', 'nuthouse', 'water chestnut',
+                         'butternut squash'],
+                 'alcohol': ['non-alcoholic', 'non alcoholic',
+                             'no alcohol'],
+                 'wine': ['wine vinegar', 'owine', 'twine',
+                          'ewine', 'swine', 'awine'],
+                 'beer': ['beeri', 'ebeer', 'mbeer', 'beeru',
+                          'non-alcoholic beer', 'nonalcoholic beer'],
+                 'ale': ['aale', 'bale', 'cale', 'dale', 'eale',
+                         'gale', 'hale', 'iale', 'kale', 'lale',
+                         'male', 'nale', 'oale', 'pale', 'rale',
+                         'sale', 'tale', 'uale', 'vale', 'wale',
+                         'yale', 'zale', 'alea', 'aleb', 'alec',
+                         'aled', 'alee', 'alef', 'aleg', 'alehs',
+                         'alei', 'alel', 'alem', 'alen', 'aleo',
+                         'alep', 'aler', 'alesa', 'alesc', 'alese',
+                         'alesg', 'alesm', 'aless', 'alest', 'alet',
+                         'aleu', 'alev', 'alew', 'alex', 'aley',
+                         'ginger ale', 'bass ale'],
+                 'rum': ['arum', 'brum', 'crum', 'drum', 'erum',
+                         'frum', 'grum', 'hrum', 'krum', 'nrum',
+                         'orum', 'prum', 'rrum', 'trum', 'urum',
+                         'ruma', 'rumb', 'rume', 'rumf', 'rumh',
+                         'rumi', 'rumk', 'ruml', 'rumm', 'rumo',
+                         'rump,' 'rumr', 'rumst', 'rumv'],
+                 'mead': ['meado', 'imead'],
+                 'mirin': ['miring', 'kotteri mirin',
+                           'honteri mirin', 'non-alcoholic mirin'],
+                 'gin': ['agin', 'dgin', 'egin', 'ggin', 'igin',
+                         'lgin', 'ngin', 'ogin', 'rgin', 'ugin',
+                         'gina', 'gine', 'ging', 'gini', 'gink',
+                         'ginn', 'gino', 'ginse', 'ginz'],
+                 'campari': ['campari tomato'],
+                 'juice': ['lemon juice', 'lime juice'],
+                 'casein': ['casein free', 'casein-free']}
+
+TAG_MATCHER = TagMatcher(RULE_MAP, EXCEPTION_MAP)
+
+def clean_tag(title, ingredients, tags):
+    """Given a recipe's title and ingredients, decide for each tag whether
+    the recipe is tagged correctly based on the word list for that tag."""
+    ingredients = ' '.join(ingredients).lower()
+    counts = TAG_MATCHER.count_all_violations(tags, TAG_MATCHER.scan(ingredients))
+    verdicts = {}
+    for tag in tags:
         # Start by assuming it matches the tag (e.g. vegan).
-        # If it contains any non-vegan words, check if those words are
-        # in exception phrases, and if not, mark it as invalid (non-vegan).
-        valid_tag = 1
-        for word in rule_map[tag]:
-            if word in ingredients:
-                # https://en.wikipedia.org/wiki/List_of_meat_substitutes
-                # https://en.wikipedia.org/wiki/List_of_bacon_substitutes
-                exception_map = {'milk': ['milk-free', 'milkfree', 'milk free',
-                                          'milkless', 'milk-less', 'almond milk',
-                                          'coconut milk', 'goats milk',
-                                          'goat milk', "goat's milk", "goats' milk",
-                                          'oat milk', 'oatmilk', 'soy milk',
-                                          'soymilk', 'pea milk', 'cashew milk',
-                                          'peanut milk', 'flax milk', 'hemp milk',
-                                          'rice milk', 'walnut milk', 'non-dairy',
-                                          'nondairy', 'non dairy', 'tofutti'],
-                                 'cream': ['creamy', 'scream', 'plant-based cream',
-                                           'plant-based cooking cream', 'tofutti',
-                                           'creami', 'cashew cream', 'coconut cream',
-                                           'nondairy cream', 'non-dairy cream'],
-                                 'crema': ['cashew crema', 'avocado crema',
-                                           'almond crema'],
-                                 'creme': ['creme de '],
-                                 'crème': ['crème de '],
-                                 'cheese': ['cheesecloth', 'tofutti', 'nondairy cheese',
-                                            'non-dairy cheese', 'nondairy cream cheese',
-                                            'non-dairy cream cheese'],
-                                 'feta ': ['tofu feta'],
-                                 'feta,': ['tofu feta'],
-                                 'ricotta': ['tofu ricotta'],
-                                 'brie': ['brief', 'brier', 'briet',
-                                          'ebrie', 'lbrie', 'mbrie', 'nbrie',
-                                          'obrie', 'rbrie', 'tbrie', 'ubrie'],
-                                 'curd': ['curdl', 'curdi', 'curdy'],
-                                 'lard': ['collard', 'mallard', 'larder'],
-                                 'yogurt': ['soy yogurt'],
-                                 'fish': ['fishless', 'fish free', 'vegan fish',
-                                          'wolfish', 'selfish', 'waifish', 'oafish',
-                                          'fishnet', 'fishing', 'imitation fish'],
-                                 'tuna': ['mock tuna'],
-                                 'bass': ['bassa', 'basse', 'bassi', 'bassl',
-                                          'bassn', 'basso', 'bassu', 'bassw',
-                                          'babass', 'rabass', 'bbass', 'lbass',
-                                          'mbass', 'ubass'],
-                                 'eel': ['beel', 'feel', 'heel', 'keel', 'neel',
-                                         'peel', 'reel', 'seel', 'teel', 'weel',
-                                         'yeel', 'eela', 'eelb', 'eelc', 'eele',
-                                         'eelg', 'eelh', 'eeli', 'eell', 'eelm',
-                                         'eeln', 'eelo', 'eelp', 'eelsm', 'eelt',
-                                         'eelw', 'eely'],
-                                 'cod': ['acod', 'bcod', 'ecod', 'icod', 'ncod',
-                                         'ocod', 'scod', 'tcod', 'ycod', 'coda',
-                                         'codd', 'code', 'codg', 'codi', 'codl',
-                                         'codo', 'codp', 'codr', 'codsw', 'cody'],
-                                 'meat': ['meatless', 'meat (not!)', 'meat free',
-                                          'meat-free', '"meat"', 'beyond meat',
-                                          'fake meat', "'meat'", '"meatballs"',
-                                          "'meatballs'", '"meatball"', "'meatball'",
-                                          'imitation meat'],
-                                 'bacon': ['vegetarian bacon', 'baconnaise',
-                                           'eggplant bacon', 'bacon salt',
-                                           'benevolent bacon', 'veggie bacon',
-                                           '"bacon"', "'bacon'", 'imitation bacon'],
-                                 'ham': ['meatless ham', 'harmless ham', 'graham',
-                                         'gingham', 'sham', 'wham', 'gotham',
-                                         'birmingham', 'nottingham', 'durham',
-                                         'west ham', 'tottenham', '"ham"',
-                                         "'ham'", 'hamp', 'hambe', 'hamm', 'hame',
-                                         'hami', 'hamst', 'hambl', 'hamr', 'hamo',
-                                         'hamn', 'hama', 'cham', 'haml'],
-                                 'beef': ['beef (not!)', 'beyond beef', 'beef-less',
-                                          'beefless', 'beefy', '"beef"', "'beef'",
-                                          'beef substitute'],
-                                 'hot dog': ['vegan hot dog'],
-                                 'hotdog': ['vegan hotdog'],
-                                 'hot-dog': ['vegan hot-dog'],
-                                 'pepperoni': ['vegan pepperoni'],
-                                 'ribs': ['cribs', 'celery ribs', '"ribs"', "'ribs'",
-                                          'portobello ribs', 'mushroom ribs', 'dribs'],
-                                 'pork': ['"pork"', "'pork'", 'spork',
-                                          'mushroom pulled pork'],
-                                 'chicken': ['chicken (not!)', 'meatless chicken',
-                                             'chickenless', '"chicken"', "'chicken'"],
-                                 'turkey': ['turkey (not!)', 'meatless turkey'],
-                                 'duck': ['mock duck', 'duckweed', 'duckie',
-                                          'geoduck'],
-                                 'goat': ['goat cheese', 'goats milk', 'goat milk',
-                                          "goat's milk", "goats' milk", 'goat cheddar',
-                                          'goat curd', 'goat fromage', 'goat gouda',
-                                          'goat ricotta', 'scapegoat', 'goatee'],
-                                 'goose': ['gray goose', 'grey goose',
-                                           'goose island'],
-                                 'sheep': ['sheeps milk', "sheep's milk"],
-                                 'hare': ['share', 'chare', 'hareb', 'hareh', 'harec',
-                                          'harel', 'hared', 'haree', 'harem'],
-                                 'boar': ['board', 'boari'],
-                                 'crow': ['crowb', 'crowd', 'crowk', 'crowo',
-                                          'crowst', 'crowa', 'crown', 'crowf',
-                                          'crowe', 'crowi', 'scrow', 'ecrow',
-                                          'icrow', 'rcrow', 'kcrow', 'ncrow',
-                                          'tcrow'],
-                                 'elk': ['elki', 'elke', 'elko', 'helk', 'yelk',
-                                         'elkh', 'velk', 'selk', 'welk', 'zelk'],
-                                 'buffalo': ['buffalo mozzarella', 'buffalo curd'],
-                                 'burger': ['mushroom burger', 'black bean burger',
-                                            'veggie burger', 'impossible burger',
-                                            'gardenburger', 'plant based burger',
-                                            'meatless burger', 'limburger',
-                                            'quorn burger'],
-                                 'sausage': ['veggie sausage', 'beyond sausage'],
-                                 'bologna': ['veggie bologna'],
-                                 'jerky': ['smart jerky'],
-                                 'liver': ['sliver', 'deliver'],
-                                 'poke ': ['beet poke'],
-                                 'crab': ['fake crab', 'imitation crab', 'scrabb',
-                                          'crabapple', '"crab"', "'crab'"],
-                                 'lobster': ['imitation lobster'],
-                                 'oyster': ['oyster mushrooms', 'oyster crackers'],
-                                 'egg': ['egg free', 'egg- free', 'eggless',
-                                         'egg replacer', 'vegg', '"egg"',
-                                         'begg', 'legg', 'vegg', 'eggh', 'kegg',
-                                         'pegg', 'regg', 'chia egg', 'flax egg',
-                                         'egg substitute', 'replacer egg', 'eggplant'],
-                                 'mayo': ['avocado mayo', 'mayor'],
-                                 'butter': ['butternut', 'butterless',
-                                            'unbuttered', 'butterfl',
-                                            'buttercup', 'butterwort',
-                                            'butterweed', 'vegan butter',
-                                            "i can't believe it's not butter",
-                                            'nut butter', 'almond butter',
-                                            'pistachio butter', 'cashew butter',
-                                            'seed butter', 'sunbutter',
-                                            'apple butter', 'butter lettuce',
-                                            'butter bean', 'nondairy butter',
-                                            'non-dairy butter'],
-                                 'nut': ['nut free', 'nutfree', 'nutless',
-                                         'nut-less', 'nutmeg', 'minute', 'nutr',
-                                         'nuti', 'donut', 'doughnut', 'nutso',
-                                         'nutsy', 'nuto', 'locknut', 'lock nut',
-                                         'wingnut', 'wing nut', 'thumbnut',
-                                         'nuthatch', 'nuthouse', 'water chestnut',
-                                         'butternut squash'],
-                                 'alcohol': ['non-alcoholic', 'non alcoholic',
-                                             'no alcohol'],
-                                 'wine': ['wine vinegar', 'owine', 'twine',
-                                          'ewine', 'swine', 'awine'],
-                                 'beer': ['beeri', 'ebeer', 'mbeer', 'beeru',
-                                          'non-alcoholic beer', 'nonalcoholic beer'],
-                                 'ale': ['aale', 'bale', 'cale', 'dale', 'eale',
-                                         'gale', 'hale', 'iale', 'kale', 'lale',
-                                         'male', 'nale', 'oale', 'pale', 'rale',
-                                         'sale', 'tale', 'uale', 'vale', 'wale',
-                                         'yale', 'zale', 'alea', 'aleb', 'alec',
-                                         'aled', 'alee', 'alef', 'aleg', 'alehs',
-                                         'alei', 'alel', 'alem', 'alen', 'aleo',
-                                         'alep', 'aler', 'alesa', 'alesc', 'alese',
-                                         'alesg', 'alesm', 'aless', 'alest', 'alet',
-                                         'aleu', 'alev', 'alew', 'alex', 'aley',
-                                         'ginger ale', 'bass ale'],
-                                 'rum': ['arum', 'brum', 'crum', 'drum', 'erum',
-                                         'frum', 'grum', 'hrum', 'krum', 'nrum',
-                                         'orum', 'prum', 'rrum', 'trum', 'urum',
-                                         'ruma', 'rumb', 'rume', 'rumf', 'rumh',
-                                         'rumi', 'rumk', 'ruml', 'rumm', 'rumo',
-                                         'rump,' 'rumr', 'rumst', 'rumv'],
-                                 'mead': ['meado', 'imead'],
-                                 'mirin': ['miring', 'kotteri mirin',
-                                           'honteri mirin', 'non-alcoholic mirin'],
-                                 'gin': ['agin', 'dgin', 'egin', 'ggin', 'igin',
-                                         'lgin', 'ngin', 'ogin', 'rgin', 'ugin',
-                                         'gina', 'gine', 'ging', 'gini', 'gink',
-                                         'ginn', 'gino', 'ginse', 'ginz'],
-                                 'campari': ['campari tomato'],
-                                 'juice': ['lemon juice', 'lime juice'],
-                                 'casein': ['casein free', 'casein-free']}
-                if word in exception_map:
-                    # if none of the exceptions to that word are in the text
-                    if not any(w in ingredients for w in exception_map[word]):
-                        if tag == 'Kosher' and 'kosher salt' in ingredients:
-                            continue
-                        valid_tag = 0
-                        break
-                else:
-                    valid_tag = 0
-                    break
-        row[tag + num] = valid_tag
+        # If it contains any non-vegan words that aren't part of
+        # exception phrases, mark it as invalid (non-vegan).
+        verdicts[tag] = int(counts[tag] == 0)
 
         # overwrite if the tag (e.g. "vegan") is in title or ingredients
-        if tag.lower() in row['title' + num].lower():
-            row[tag + num] = 1
-        if '-' in tag:
-            if tag.lower().replace('-', ' ') in row['title' + num].lower():
-                row[tag + num] = 1
-        # cover alternative ways of saying x-free
-        if tag == 'Alcohol-free':
-            alcohol_free_terms = ['non-alcoholic', 'non alcoholic']
-            if any(word in row['title' + num].lower() for word in alcohol_free_terms):
-                row[tag + num] = 1
-        if tag == 'Gluten-free':
-            gluten_free_terms = ['(gf)', 'gluten- free', 'gluten -free']
-            if any(word in row['title' + num].lower() for word in gluten_free_terms):
-                row[tag + num] = 1
-        if tag == 'Vegetarian':
-            meat_free_terms = ['meatless', 'meat-free', 'meat free',
-                               'no meat', 'no-meat']
-            if any(word in row['title' + num].lower() for word in meat_free_terms):
-                row[tag + num] = 1
-        if tag.lower() in ingredients:
-            if tag != 'Kosher' or 'kosher salt' not in ingredients:
-                row[tag + num] = 1
-
-        # overwrite if x...free appears (e.g. "Gluten & Soy Free" = gluten-free)
-        if tag.endswith('-free'):
-            prefix = tag.split('-')[0].lower()
-            if re.search(prefix + '.*?free', row['title' + num].lower()):
-                row[tag + num] = 1
-    return row
+        if tag_in_title(tag, title, ingredients):
+            verdicts[tag] = 1
+    return verdicts
+
+def tag_rule_signature(tags):
+    """Hash of the word lists and the recipe data the tags are computed from."""
+    digest = hashlib.sha1(json.dumps([tags, RULE_MAP, EXCEPTION_MAP], sort_keys=True).encode('utf8'))
+    digest.update(recipe_store.signature().encode('utf8'))
+    return digest.hexdigest()
 
 rule_based_tags = ['Vegetarian', 'Vegan', 'Gluten-free', 'Dairy-free',
                    'Paleo', 'Egg-free', 'Fish-free', 'Shellfish-free',
                    'Alcohol-free', 'Nut-free', 'Kosher']
-for tag in tags:
-    if tag in rule_based_tags:
-        print('Applying tag', tag)
-        pairs = pairs.apply(clean_tag, axis=1, num='1', tag=tag)
-        pairs = pairs.apply(clean_tag, axis=1, num='2', tag=tag)
+applied_tags = [tag for tag in tags if tag in rule_based_tags]
+
+# each recipe appears in many aligned step pairs, so tag each recipe once
+recipes = pd.concat([pairs[['recipe_id' + num, 'title' + num, 'ingredients' + num]]
+                     .rename(columns=lambda c: c[:-1]) for num in ['1', '2']])
+recipes = recipes.drop_duplicates(subset='recipe_id')
+
+tag_cache = {}
+tag_cache_path = recipe_store_path.with_name('clean_recipe_tags.json')
+signature = tag_rule_signature(applied_tags)
+if args.tag_cache and tag_cache_path.is_file():
+    with open(tag_cache_path, 'r') as infile:
+        cached = json.load(infile)
+    if cached['signature'] == signature:
+        tag_cache = cached['verdicts']
+    else:
+        print('Tag cache is out of date')
+
+uncached = recipes[~recipes['recipe_id'].isin(tag_cache)]
+print('Applying tags', applied_tags, 'to', len(uncached), 'recipes',
+      '(' + str(len(recipes) - len(uncached)), 'cached)')
+for recipe_id, title, ingredients in zip(uncached['recipe_id'], uncached['title'], uncached['ingredients']):
+    tag_cache[recipe_id] = clean_tag(title, ingredients, applied_tags)
+if args.tag_cache and len(uncached):
+    with open(tag_cache_path, 'w') as outfile:
+        json.dump({'signature': signature, 'verdicts': tag_cache}, outfile)
+
+verdicts = pd.DataFrame.from_dict({recipe_id: tag_cache[recipe_id] for recipe_id in recipes['recipe_id']},
+                                  orient='index', columns=applied_tags)
+for tag in applied_tags:
+    pairs[tag + '1'] = pairs['recipe_id1'].map(verdicts[tag]).values
+    pairs[tag + '2'] = pairs['recipe_id2'].map(verdicts[tag]).values
 
 if args.set == 'train':
     # filter out recipe pairs that are perfectly aligned
@@ -931,8 +878,11 @@ if args.set == 'train':
             return True
         return False
 
+    lemma_cache_path = '/sample_data/lemma_cache.json'
+    load_lemma_cache(lemma_cache_path)
     pairs['ingredient_filter'] = pairs.apply(ing_match, axis=1)
     pairs_multi['ingredient_filter'] = pairs_multi.apply(ing_match, axis=1)
+    save_lemma_cache(lemma_cache_path)
     print(len(pairs), 'before removing pairs without any ingredients matching')
 
     pairs = pairs[pairs['ingredient_filter']]
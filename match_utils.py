@@ -1,8 +1,15 @@
 """
 Utils for getting ingredients in the next recipe instruction.
 """
+import os
+import json
 import string
 from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import Pool
+import numpy as np
+from scipy import sparse
 from nltk import word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
@@ -30,83 +37,151 @@ def is_num(s):
     except ValueError:
         return False
 
-class LemmaTokenizer(object):
-    def __init__(self):
+@lru_cache(maxsize=None)
+def get_stopwords(punctuation=False):
+    """Build the stopword table once. The tokenizer also drops punctuation,
+    while matching only drops stopwords."""
+    stops = list(stopwords.words('english')) + EXTRA_STOPWORDS
+    if punctuation:
+        stops += [x for x in string.punctuation]
+    return frozenset(stops)
+
+
+class LemmaCache(object):
+    """Bounded LRU cache of token -> lemma lookups, shared across recipes
+    so WordNet is only asked about each token once. With track_new, lemmas
+    that weren't in the cache are also kept until pop_new is called, so a
+    worker process can send them back to the parent."""
+    def __init__(self, maxsize=1000000, track_new=False):
+        self.maxsize = maxsize
         self.wnl = WordNetLemmatizer()
+        self.lemmas = OrderedDict()
+        self.track_new = track_new
+        self.new_lemmas = {}
+
+    def __len__(self):
+        return len(self.lemmas)
+
+    def lemmatize(self, token):
+        try:
+            lemma = self.lemmas[token]
+            self.lemmas.move_to_end(token)
+        except KeyError:
+            lemma = self.wnl.lemmatize(token)
+            self.lemmas[token] = lemma
+            if self.track_new:
+                self.new_lemmas[token] = lemma
+            if len(self.lemmas) > self.maxsize:
+                self.lemmas.popitem(last=False)
+        return lemma
+
+    def add(self, lemmas):
+        """Add a token -> lemma table, e.g. from another process."""
+        self.lemmas.update(lemmas)
+        while len(self.lemmas) > self.maxsize:
+            self.lemmas.popitem(last=False)
+
+    def pop_new(self):
+        """Return the lemmas added by lemmatize since the last call."""
+        new_lemmas, self.new_lemmas = self.new_lemmas, {}
+        return new_lemmas
+
+    def load(self, path):
+        """Add a token -> lemma table saved by an earlier run."""
+        with open(path, 'r', encoding='utf8') as f:
+            self.add(json.load(f))
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump(self.lemmas, f)
+
+
+# shared by every LemmaTokenizer in this process
+LEMMA_CACHE = LemmaCache()
+
+
+def load_lemma_cache(path):
+    """Load a persisted lemma table into the shared cache if it exists."""
+    if os.path.isfile(path):
+        LEMMA_CACHE.load(path)
+
+
+def save_lemma_cache(path):
+    LEMMA_CACHE.save(path)
+
+
+class LemmaTokenizer(object):
+    def __init__(self, lemma_cache=None):
+        self.lemma_cache = lemma_cache if lemma_cache is not None else LEMMA_CACHE
+        self.stops = get_stopwords(punctuation=True)
     def __call__(self, articles):
-        stops = list(stopwords.words('english')) + EXTRA_STOPWORDS + [x for x in string.punctuation]
-        return [self.wnl.lemmatize(t) for t in word_tokenize(articles) \
-                if t not in stops and not is_num(t)]
+        return [self.lemma_cache.lemmatize(t) for t in word_tokenize(articles) \
+                if t not in self.stops and not is_num(t)]
 
 
-def get_matches_for_step(count_matrix, step_idx, first_ingredient_idx,
-                         ingredient_list, features, use_title=False):
-    """
-    Given a vectorized list of steps and ingredients,
-    compare a given step to each ingredient in the ingredient list
-    and get the longest ngram matches between each pairing.
-    """
-    stops = list(stopwords.words('english')) + EXTRA_STOPWORDS
+# words that can be part of an ingredient but not alone
+PART_WORDS = ['baking', 'beaten', 'white', 'red', 'green', 'fresh', 'large',
+              'ground', 'pan', 'diced', 'light', 'medium', 'heavy', 'mix',
+              'shredded', 'melted', 'frozen', 'light', 'liquid', 'small',
+              'chopped', 'grated', 'beat', 'beaten', 'dry', 'drained',
+              'free', 'low', 'high', 'quick', 'easy', 'simple',
+              'basic', 'gourmet', 'budget', 'vegan', 'vegetarian',
+              'meatfree', 'meatless', 'healthy', 'gluten', 'glutenfree',
+              'dairy', 'dairyfree', 'nondairy', 'carb', 'lowcarb',
+              'fat', 'fatfree', 'lowfat', 'fiber', 'highfiber',
+              'protein', 'highprotein', 'sugarfree', 'lowsugar',
+              'diabetic', 'diabetes', 'calorie', 'lowcalorie',
+              'lowcal', 'cholesterol', 'lowcholesterol', 'alcoholic',
+              'alcoholfree', 'nonalcoholic', 'eggfree', 'eggless',
+              'fishfree', 'fishless', 'shellfishfree', 'nutfree',
+              'nutless', 'wheatfree', 'soyfree', 'paleo', 'keto',
+              'pescatarian', 'crockpot', 'slow', 'cooker', 'slowcooker',
+              'pressure', 'pressurecooker', 'instant', 'pot', 'instantpot',
+              'heart', 'hearthealthy', 'breakfast', 'dessert', 'kid',
+              'friendly', 'kidfriendly', 'toddler', 'lactosefree',
+              'milkfree', 'milkless', 'kosher', 'classic', 'homemade',
+              'diy', 'hearty', 'skinny', 'overnight', 'strip', 'brown']
 
-    if use_title:
-        ingredient_length = len(ingredient_list) + 1
-    else:
-        ingredient_length = len(ingredient_list)
 
-    ings_in_next_step = []
-    for ing_idx in range(0, ingredient_length):
-        # only keep words that appear in both strings
-        match_idx = []
-        for i in range(count_matrix.shape[1]):
-            # match if feature is in both step text and current ingredient text
-            if count_matrix[step_idx][i] > 0 and count_matrix[first_ingredient_idx + ing_idx][i] > 0:
-                if i not in match_idx:
-                    match_idx.append(i)
-        matches = [features[i] for i in match_idx]
-
-        # remove stopwords
-        matches = [match for match in matches if match not in stops]
-
-        # remove multi-stopword matches like "of a"
-        for i, match in enumerate(matches):
-            tok = word_tokenize(match)
-            tok = [w for w in tok if w not in stops]
-            matches[i] = ' '.join(tok)
-        matches = [match for match in matches if match.strip()]
-
-        # remove words that can be part of an ingredient but not alone
-        part_words = ['baking', 'beaten', 'white', 'red', 'green', 'fresh', 'large',
-                      'ground', 'pan', 'diced', 'light', 'medium', 'heavy', 'mix',
-                      'shredded', 'melted', 'frozen', 'light', 'liquid', 'small',
-                      'chopped', 'grated', 'beat', 'beaten', 'dry', 'drained',
-                      'free', 'low', 'high', 'quick', 'easy', 'simple',
-                      'basic', 'gourmet', 'budget', 'vegan', 'vegetarian',
-                      'meatfree', 'meatless', 'healthy', 'gluten', 'glutenfree',
-                      'dairy', 'dairyfree', 'nondairy', 'carb', 'lowcarb',
-                      'fat', 'fatfree', 'lowfat', 'fiber', 'highfiber',
-                      'protein', 'highprotein', 'sugarfree', 'lowsugar',
-                      'diabetic', 'diabetes', 'calorie', 'lowcalorie',
-                      'lowcal', 'cholesterol', 'lowcholesterol', 'alcoholic',
-                      'alcoholfree', 'nonalcoholic', 'eggfree', 'eggless',
-                      'fishfree', 'fishless', 'shellfishfree', 'nutfree',
-                      'nutless', 'wheatfree', 'soyfree', 'paleo', 'keto',
-                      'pescatarian', 'crockpot', 'slow', 'cooker', 'slowcooker',
-                      'pressure', 'pressurecooker', 'instant', 'pot', 'instantpot',
-                      'heart', 'hearthealthy', 'breakfast', 'dessert', 'kid',
-                      'friendly', 'kidfriendly', 'toddler', 'lactosefree',
-                      'milkfree', 'milkless', 'kosher', 'classic', 'homemade',
-                      'diy', 'hearty', 'skinny', 'overnight', 'strip', 'brown']
-        matches = [match for match in matches if match not in part_words]
-
-        # clean up lemmatizer fails
-        matches = [match.replace('cooky', 'cookie') for match in matches]
-        matches = [match.replace('buttery', 'butter') for match in matches]
-
-        if matches:
-            match = max(matches, key=len)
-            # print('match:', match)  # debug matches
-            ings_in_next_step.append(match)
+def clean_match(feature):
+    """Clean a single vectorizer feature the way a match between a step
+    and an ingredient is cleaned. Returns '' if the feature can't be a match."""
+    stops = get_stopwords()
+
+    # remove stopwords
+    if feature in stops:
+        return ''
 
+    # remove multi-stopword matches like "of a"
+    match = ' '.join([w for w in word_tokenize(feature) if w not in stops])
+    if not match.strip():
+        return ''
+
+    # remove words that can be part of an ingredient but not alone
+    if match in PART_WORDS:
+        return ''
+
+    # clean up lemmatizer fails
+    match = match.replace('cooky', 'cookie')
+    match = match.replace('buttery', 'butter')
+    return match
+
+
+def score_features(features):
+    """Precompute the cleaned match text for each feature in a vocabulary
+    and a score that ranks features by match length. Ties go to the feature
+    that comes first in the vocabulary, and unusable features score 0."""
+    cleaned = [clean_match(feature) for feature in features]
+    num_features = len(features)
+    scores = np.zeros(num_features, dtype=np.int64)
+    for i, match in enumerate(cleaned):
+        if match:
+            scores[i] = len(match) * (num_features + 1) + (num_features - i)
+    return cleaned, scores
+
+
+def remove_duplicate_matches(ings_in_next_step):
+    """Remove exact and partial duplicates from a list of matches."""
     # remove duplicate ingredients
     ings_in_next_step = list(OrderedDict.fromkeys(ings_in_next_step))
 
@@ -120,9 +195,38 @@ def get_matches_for_step(count_matrix, step_idx, first_ingredient_idx,
                 no_dupe = False
         if no_dupe:
             tmp_ings.append(ing)
-    ings_in_next_step = tmp_ings
+    return tmp_ings
 
-    return ings_in_next_step
+
+def get_matches_for_step(count_matrix, step_idx, first_ingredient_idx,
+                         ingredient_list, features, use_title=False,
+                         feature_scores=None):
+    """
+    Given a vectorized list of steps and ingredients,
+    compare a given step to each ingredient in the ingredient list
+    and get the longest ngram matches between each pairing.
+    """
+    if feature_scores is None:
+        feature_scores = score_features(features)
+    cleaned, scores = feature_scores
+    count_matrix = sparse.csr_matrix(count_matrix)
+
+    if use_title:
+        ingredient_length = len(ingredient_list) + 1
+    else:
+        ingredient_length = len(ingredient_list)
+
+    # only keep features that appear in both strings, weighted so that
+    # the best match for each ingredient is the row maximum
+    step_weights = scores * (count_matrix[step_idx].toarray().ravel() > 0)
+    ing_rows = count_matrix[first_ingredient_idx:first_ingredient_idx + ingredient_length]
+    best = (ing_rows > 0).astype(np.int64).dot(sparse.diags(step_weights, dtype=np.int64))
+    best = best.max(axis=1).toarray().ravel()
+
+    num_features = len(features)
+    ings_in_next_step = [cleaned[num_features - score % (num_features + 1)]
+                         for score in best if score > 0]
+    return remove_duplicate_matches(ings_in_next_step)
 
 
 def get_matches(instructions, ingredients, title=None):
@@ -137,20 +241,80 @@ def get_matches(instructions, ingredients, title=None):
     all_text = [x.replace('™', ' ') for x in all_text]
 
     cv = CountVectorizer(ngram_range=(1, 5), tokenizer=LemmaTokenizer())
-    count_matrix = cv.fit_transform(all_text).toarray()
+    count_matrix = cv.fit_transform(all_text).tocsr()
     features = cv.get_feature_names()
+    feature_scores = score_features(features)
+
+    # count usable features shared by each step and ingredient
+    # so steps without any overlap can be skipped
+    present = (count_matrix > 0).astype(np.int64)
+    usable = sparse.diags((feature_scores[1] > 0).astype(np.int64), dtype=np.int64)
+    overlaps = present[:len(instructions)].dot(usable).dot(
+        present[len(instructions):].T)
+    has_overlap = np.asarray(overlaps.sum(axis=1)).ravel() > 0
 
     # iterate through each instruction except the last
     # to find ingredients in next step
     all_ingredient_matches = []
     for i, _ in enumerate(instructions):
+        if not has_overlap[i]:
+            all_ingredient_matches.append([])
+            continue
         next_ings = get_matches_for_step(
             count_matrix=count_matrix,
             step_idx=i,
             first_ingredient_idx=len(instructions),
             ingredient_list=ingredients,
             features=features,
-            use_title=bool(title))
+            use_title=bool(title),
+            feature_scores=feature_scores)
         all_ingredient_matches.append(next_ings)
 
     return all_ingredient_matches
+
+
+def _init_match_worker(lemma_cache_path=None):
+    """Build the tokenizer state once per worker process."""
+    get_stopwords()
+    get_stopwords(punctuation=True)
+    if lemma_cache_path:
+        load_lemma_cache(lemma_cache_path)
+    LEMMA_CACHE.track_new = True
+
+
+def _get_recipe_matches(recipe):
+    return get_matches(instructions=recipe['recipeInstructions'],
+                       ingredients=recipe['recipeIngredient'],
+                       title=recipe['name'])
+
+
+def _get_recipe_matches_and_lemmas(recipe):
+    """Matches for a recipe and the lemmas the worker learned for it."""
+    return _get_recipe_matches(recipe), LEMMA_CACHE.pop_new()
+
+
+def get_matches_many(recipes, workers=1, chunksize=16, lemma_cache_path=None):
+    """Given an iterable of recipe dicts (with name, recipeIngredient, and
+    recipeInstructions), yield get_matches for each recipe in input order.
+
+    With more than one worker, recipes are matched in a process pool.
+    Recipes are handed to the pool a window at a time so the input can be
+    a stream. Each worker loads the lemma table from lemma_cache_path, and
+    lemmas the workers look up are sent back with each recipe's matches
+    and added to this process's cache, so save_lemma_cache keeps them."""
+    if workers <= 1:
+        for recipe in recipes:
+            yield _get_recipe_matches(recipe)
+        return
+
+    recipes = iter(recipes)
+    window_size = workers * chunksize * 4
+    with Pool(workers, initializer=_init_match_worker,
+              initargs=(lemma_cache_path,)) as pool:
+        while True:
+            window = list(islice(recipes, window_size))
+            if not window:
+                break
+            for matches, lemmas in pool.imap(_get_recipe_matches_and_lemmas, window, chunksize):
+                LEMMA_CACHE.add(lemmas)
+                yield matches
@@ -0,0 +1,171 @@
+"""
+Indexed store of the clean recipe data used by make_style_transfer_data.py.
+
+Recipes from each site's <site>_clean_recipe.jl are kept in a SQLite file,
+one row per recipe_id, holding the fields make_style_transfer_data.py needs
+as JSON. Only the recipes that are looked up get read, instead of loading
+every site into memory. Sites are added one at a time and a site is read
+again when its .jl file changes.
+
+The .jl files are parsed by a pool of worker processes, each reading a
+byte range of a file, and the parent writes the results into the store.
+To build the store ahead of time:
+    python recipe_store.py --sites allrecipes commoncrawl
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import argparse
+from itertools import chain, groupby
+from multiprocessing import Pool
+
+
+DATA_PATH = '/sample_data/'
+STORE_PATH = '/sample_data/clean_recipe_data.sqlite'
+REQUIRED_FIELDS = ['id', 'name', 'recipeIngredient', 'recipeInstructions', 'tags']
+
+
+def site_of(recipe_id):
+    return recipe_id.split('_')[0]
+
+
+def site_recipe_path(site, data_path=DATA_PATH):
+    site_clean = site.replace('commoncrawl', 'commoncrawl_recipes_dataset')
+    return os.path.join(data_path, site_clean + '_clean_recipe.jl')
+
+
+def source_stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def clean_recipe(line):
+    """The fields that are kept for a parsed .jl line, or None if any are missing."""
+    if any([k not in line for k in REQUIRED_FIELDS]):
+        return None
+    return {'name': line['name'],
+            'recipeIngredient': line['recipeIngredient'],
+            'recipeInstructions': line['recipeInstructions'],
+            'tags': line['tags']}
+
+
+def shard_ranges(path, shard_size):
+    """Split a file into (start, end) byte ranges of about shard_size."""
+    size = os.path.getsize(path)
+    return [(start, min(start + shard_size, size)) for start in range(0, size, shard_size)] or [(0, 0)]
+
+
+def read_shard(task):
+    """Return [(recipe_id, recipe as JSON)] for the lines that start in a byte
+    range of a .jl file, skipping recipes without all required fields."""
+    recipe_data_path, start, end = task
+    recipes = []
+    with open(recipe_data_path, 'rb') as f:
+        if start > 0:
+            # the line running into the range belongs to the previous shard
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            line = json.loads(line)
+            recipe = clean_recipe(line)
+            if recipe is not None:
+                recipes.append((line['id'], json.dumps(recipe)))
+    return recipes
+
+
+class RecipeStore(object):
+    """Map recipe_id -> clean recipe, filled in per site."""
+    def __init__(self, path):
+        self.connection = sqlite3.connect(str(path), timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS recipes ('
+                                'recipe_id TEXT PRIMARY KEY, site TEXT, recipe TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS sites ('
+                                'site TEXT PRIMARY KEY, size INTEGER, mtime REAL, num_recipes INTEGER)')
+        self.connection.commit()
+
+    def sites(self):
+        """{site: (size, mtime)} of the .jl files the store was built from."""
+        rows = self.connection.execute('SELECT site, size, mtime FROM sites')
+        return {site: (size, mtime) for site, size, mtime in rows}
+
+    def add_site(self, site, recipes, stat):
+        """Replace a site's recipes with (recipe_id, recipe as JSON) pairs read
+        from a .jl file with stat (size, mtime)."""
+        with self.connection:
+            self.connection.execute('DELETE FROM recipes WHERE site = ?', (site,))
+            self.connection.executemany('INSERT OR REPLACE INTO recipes VALUES (?, ?, ?)',
+                                        ((recipe_id, site, recipe) for recipe_id, recipe in recipes))
+            num_recipes = self.connection.execute('SELECT COUNT(*) FROM recipes WHERE site = ?',
+                                                  (site,)).fetchone()[0]
+            self.connection.execute('INSERT OR REPLACE INTO sites VALUES (?, ?, ?, ?)',
+                                    (site, stat[0], stat[1], num_recipes))
+        return num_recipes
+
+    def get_many(self, recipe_ids, chunk_size=500):
+        """Return {recipe_id: recipe} for the recipe_ids that are in the store."""
+        keys = list(set(recipe_ids))
+        found = {}
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            rows = self.connection.execute(
+                'SELECT recipe_id, recipe FROM recipes WHERE recipe_id IN ({})'
+                .format(','.join('?' * len(chunk))), chunk)
+            for recipe_id, recipe in rows:
+                found[recipe_id] = json.loads(recipe)
+        return found
+
+    def signature(self):
+        """Hash of the .jl files the store was built from."""
+        rows = self.connection.execute('SELECT site, size, mtime FROM sites ORDER BY site').fetchall()
+        return hashlib.sha1(json.dumps(rows).encode('utf8')).hexdigest()
+
+    def close(self):
+        self.connection.close()
+
+
+def update_sites(store, sites, data_path=DATA_PATH, num_workers=None, shard_size=64 * 1024 * 1024):
+    """Read the sites that aren't in the store yet, or whose .jl file changed.
+    A site that's in the store but whose .jl file is gone is used as is."""
+    built = store.sites()
+    stats = {}
+    for site in sorted(sites):
+        recipe_data_path = site_recipe_path(site, data_path)
+        if site in built and (not os.path.isfile(recipe_data_path)
+                              or tuple(built[site]) == source_stat(recipe_data_path)):
+            continue
+        stats[site] = source_stat(recipe_data_path)
+    if not stats:
+        return
+
+    tasks = [(site, (site_recipe_path(site, data_path), start, end))
+             for site in stats
+             for start, end in shard_ranges(site_recipe_path(site, data_path), shard_size)]
+    print('Caching clean recipe data for', ', '.join(stats), 'in', len(tasks), 'shards')
+    with Pool(num_workers) as pool:
+        # shards come back in order, so each site is written once all of its shards are read
+        shards = zip([site for site, _ in tasks], pool.imap(read_shard, [task for _, task in tasks]))
+        for site, site_shards in groupby(shards, key=lambda x: x[0]):
+            recipes = chain.from_iterable(recipes for _, recipes in site_shards)
+            num_recipes = store.add_site(site, recipes, stats[site])
+            print('Cached', num_recipes, 'recipes for', site)
+
+
+def load_recipe_store(path, sites, data_path=DATA_PATH, num_workers=None):
+    """Open the store at path, first adding any of sites that are missing or out of date."""
+    store = RecipeStore(path)
+    update_sites(store, sites, data_path, num_workers=num_workers)
+    return store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sites", nargs='+', required=True, help="Sites to add, e.g. allrecipes commoncrawl")
+    parser.add_argument("--store_path", default=STORE_PATH, type=str)
+    parser.add_argument("--data_path", default=DATA_PATH, type=str)
+    parser.add_argument("--num_workers", default=None, type=int, help="Defaults to the number of cores")
+    args = parser.parse_args()
+    load_recipe_store(args.store_path, args.sites, args.data_path, args.num_workers).close()
@@ -0,0 +1,114 @@
+"""
+Check match_utils.get_matches against the original per-feature loop.
+
+get_matches_for_step packs each feature's match length and vocabulary
+position into one score, so the longest match wins and ties go to the
+feature that comes first. The reference below is the loop it replaced.
+
+    python -m unittest discover tests
+"""
+import unittest
+from collections import OrderedDict
+import numpy as np
+from nltk import word_tokenize
+from sklearn.feature_extraction.text import CountVectorizer
+
+from match_utils import (PART_WORDS, LemmaTokenizer, get_stopwords,
+                         get_matches, get_matches_for_step)
+
+
+def reference_matches_for_step(count_matrix, step_idx, first_ingredient_idx,
+                               ingredient_list, features, use_title=False):
+    """The original get_matches_for_step, on a dense count matrix."""
+    stops = get_stopwords()
+    ingredient_length = len(ingredient_list) + 1 if use_title else len(ingredient_list)
+
+    ings_in_next_step = []
+    for ing_idx in range(0, ingredient_length):
+        match_idx = [i for i in range(count_matrix.shape[1])
+                     if count_matrix[step_idx][i] > 0 and count_matrix[first_ingredient_idx + ing_idx][i] > 0]
+        matches = [features[i] for i in match_idx]
+        matches = [match for match in matches if match not in stops]
+        matches = [' '.join([w for w in word_tokenize(match) if w not in stops]) for match in matches]
+        matches = [match for match in matches if match.strip()]
+        matches = [match for match in matches if match not in PART_WORDS]
+        matches = [match.replace('cooky', 'cookie') for match in matches]
+        matches = [match.replace('buttery', 'butter') for match in matches]
+        if matches:
+            ings_in_next_step.append(max(matches, key=len))
+
+    ings_in_next_step = list(OrderedDict.fromkeys(ings_in_next_step))
+    return [ing for ing in ings_in_next_step
+            if not any(ing + ' ' in cross_ings or ' ' + ing in cross_ings
+                       for cross_ings in ings_in_next_step)]
+
+
+def reference_matches(instructions, ingredients, title=None):
+    all_text = instructions + ingredients
+    if title:
+        all_text.append(title)
+    all_text = [x.replace('™', ' ') for x in all_text]
+    cv = CountVectorizer(ngram_range=(1, 5), tokenizer=LemmaTokenizer())
+    count_matrix = cv.fit_transform(all_text).toarray()
+    features = cv.get_feature_names()
+    return [reference_matches_for_step(count_matrix, i, len(instructions), ingredients,
+                                       features, use_title=bool(title))
+            for i, _ in enumerate(instructions)]
+
+
+RECIPES = [
+    {'name': 'Garlic Butter Shrimp Pasta',
+     'recipeIngredient': ['1 lb shrimp', '8 oz spaghetti', '4 tbsp butter',
+                          '3 cloves garlic, minced', '1/4 cup fresh parsley'],
+     'recipeInstructions': ['Cook the spaghetti in salted water.',
+                            'Melt the butter and add the minced garlic.',
+                            'Add the shrimp and cook until pink.',
+                            'Toss with spaghetti and fresh parsley.']},
+    # "olive oil" and "lime zest" are tied matches for the same ingredient
+    {'name': 'Grilled Corn',
+     'recipeIngredient': ['4 ears corn', '2 tbsp olive oil or lime zest', '1 tsp sea salt',
+                          'chili powder'],
+     'recipeInstructions': ['Brush the corn with lime zest and olive oil.',
+                            'Grill the corn and dust with chili powder.',
+                            'Serve warm.']},
+    {'name': 'Chocolate Chip Cookies',
+     'recipeIngredient': ['2 cups flour', '1 cup brown sugar', '1 cup butter',
+                          '2 eggs', '2 cups chocolate chips'],
+     'recipeInstructions': ['Cream the butter and brown sugar.',
+                            'Beat in the eggs, then stir in the flour.',
+                            'Fold in chocolate chips and bake the cookies.']},
+]
+
+
+class MatchTest(unittest.TestCase):
+    def test_matches_reference(self):
+        for recipe in RECIPES:
+            for title in [None, recipe['name']]:
+                self.assertEqual(
+                    get_matches(list(recipe['recipeInstructions']), list(recipe['recipeIngredient']), title),
+                    reference_matches(list(recipe['recipeInstructions']), list(recipe['recipeIngredient']), title))
+
+    def test_tied_lengths_go_to_first_feature(self):
+        # one step and one ingredient sharing three features of the same length
+        features = ['sea salt', 'pork rib', 'red wine', 'salt', 'wine']
+        for order in [[0, 1, 2, 3, 4], [2, 1, 0, 4, 3], [1, 3, 0, 4, 2]]:
+            ordered = [features[i] for i in order]
+            count_matrix = np.ones((2, len(ordered)), dtype=np.int64)
+            self.assertEqual(get_matches_for_step(count_matrix, 0, 1, ['x'], ordered),
+                             reference_matches_for_step(count_matrix, 0, 1, ['x'], ordered))
+            self.assertEqual(get_matches_for_step(count_matrix, 0, 1, ['x'], ordered), [ordered[0]])
+
+    def test_unusable_features(self):
+        # stopwords, part words and shared features only one side has
+        features = ['the', 'of a', 'fresh', 'basil', 'sweet basil', 'pesto']
+        count_matrix = np.array([[1, 1, 1, 1, 0, 1],
+                                 [1, 1, 1, 1, 1, 0],
+                                 [1, 1, 1, 0, 0, 0]])
+        for use_title in [False, True]:
+            self.assertEqual(
+                get_matches_for_step(count_matrix, 0, 1, ['x'], features, use_title=use_title),
+                reference_matches_for_step(count_matrix, 0, 1, ['x'], features, use_title=use_title))
+
+
+if __name__ == '__main__':
+    unittest.main()